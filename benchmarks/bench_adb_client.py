@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Cost of many small adb commands: one process each vs. the in-process client
+
+Issues the same number of `stat` requests through the adb binary (here
+fake_adb.py, so one interpreter start per command) and through AdbClient
+over pooled sync connections to fake_adb_server.py.
+
+    python benchmarks/bench_adb_client.py --requests 500
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pixel_backup.adb_client import AdbClient
+
+from fake_adb_server import start_server
+
+FAKE_ADB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_adb.py")
+
+
+def time_stats(client, paths):
+    start = time.perf_counter()
+    for path in paths:
+        client.stat(path)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as device:
+        os.environ["FAKE_ADB_ROOT"] = device
+        os.makedirs(os.path.join(device, "DCIM"))
+        paths = []
+        for i in range(args.requests):
+            with open(os.path.join(device, "DCIM", f"IMG_{i:05d}.jpg"), "wb") as f:
+                f.write(b"x" * i)
+            paths.append(f"/sdcard/DCIM/IMG_{i:05d}.jpg")
+
+        server, port = start_server(device)
+        binary = time_stats(AdbClient(FAKE_ADB, use_server=False), paths)
+        client = AdbClient(FAKE_ADB, port=port)
+        in_process = time_stats(client, paths)
+        client.close()
+        server.shutdown()
+
+    print(f"{args.requests} stat requests")
+    print(f"  adb process per request: {binary:7.2f} s  ({binary / args.requests * 1000:.1f} ms each)")
+    print(f"  pooled server socket:    {in_process:7.2f} s  ({in_process / args.requests * 1000:.2f} ms each)")
+    print(f"  speedup:                 {binary / in_process:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""App backups: APKs pulled one package at a time vs. in parallel, and a second run
+
+Serves a fake device with --apps installed apps (fake_adb_server.py, apps
+below /sdcard/.apps; base APKs plus splits for some) behind a link of
+--bandwidth MB/s, of which one transfer gets --stream-bandwidth, and backs up
+their APKs with AppBackup:
+
+* sequential: one package after the other (workers=1)
+* parallel: --workers packages at once
+* second run: nothing changed since the parallel run, every APK is reused
+  from the store
+* one update: a single app got a new versionCode
+
+Each `pm` call takes --pm-latency seconds, like starting the package manager
+on a phone.
+
+    python benchmarks/bench_apps.py --apps 60 --bandwidth 40 --stream-bandwidth 10
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pixel_backup.adb_client import AdbClient
+from pixel_backup.apps import PULLED, STORED, AppBackup
+from pixel_backup.engine import format_size
+
+from fake_adb_server import start_server
+
+FAKE_ADB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_adb.py")
+
+
+def install_app(device, name, version, rng):
+    """A base APK of 1-12 MB; every third app also has ABI and density splits"""
+    folder = os.path.join(device, ".apps", name)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+    with open(os.path.join(folder, "version"), "w") as f:
+        f.write(str(version))
+    sizes = {"base.apk": rng.randint(1, 12) * 1024 * 1024}
+    if rng.random() < 1 / 3:
+        sizes["split_config.arm64_v8a.apk"] = rng.randint(1, 6) * 1024 * 1024
+        sizes["split_config.xxhdpi.apk"] = rng.randint(100, 2000) * 1024
+    for apk, size in sizes.items():
+        with open(os.path.join(folder, apk), "wb") as f:
+            f.write(os.urandom(size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--apps", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--bandwidth", type=float, default=40, help="link speed in MB/s shared by all transfers")
+    parser.add_argument("--stream-bandwidth", type=float, default=10, help="MB/s one transfer gets on its own")
+    parser.add_argument("--pm-latency", type=float, default=0.15, help="seconds per `pm` call")
+    args = parser.parse_args()
+
+    os.environ["FAKE_ADB_PM_LATENCY"] = str(args.pm_latency)
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as work:
+        device = os.path.join(work, "sdcard")
+        for i in range(args.apps):
+            install_app(device, f"com.example.app{i:03d}", 100, rng)
+        server, port = start_server(device, bandwidth=args.bandwidth, stream_bandwidth=args.stream_bandwidth)
+        client = AdbClient(FAKE_ADB, port=port)
+        store = os.path.join(work, "apks")
+
+        print(f"{args.apps} apps, link {args.bandwidth:g} MB/s ({args.stream_bandwidth:g} MB/s per transfer), "
+              f"{args.pm_latency:g}s per pm call")
+        print(f"  {'run':<22}{'time':>9}{'pulled':>12}{'reused':>9}")
+        runs = (("sequential", 1, False), ("parallel", args.workers, False),
+                ("second run", args.workers, True), ("one update", args.workers, True))
+        for index, (label, workers, keep_store) in enumerate(runs):
+            if not keep_store:
+                shutil.rmtree(store, ignore_errors=True)
+            if label == "one update":
+                install_app(device, "com.example.app000", 101, rng)
+            start = time.perf_counter()
+            results = AppBackup(client, store_root=store, workers=workers).run(os.path.join(work, f"backup{index}"))
+            elapsed = time.perf_counter() - start
+            pulled = sum(result.pulled_bytes for result in results if result.status == PULLED)
+            reused = sum(1 for result in results if result.status == STORED)
+            print(f"  {label:<22}{elapsed:>8.2f}s{format_size(pulled):>12}{reused:>9}")
+
+        client.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""ZIP vs. indexed backup archives: listing, single-file extraction, appending
+
+Builds a camera-roll-like folder (many photos, a few videos, some documents),
+packs it into a ZIP archive and an indexed archive (.pba), then times what the
+history tab and the CLI do with a finished backup:
+
+* listing: BackupReader(path).members(), the file list of the contents window
+* extraction: open the backup and copy one file out, for random members
+* appending: add a folder of new files; a ZIP backup is rebuilt the way the
+  app would have to (and, for reference, zipfile's append mode, which
+  rewrites the central directory), an indexed archive takes a new segment
+
+Files are read from the page cache; on a cold disk listing a ZIP archive also
+seeks to its central directory and the gap grows.
+
+    python benchmarks/bench_archive.py --files 20000 --mb 512
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pixel_backup.archive import pack_folder
+from pixel_backup.compression import compress_folder
+from pixel_backup.engine import format_size, get_folder_size
+from pixel_backup.restore import BackupReader
+
+
+def build_folder(root, files, total_mb, seed=1):
+    """Photos share most of the bytes; every 500th file is a video, every 20th a document"""
+    rng = random.Random(seed)
+    folders = {"photo": "DCIM/Camera", "video": "DCIM/Camera", "document": "Documents"}
+    for folder in set(folders.values()):
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+    photo_size = total_mb * 1024 * 1024 // files
+    for i in range(files):
+        if i % 500 == 499:
+            name, size = f"VID_{i:06d}.mp4", photo_size * 20
+        elif i % 20 == 19:
+            name, size = f"notes_{i:06d}.txt", photo_size // 4
+        else:
+            name, size = f"PXL_{i:06d}.jpg", rng.randint(photo_size // 2, photo_size * 3 // 2)
+        kind = "video" if name.endswith(".mp4") else "document" if name.endswith(".txt") else "photo"
+        data = (b"lorem ipsum dolor sit amet " * (size // 27 + 1))[:size] if kind == "document" else os.urandom(size)
+        with open(os.path.join(root, folders[kind], name), "wb") as f:
+            f.write(data)
+
+
+def best_of(runs, func):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def extract_one(path, member, dest):
+    reader = BackupReader(path)
+    with reader.open(member) as source, open(dest, "wb") as f:
+        shutil.copyfileobj(source, f, 1024 * 1024)
+
+
+def zip_append(zip_path, folder):
+    with zipfile.ZipFile(zip_path, "a", zipfile.ZIP_DEFLATED) as archive:
+        for name in os.listdir(folder):
+            archive.write(os.path.join(folder, name), f"Added/{name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=20000, help="files in the backup")
+    parser.add_argument("--mb", type=int, default=512, help="size of the backup")
+    parser.add_argument("--extractions", type=int, default=50, help="random members to extract")
+    parser.add_argument("--new-files", type=int, default=50, help="files added by the append")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = os.path.join(tmp, "backup")
+        build_folder(folder, args.files, args.mb)
+        new_folder = os.path.join(tmp, "new")
+        os.makedirs(new_folder)
+        for i in range(args.new_files):
+            with open(os.path.join(new_folder, f"PXL_new_{i:04d}.jpg"), "wb") as f:
+                f.write(os.urandom(args.mb * 1024 * 1024 // args.files))
+
+        archives = {"zip": os.path.join(tmp, "backup.zip"), "indexed": os.path.join(tmp, "backup.pba")}
+        start = time.perf_counter()
+        compress_folder(folder, archives["zip"], "fast")
+        zip_time = time.perf_counter() - start
+        start = time.perf_counter()
+        pack_folder(folder, archives["indexed"], "fast")
+        indexed_time = time.perf_counter() - start
+        print(f"{args.files} files, {format_size(get_folder_size(folder))}; "
+              f"packed in {zip_time:.2f}s (zip) and {indexed_time:.2f}s (indexed)")
+
+        members = sorted(BackupReader(archives["zip"]).members())
+        picks = random.Random(2).sample(members, min(args.extractions, len(members)))
+        print(f"  {'':<10}{'list':>12}{'extract one':>14}{'append':>12}{'size':>12}")
+        for label, path in archives.items():
+            listing = best_of(5, lambda: BackupReader(path).members())
+            start = time.perf_counter()
+            for member in picks:
+                extract_one(path, member, os.path.join(tmp, "extracted"))
+            extraction = (time.perf_counter() - start) / len(picks)
+            if label == "zip":
+                # The app's ZIP writer cannot add to an archive; the backup is packed again
+                start = time.perf_counter()
+                shutil.copytree(new_folder, os.path.join(folder, "DCIM", "Camera"), dirs_exist_ok=True)
+                compress_folder(folder, path, "fast")
+                append = time.perf_counter() - start
+            else:
+                start = time.perf_counter()
+                pack_folder(new_folder, path, "fast", append=True)
+                append = time.perf_counter() - start
+            print(f"  {label:<10}{listing * 1000:>10.1f}ms{extraction * 1000:>12.2f}ms{append:>11.2f}s"
+                  f"{format_size(get_folder_size(path)):>12}")
+
+        # zipfile can append too, but it writes the whole central directory again each time
+        copy = os.path.join(tmp, "append.zip")
+        shutil.copy(archives["zip"], copy)
+        start = time.perf_counter()
+        zip_append(copy, new_folder)
+        print(f"  zipfile append mode: {time.perf_counter() - start:.2f}s "
+              f"(the app's parallel writer only creates archives)")
+
+
+if __name__ == "__main__":
+    main()
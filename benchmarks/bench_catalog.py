@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Backup catalog with thousands of backups
+
+Fills a catalog with daily incremental backups of a growing camera roll (each
+backup holds the day's new photos plus a few re-taken ones) and times the
+lookups the history tab and `pixel_backup find` make.
+
+    python benchmarks/bench_catalog.py --backups 3000 --files-per-backup 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pixel_backup.catalog import BackupCatalog
+from pixel_backup.engine import format_size
+
+
+def timed(label, func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label:<40}{best * 1000:9.2f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backups", type=int, default=3000)
+    parser.add_argument("--files-per-backup", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as work:
+        catalog = BackupCatalog(os.path.join(work, "catalog.db"))
+        start = time.perf_counter()
+        photo = 0
+        for day in range(args.backups):
+            files = []
+            for _ in range(args.files_per_backup):
+                # Mostly new photos, sometimes one already backed up before
+                number = rng.randrange(max(photo, 1)) if photo and rng.random() < 0.1 else photo
+                if number == photo:
+                    photo += 1
+                name = f"PXL_{number:08d}.jpg"
+                files.append({"path": f"/sdcard/DCIM/Camera/{name}", "size": 2000000 + number % 5000000,
+                              "mtime": 1600000000 + number * 60, "hash": None, "member": f"Photos/Camera/{name}"})
+            catalog.add_backup({"date": f"day {day}", "type": "Photos", "size": "",
+                                "location": os.path.join(work, f"backup_{day}")}, files)
+        total_files = args.backups * args.files_per_backup
+        print(f"{args.backups} backups, {total_files} files catalogued in {time.perf_counter() - start:.1f} s "
+              f"({format_size(os.path.getsize(catalog.path))} database)")
+
+        sample = f"PXL_{photo // 2:08d}.jpg"
+        matches = timed(f"which backups contain {sample}", lambda: catalog.find(sample))
+        timed("name pattern PXL_0000012*", lambda: catalog.find("PXL_0000012*"))
+        unique = timed("unique bytes across all backups", catalog.unique_bytes)
+        total = timed("total bytes across all backups", catalog.total_bytes)
+        timed("first history page of 200", lambda: catalog.backups(limit=200))
+        timed("history page after the last one", lambda: catalog.backups(after_id=args.backups))
+        print(f"{sample} is in {len(matches)} backups; {format_size(unique)} unique of {format_size(total)}")
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Compression throughput per level
+
+Builds a backup-like folder (camera JPEGs and videos that are already
+compressed, plus text-like documents and app data that are not) and
+compresses it with the old single-threaded zip loop and with
+ParallelZipWriter at each level.
+
+    python benchmarks/bench_compression.py --mb 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pixel_backup.compression import COMPRESSION_LEVELS, compress_folder
+
+
+def build_folder(root, total_mb, seed=1):
+    rng = random.Random(seed)
+    words = [bytes(rng.choice(b"abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 9))) for _ in range(2000)]
+    media_bytes = total_mb * 1024 * 1024 * 7 // 10
+    text_bytes = total_mb * 1024 * 1024 - media_bytes
+    os.makedirs(os.path.join(root, "Media", "Photos"))
+    os.makedirs(os.path.join(root, "Documents"))
+
+    written = 0
+    i = 0
+    while written < media_bytes:
+        size = rng.randint(2, 6) * 1024 * 1024
+        with open(os.path.join(root, "Media", "Photos", f"PXL_{i:05d}.jpg"), "wb") as f:
+            f.write(os.urandom(size))
+        written += size
+        i += 1
+
+    written = 0
+    i = 0
+    while written < text_bytes:
+        data = b" ".join(rng.choice(words) for _ in range(rng.randint(20000, 200000)))
+        with open(os.path.join(root, "Documents", f"notes_{i:05d}.txt"), "wb") as f:
+            f.write(data)
+        written += len(data)
+        i += 1
+
+
+def legacy_zip(folder, zip_path, level):
+    """The loop perform_full_backup used: one thread, no level, deflate everything"""
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED if level != "fast" else zipfile.ZIP_STORED) as zipf:
+        for root, _, files in os.walk(folder):
+            for file in files:
+                zipf.write(os.path.join(root, file), os.path.relpath(os.path.join(root, file), folder))
+
+
+def folder_size(folder):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(folder) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=int, default=200, help="size of the generated backup folder")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = os.path.join(tmp, "backup")
+        build_folder(folder, args.mb)
+        total = folder_size(folder)
+        print(f"input: {total / 1024 / 1024:.0f} MB, {args.workers or os.cpu_count()} workers")
+        for label, func in (("legacy", legacy_zip), ("parallel", None)):
+            for level in COMPRESSION_LEVELS:
+                zip_path = os.path.join(tmp, f"{label}_{level}.zip")
+                start = time.perf_counter()
+                if func:
+                    func(folder, zip_path, level)
+                else:
+                    compress_folder(folder, zip_path, level, args.workers)
+                elapsed = time.perf_counter() - start
+                ratio = os.path.getsize(zip_path) / total
+                print(f"  {label:<9}{level:<9}{elapsed:7.2f} s  {total / elapsed / 1024 / 1024:8.1f} MB/s  ratio {ratio:.3f}")
+                os.remove(zip_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Backups to an S3-compatible bucket: staged on disk first vs streamed
+
+Serves a fake device with fake_adb_server.py and a bucket with
+fake_s3_server.py, each behind a link of --bandwidth MB/s, and uploads the
+same media two ways, each as separate objects and as one ZIP archive:
+
+* staged: pull everything to a local folder (and zip it there), then upload
+* streamed: files go from the device into their objects, or into the archive
+  upload, while they arrive
+
+Reports the time, the bytes written to local disk and the peak of Python
+memory allocations (tracemalloc) of each. The bucket runs in its own
+process so its buffers are not counted.
+
+    python benchmarks/bench_object_store.py --bandwidth 40 --size 256
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pixel_backup.adb_client import AdbClient
+from pixel_backup.compression import ParallelZipWriter, compress_folder
+from pixel_backup.engine import format_size
+from pixel_backup.manifest import plan_transfers
+from pixel_backup.object_store import ObjectStore, S3Client, UploadingPuller
+from pixel_backup.scan import DeviceScanner
+from pixel_backup.transfer import ParallelPuller
+
+from fake_adb_server import start_server
+from fake_s3_server import ACCESS_KEY, SECRET_KEY
+
+FAKE_ADB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_adb.py")
+FAKE_S3 = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_s3_server.py")
+SOURCE = "/sdcard/DCIM/Camera"
+
+
+def build_device(root, total_mb):
+    """Photos of 4 MB and a few videos of 32 MB"""
+    folder = os.path.join(root, "DCIM", "Camera")
+    os.makedirs(folder)
+    written = 0
+    i = 0
+    while written < total_mb * 1024 * 1024:
+        size = (32 if i % 8 == 7 else 4) * 1024 * 1024
+        name = f"VID_{i:04d}.mp4" if i % 8 == 7 else f"PXL_{i:04d}.jpg"
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(os.urandom(size))
+        written += size
+        i += 1
+
+
+def folder_size(folder):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(folder) for name in names)
+
+
+def staged_objects(client, store, files, dest, name):
+    ParallelPuller(client, workers=4).transfer(files)
+    staged = folder_size(dest)
+    store.upload_tree(dest, name)
+    return staged
+
+
+def streamed_objects(client, store, files, dest, name):
+    UploadingPuller(client, store, os.path.dirname(dest), workers=4).transfer(files)
+    return 0
+
+
+def staged_archive(client, store, files, dest, name):
+    ParallelPuller(client, workers=4).transfer(files)
+    compress_folder(dest, f"{dest}.zip", "fast")
+    staged = folder_size(dest) + os.path.getsize(f"{dest}.zip")
+    store.upload_file(f"{dest}.zip", f"{name}.zip")
+    return staged
+
+
+def streamed_archive(client, store, files, dest, name):
+    # Media still lands on disk to be zipped, but the archive never does
+    writer = ParallelZipWriter(f"{dest}.zip", "fast", fileobj=store.open_upload(f"{name}.zip"))
+    ParallelPuller(client, workers=4).transfer(
+        files, on_result=lambda result: writer.add(result.local, os.path.relpath(result.local, dest)))
+    staged = folder_size(dest)
+    writer.close()
+    return staged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bandwidth", type=float, default=40, help="device and bucket link speed in MB/s")
+    parser.add_argument("--size", type=int, default=256, help="MB of media")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        device = os.path.join(work, "sdcard")
+        build_device(device, args.size)
+        adb_server, port = start_server(device, bandwidth=args.bandwidth)
+        s3_server = subprocess.Popen([sys.executable, FAKE_S3, "--root", os.path.join(work, "bucket"), "--port", "0",
+                                      "--bandwidth", str(args.bandwidth)], stdout=subprocess.PIPE, text=True)
+        endpoint = s3_server.stdout.readline().split()[3].rstrip(",")
+        client = AdbClient(FAKE_ADB, port=port)
+        store = ObjectStore(S3Client(endpoint, ACCESS_KEY, SECRET_KEY), "backups")
+        entries = DeviceScanner(client).scan_all([SOURCE])
+        total = sum(entry.size for entry in entries)
+
+        print(f"{format_size(total)} of media, device and bucket links at {args.bandwidth:g} MB/s")
+        print(f"  {'pipeline':<20}{'time':>10}{'on disk':>12}{'peak memory':>14}")
+        for label, run in (("staged objects", staged_objects), ("streamed objects", streamed_objects),
+                           ("staged archive", staged_archive), ("streamed archive", streamed_archive)):
+            name = label.replace(" ", "_")
+            dest = os.path.join(work, "staging", name)
+            files, _ = plan_transfers(None, entries, SOURCE, dest)
+            tracemalloc.start()
+            start = time.perf_counter()
+            staged = run(client, store, files, dest, name)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            shutil.rmtree(os.path.join(work, "staging"), ignore_errors=True)
+            print(f"  {label:<20}{elapsed:>9.2f}s{format_size(staged):>12}{format_size(peak):>14}")
+
+        store.close()
+        client.close()
+        adb_server.shutdown()
+        s3_server.terminate()
+        s3_server.wait()
+
+
+if __name__ == "__main__":
+    main()
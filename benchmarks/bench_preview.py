@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""File preview with a very large listing
+
+Feeds a synthetic listing (a million files by default) into PreviewModel in
+scanner-sized batches, then times what the preview window does on the Tk
+thread: taking in a batch, drawing a page, sorting by each column and
+filtering. With the old preview every file was a Treeview row.
+
+    python benchmarks/bench_preview.py --files 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pixel_backup.preview import PreviewModel
+from pixel_backup.scan import RemoteFile
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28}{elapsed * 1000:9.1f} ms")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=1000000)
+    parser.add_argument("--batch", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    folders = ["/sdcard/DCIM/Camera", "/sdcard/Pictures/Screenshots", "/sdcard/Download"]
+    entries = [RemoteFile(f"{rng.choice(folders)}/PXL_{i:07d}.jpg", rng.randint(1024, 8 * 1024 * 1024),
+                          1600000000 + rng.randint(0, 10 ** 8)) for i in range(args.files)]
+
+    model = PreviewModel()
+    slowest = 0
+    start = time.perf_counter()
+    for i in range(0, len(entries), args.batch):
+        model.append(entries[i:i + args.batch])
+        batch_start = time.perf_counter()
+        model.refresh()
+        model.page(0, 40)
+        slowest = max(slowest, time.perf_counter() - batch_start)
+    print(f"{args.files} files loaded in {time.perf_counter() - start:.2f} s "
+          f"(slowest batch of {args.batch} on the Tk thread: {slowest * 1000:.1f} ms)")
+
+    timed("page of 40 rows", lambda: model.page(len(model) // 2, 40))
+    for key in ("name", "size", "date"):
+        timed(f"sort by {key}", lambda: model.set_sort(key, reverse=key != "name"))
+    timed("filter name contains '123'", lambda: model.set_filter("123"))
+    timed("filter > 4 MB since 2022", lambda: model.set_filter(min_size=4 * 1024 * 1024,
+                                                              date_from=datetime(2022, 1, 1)))
+    timed("clear filter", lambda: model.set_filter())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Messages, call log and contacts: a full export vs. an incremental one
+
+Serves a fake device (fake_adb_server.py) whose content providers hold
+--messages SMS, --calls call log entries and --contacts contacts (four data
+rows each), behind a link of --bandwidth MB/s, and exports them with
+providers.export_provider:
+
+* first run: every row is fetched and stored
+* full again: the stored databases are thrown away, which is what every
+  backup cost when it wrote the whole provider out
+* incremental: the next day, --new-messages messages and --new-calls calls
+  arrived and one contact was edited; only those rows are fetched, plus
+  the `_id` column of every table to find rows deleted on the device
+
+    python benchmarks/bench_providers.py --messages 100000 --calls 20000 --contacts 2000
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pixel_backup.adb_client import AdbClient
+from pixel_backup.engine import format_size, get_folder_size
+from pixel_backup.providers import EXPORTS, PROVIDER_DIR, export_provider
+
+from fake_adb_server import start_server
+
+FAKE_ADB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_adb.py")
+WORDS = "ok see you at the station tomorrow running late call me when you land thanks".split()
+
+
+class Device:
+    """The fake device's providers database"""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        for table in (table for tables in EXPORTS.values() for table in tables):
+            self.db.execute(f"CREATE TABLE IF NOT EXISTS {table.name} "
+                            f"({', '.join(name for name, _ in table.columns)})")
+        self.rng = random.Random(1)
+        self.now = 1700000000000
+
+    def counts(self, table):
+        return self.db.execute(f"SELECT COUNT(*), COALESCE(MAX(_id), 0) FROM {table}").fetchone()
+
+    def add_messages(self, count):
+        _, last = self.counts("sms")
+        rows = []
+        for i in range(last + 1, last + count + 1):
+            self.now += self.rng.randint(1000, 600000)
+            body = " ".join(self.rng.choice(WORDS) for _ in range(self.rng.randint(2, 30)))
+            if i % 50 == 0:
+                body += "\n\nsent from my phone"
+            rows.append((i, self.rng.randint(1, 300), self.now, self.now - 2000, self.rng.choice((1, 2)), 1, -1,
+                         f"+1555{self.rng.randint(0, 9999999):07d}", body))
+        self.db.executemany("INSERT INTO sms (_id, thread_id, date, date_sent, type, read, status, address, body) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.db.commit()
+
+    def add_calls(self, count):
+        _, last = self.counts("calls")
+        rows = []
+        for i in range(last + 1, last + count + 1):
+            self.now += self.rng.randint(1000, 600000)
+            rows.append((i, self.now, self.rng.randint(0, 3600), self.rng.randint(1, 3), 0,
+                         f"+1555{self.rng.randint(0, 9999999):07d}", None))
+        self.db.executemany("INSERT INTO calls (_id, date, duration, type, new, number, name) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.db.commit()
+
+    def add_contacts(self, count):
+        rows = []
+        for contact in range(1, count + 1):
+            kinds = (("name", f"Person {contact}"), ("phone_v2", f"+1555{contact:07d}"),
+                     ("email_v2", f"person{contact}@example.com"), ("organization", "Example Inc."))
+            for offset, (kind, value) in enumerate(kinds):
+                rows.append((contact * 4 + offset, contact, contact, self.now, f"vnd.android.cursor.item/{kind}",
+                             "1", None, value))
+        self.db.executemany("INSERT INTO data (_id, raw_contact_id, contact_id, contact_last_updated_timestamp, "
+                            "mimetype, data2, data3, data1) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.db.commit()
+
+    def edit_contact(self, contact):
+        self.now += 1000
+        self.db.execute("UPDATE data SET data1 = data1 || ' (work)', contact_last_updated_timestamp = ? "
+                        "WHERE contact_id = ?", (self.now, contact))
+        self.db.commit()
+
+
+def export_all(client, root, folder):
+    os.makedirs(folder, exist_ok=True)
+    start = time.perf_counter()
+    added = sum(export_provider(client, None, root, kind, folder)[0] for kind in EXPORTS)
+    return time.perf_counter() - start, added
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--contacts", type=int, default=2000)
+    parser.add_argument("--new-messages", type=int, default=40)
+    parser.add_argument("--new-calls", type=int, default=10)
+    parser.add_argument("--bandwidth", type=float, default=20, help="link speed in MB/s")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        sdcard = os.path.join(work, "sdcard")
+        os.makedirs(sdcard)
+        device = Device(os.path.join(sdcard, ".providers.db"))
+        device.add_messages(args.messages)
+        device.add_calls(args.calls)
+        device.add_contacts(args.contacts)
+        server, port = start_server(sdcard, bandwidth=args.bandwidth, stream_bandwidth=args.bandwidth)
+        client = AdbClient(FAKE_ADB, port=port)
+        root = os.path.join(work, "backups")
+
+        print(f"{args.messages} messages, {args.calls} calls, {args.contacts} contacts; "
+              f"link {args.bandwidth:g} MB/s")
+        print(f"  {'run':<14}{'time':>9}{'rows':>10}")
+        seconds, added = export_all(client, root, os.path.join(root, "first"))
+        print(f"  {'first run':<14}{seconds:>8.2f}s{added:>10}")
+        shutil.rmtree(os.path.join(root, PROVIDER_DIR))
+        seconds, added = export_all(client, root, os.path.join(root, "full"))
+        print(f"  {'full again':<14}{seconds:>8.2f}s{added:>10}")
+        device.add_messages(args.new_messages)
+        device.add_calls(args.new_calls)
+        device.edit_contact(1)
+        seconds, added = export_all(client, root, os.path.join(root, "incremental"))
+        print(f"  {'incremental':<14}{seconds:>8.2f}s{added:>10}")
+        print(f"  databases in each backup: {format_size(get_folder_size(os.path.join(root, 'incremental')))}")
+
+        client.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Compare the per-file `adb shell stat` loop with the batched device scan
+
+Builds a fake DCIM/Camera tree (50k files by default) served by fake_adb.py and
+times both approaches. The legacy loop forks one adb per file, so it is timed
+on a sample and extrapolated to the full tree.
+
+    python benchmarks/bench_scan.py --files 50000 --sample 300
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pixel_backup.adb_client import AdbClient
+from pixel_backup.scan import DeviceScanner
+
+FAKE_ADB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_adb.py")
+
+
+def build_tree(root, count):
+    camera = os.path.join(root, "DCIM", "Camera")
+    os.makedirs(camera, exist_ok=True)
+    for i in range(count):
+        path = os.path.join(camera, f"PXL_20240101_{i:06d}.jpg")
+        with open(path, "wb") as f:
+            f.truncate(1024 * (1 + i % 4096))
+    return camera
+
+
+def legacy_scan(adb, path, sample):
+    """The loop load_file_preview used: one find, then one stat per file"""
+    result = subprocess.run([adb, 'shell', 'find', path, '-type', 'f'], capture_output=True, text=True)
+    files = result.stdout.splitlines()
+    start = time.perf_counter()
+    for file in files[:sample]:
+        subprocess.run([adb, 'shell', 'stat', '-c', "'%s %y'", file], capture_output=True, text=True)
+    per_file = (time.perf_counter() - start) / max(1, min(sample, len(files)))
+    return len(files), per_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=50000)
+    parser.add_argument("--sample", type=int, default=300, help="files timed with the legacy loop")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per adb invocation")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        os.environ["FAKE_ADB_ROOT"] = root
+        os.environ["FAKE_ADB_LATENCY"] = str(args.latency)
+        build_tree(root, args.files)
+
+        start = time.perf_counter()
+        entries = DeviceScanner(AdbClient(FAKE_ADB, use_server=False)).scan_all(["/sdcard/DCIM/Camera"])
+        batched = time.perf_counter() - start
+
+        count, per_file = legacy_scan(FAKE_ADB, "/sdcard/DCIM/Camera", args.sample)
+        legacy = per_file * count
+
+    print(f"files:           {len(entries)} (find reported {count})")
+    print(f"batched scan:    {batched:.2f} s")
+    print(f"per-file stat:   {legacy:.1f} s (extrapolated from {args.sample} files, {per_file * 1000:.1f} ms each)")
+    print(f"speedup:         {legacy / batched:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Adaptive parallel transfers and the bandwidth cap
+
+Pulls the same files over fake_adb_server.py with a simulated link where a
+single transfer is slower than the link (--stream-bandwidth below
+--bandwidth), so throughput grows with parallel transfers up to their ratio
+and then stays flat. Compares fixed worker counts with the adaptive
+controller started from one worker, then runs the adaptive transfer under a
+bandwidth cap.
+
+    python benchmarks/bench_throttle.py --bandwidth 40 --stream-bandwidth 8
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pixel_backup.adb_client import AdbClient
+from pixel_backup.engine import format_size
+from pixel_backup.manifest import plan_transfers
+from pixel_backup.scan import DeviceScanner
+from pixel_backup.throttle import ConcurrencyController, RateLimiter
+from pixel_backup.transfer import ParallelPuller
+
+from fake_adb_server import start_server
+
+FAKE_ADB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_adb.py")
+
+
+def run(label, puller, files, dest, on_bytes=None):
+    shutil.rmtree(dest, ignore_errors=True)
+    start = time.perf_counter()
+    results = puller.transfer(files, on_bytes=on_bytes)
+    elapsed = time.perf_counter() - start
+    if not all(result.ok for result in results):
+        raise RuntimeError("transfer reported failures")
+    size = sum(entry.size for entry, _ in files)
+    print(f"  {label:<36}{elapsed:7.2f} s  {format_size(size / elapsed)}/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--size-mb", type=int, default=2)
+    parser.add_argument("--bandwidth", type=float, default=40, help="link speed in MB/s")
+    parser.add_argument("--stream-bandwidth", type=float, default=8, help="speed of one transfer in MB/s")
+    parser.add_argument("--cap", type=float, default=10, help="bandwidth cap for the last run in MB/s")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        device = os.path.join(work, "sdcard")
+        os.makedirs(os.path.join(device, "DCIM", "Camera"))
+        for i in range(args.files):
+            with open(os.path.join(device, "DCIM", "Camera", f"PXL_{i:05d}.jpg"), "wb") as f:
+                f.write(os.urandom(args.size_mb * 1024 * 1024))
+        server, port = start_server(device, bandwidth=args.bandwidth, stream_bandwidth=args.stream_bandwidth)
+        client = AdbClient(FAKE_ADB, port=port)
+        entries = DeviceScanner(client).scan_all(["/sdcard/DCIM/Camera"])
+        dest = os.path.join(work, "backup")
+        files, _ = plan_transfers(None, entries, "/sdcard/DCIM/Camera", dest)
+
+        print(f"{len(files)} files of {args.size_mb} MB, link {args.bandwidth:g} MB/s, "
+              f"one transfer {args.stream_bandwidth:g} MB/s")
+        for workers in (1, 4, 16):
+            run(f"{workers} fixed workers", ParallelPuller(client, workers=workers), files, dest)
+
+        controller = ConcurrencyController(initial=1, maximum=16)
+        run("adaptive, starting at 1", ParallelPuller(client, controller=controller), files, dest)
+        print(f"  limits chosen: {' '.join(str(limit) for limit, _, _ in controller.history)}")
+
+        limiter = RateLimiter(args.cap * 1024 * 1024)
+        controller = ConcurrencyController(initial=1, maximum=16)
+        run(f"adaptive, capped at {args.cap:g} MB/s", ParallelPuller(client, controller=controller), files, dest,
+            on_bytes=limiter.consume)
+        print(f"  limits chosen: {' '.join(str(limit) for limit, _, _ in controller.history)}")
+
+        client.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
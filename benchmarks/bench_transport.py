@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Compare `adb pull` with the streamed tar transport
+
+Runs a small-file workload (many screenshots) and a large-file workload (a few
+videos) through ParallelPuller and TarStreamPuller against fake_adb.py, and
+through ParallelPuller over pooled sync connections to fake_adb_server.py.
+FAKE_ADB_FILE_LATENCY stands in for the per-file sync round trip of a real
+`adb pull` (the fake server has no such delay).
+
+    python benchmarks/bench_transport.py --file-latency 0.003
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pixel_backup.adb_client import AdbClient
+from pixel_backup.manifest import plan_transfers
+from pixel_backup.scan import DeviceScanner
+from pixel_backup.tar_stream import TarStreamPuller
+from pixel_backup.transfer import ParallelPuller
+
+from fake_adb_server import start_server
+
+FAKE_ADB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_adb.py")
+
+WORKLOADS = {
+    "small": ("Pictures/Screenshots", 2000, 32 * 1024),
+    "large": ("Movies", 8, 64 * 1024 * 1024),
+}
+
+
+def build_workload(root, folder, count, size):
+    path = os.path.join(root, *folder.split("/"))
+    os.makedirs(path, exist_ok=True)
+    block = os.urandom(min(size, 1024 * 1024))
+    for i in range(count):
+        with open(os.path.join(path, f"file_{i:05d}.bin"), "wb") as f:
+            written = 0
+            while written < size:
+                f.write(block[:size - written])
+                written += len(block[:size - written])
+
+
+def run(puller, files, dest):
+    shutil.rmtree(dest, ignore_errors=True)
+    start = time.perf_counter()
+    results = puller.transfer(files)
+    elapsed = time.perf_counter() - start
+    if not all(result.ok for result in results):
+        raise RuntimeError("transfer reported failures")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--file-latency", type=float, default=0.003, help="simulated seconds per pulled file")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as device, tempfile.TemporaryDirectory() as host:
+        os.environ["FAKE_ADB_ROOT"] = device
+        os.environ["FAKE_ADB_FILE_LATENCY"] = str(args.file_latency)
+        binary = AdbClient(FAKE_ADB, use_server=False)
+        server, port = start_server(device)
+        socket_client = AdbClient(FAKE_ADB, port=port)
+        for name, (folder, count, size) in WORKLOADS.items():
+            build_workload(device, folder, count, size)
+            source = f"/sdcard/{folder}"
+            files, _ = plan_transfers(None, DeviceScanner(binary).scan([source]), source, host)
+            total = sum(entry.size for entry, _ in files)
+
+            transports = [
+                ("adb pull x1", ParallelPuller(binary, workers=1)),
+                (f"adb pull x{args.workers}", ParallelPuller(binary, workers=args.workers)),
+                ("tar stream", TarStreamPuller(binary)),
+                (f"sync x{args.workers}", ParallelPuller(socket_client, workers=args.workers)),
+            ]
+            print(f"{name} files: {count} x {size // 1024} KB")
+            for label, puller in transports:
+                elapsed = run(puller, files, os.path.join(host, os.path.basename(folder)))
+                print(f"  {label:<12} {elapsed:7.2f} s  {total / elapsed / 1024 / 1024:8.1f} MB/s")
+        socket_client.close()
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
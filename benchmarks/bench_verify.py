@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Backup verification throughput
+
+Builds a backup folder of camera-sized files, packs a copy into a ZIP, and
+hashes both with the old one-file-at-a-time loop (manifest.hash_file) and
+with BackupVerifier, then times a re-verification that only has to check
+what changed. The device side is not involved; run_benchmarks.py covers
+the transfer.
+
+    python benchmarks/bench_verify.py --mb 1024
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pixel_backup.compression import compress_folder
+from pixel_backup.engine import format_size
+from pixel_backup.manifest import hash_file
+from pixel_backup.verify import BackupVerifier
+
+
+def build_folder(root, total_mb, seed=1):
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(root, "Photos", "Camera"))
+    written = 0
+    i = 0
+    while written < total_mb * 1024 * 1024:
+        # Mostly photos, now and then a long video
+        size = rng.randint(2, 6) * 1024 * 1024 if rng.random() < 0.9 else rng.randint(50, 200) * 1024 * 1024
+        with open(os.path.join(root, "Photos", "Camera", f"PXL_{i:05d}.jpg"), "wb") as f:
+            f.write(os.urandom(size))
+        written += size
+        i += 1
+    return written
+
+
+def timed(label, size, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<44}{elapsed:8.2f} s  {format_size(size / elapsed if elapsed else 0)}/s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        folder = os.path.join(work, "backup")
+        size = build_folder(folder, args.mb)
+        zip_path = os.path.join(work, "backup.zip")
+        compress_folder(folder, zip_path, "fast")
+        print(f"{format_size(size)} backup (the file cache is warm, so this measures hashing, not the disk)")
+
+        paths = [os.path.join(root, name) for root, _, names in os.walk(folder) for name in names]
+        timed("one file at a time (hash_file)", size, lambda: [hash_file(path) for path in paths])
+        timed("BackupVerifier, folder", size,
+              lambda: BackupVerifier(folder, workers=args.workers).verify(full=True))
+        timed("BackupVerifier, ZIP archive", size,
+              lambda: BackupVerifier(zip_path, workers=args.workers).verify(full=True))
+
+        # Touch one file; re-verifying only hashes that one
+        os.utime(paths[0], (time.time(), time.time()))
+        results = timed("re-verification after one file changed", size,
+                        lambda: BackupVerifier(folder, workers=args.workers).verify())
+        print(f"  {len(results)} files checked")
+
+
+if __name__ == "__main__":
+    main()
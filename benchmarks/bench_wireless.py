@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Transfers over a simulated Wi-Fi link
+
+Attaches a device to fake_adb_server.py over `adb connect`, then pulls each
+kind of content over a slow shared link (--bandwidth) twice: raw, and with
+compressible files gzipped on the device. Photos and videos are random
+bytes and are never compressed; documents and downloads are text and
+compress several times over. Effective throughput counts the bytes that
+arrive on disk. A last run drops the device half way through the documents
+and reports how long the transfer took with the reconnect.
+
+    python benchmarks/bench_wireless.py --bandwidth 10
+"""
+import argparse
+import filecmp
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pixel_backup.adb_client import AdbClient
+from pixel_backup.engine import format_size
+from pixel_backup.manifest import plan_transfers
+from pixel_backup.scan import DeviceScanner
+from pixel_backup.transfer import ParallelPuller
+from pixel_backup.wireless import WirelessLink, connect_wireless
+
+from fake_adb_server import start_server
+
+FAKE_ADB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_adb.py")
+ADDRESS = "192.168.1.20:5555"
+WORDS = ("invoice total amount customer order date shipping address payment status reference "
+         "account balance report summary meeting notes project budget schedule").split()
+
+# name: (device folder, file name pattern, file count, MB per file, text)
+CONTENT = {
+    "photos": ("DCIM/Camera", "PXL_{:04d}.jpg", 10, 3, False),
+    "videos": ("Movies", "VID_{:04d}.mp4", 2, 16, False),
+    "documents": ("Documents", "report_{:04d}.csv", 10, 3, True),
+    "downloads": ("Download", "export_{:04d}.json", 10, 3, True),
+}
+
+
+def write_text(path, size, rng):
+    with open(path, "w") as f:
+        written = 0
+        while written < size:
+            line = f"{rng.randint(1, 99999)},{' '.join(rng.choice(WORDS) for _ in range(6))},{rng.random():.4f}\n"
+            f.write(line)
+            written += len(line)
+
+
+def build_device(root, seed=1):
+    rng = random.Random(seed)
+    for folder, pattern, count, size_mb, text in CONTENT.values():
+        path = os.path.join(root, *folder.split("/"))
+        os.makedirs(path)
+        for i in range(count):
+            name = os.path.join(path, pattern.format(i))
+            if text:
+                write_text(name, size_mb * 1024 * 1024, rng)
+            else:
+                with open(name, "wb") as f:
+                    f.write(os.urandom(size_mb * 1024 * 1024))
+
+
+def run(puller, files, dest):
+    shutil.rmtree(dest, ignore_errors=True)
+    start = time.perf_counter()
+    results = puller.transfer(files)
+    elapsed = time.perf_counter() - start
+    if not all(result.ok for result in results):
+        raise RuntimeError("transfer reported failures")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bandwidth", type=float, default=10, help="link speed in MB/s")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        device = os.path.join(work, "sdcard")
+        build_device(device)
+        server, port = start_server(device, serials=[], bandwidth=args.bandwidth)
+        client = AdbClient(FAKE_ADB, port=port)
+        serial = connect_wireless(client, ADDRESS)
+        scanner = DeviceScanner(client, serial)
+        dest = os.path.join(work, "backup")
+
+        print(f"Wi-Fi link at {args.bandwidth:g} MB/s, {args.workers} parallel transfers")
+        print(f"  {'content':<12}{'size':>10}{'raw':>14}{'compressed':>14}")
+        workloads = {}
+        for name, (folder, _, _, _, _) in CONTENT.items():
+            source = f"/sdcard/{folder}"
+            files, _ = plan_transfers(None, scanner.scan([source]), source, dest)
+            workloads[name] = files
+            size = sum(entry.size for entry, _ in files)
+            speeds = []
+            for compress in (False, True):
+                puller = ParallelPuller(client, serial, workers=args.workers, compress=compress)
+                speeds.append(f"{format_size(size / run(puller, files, dest))}/s")
+            print(f"  {name:<12}{format_size(size):>10}{speeds[0]:>14}{speeds[1]:>14}")
+
+        # Drop the device half way through the documents
+        files = workloads["documents"]
+        size = sum(entry.size for entry, _ in files)
+        link = WirelessLink(client, serial, delay=0.5)
+        puller = ParallelPuller(client, serial, workers=args.workers, reconnect=link.reconnect, compress=True)
+        outage = threading.Timer(size / (args.bandwidth * 1024 * 1024) / 4, server.drop, [serial])
+        outage.start()
+        elapsed = run(puller, files, dest)
+        outage.cancel()
+        intact = all(filecmp.cmp(local, os.path.join(device, *entry.path.split("/")[2:]), shallow=False)
+                     for entry, local in files)
+        print(f"  documents with a dropped link: {elapsed:.2f} s, {link.reconnects} reconnect(s), "
+              f"files {'intact' if intact else 'CORRUPT'}")
+
+        client.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
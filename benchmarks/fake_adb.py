@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""Stand-in for the `adb` binary used by the benchmarks
+
+A host directory (FAKE_ADB_ROOT) plays the part of the device's /sdcard.
+Shell commands run on the host with /sdcard rewritten to that directory, so
+`find`, `stat` and friends behave like their toybox counterparts.
+
+Environment:
+    FAKE_ADB_ROOT     directory served as /sdcard (required)
+    FAKE_ADB_MODEL    value of ro.product.model (default "Pixel 7")
+    FAKE_ADB_SERIAL   serial number reported by `devices` (default FAKE0001)
+    FAKE_ADB_LATENCY  seconds added to every invocation, like a USB round-trip
+    FAKE_ADB_FILE_LATENCY  seconds added per file by `pull` (sync protocol round-trips)
+    FAKE_ADB_BANDWIDTH  link speed in MB/s for pulled and streamed data (default unlimited);
+                      each invocation gets the full rate, the fake server shares it
+    FAKE_ADB_PM_LATENCY  seconds every `pm` call takes, like starting the package manager
+
+Installed apps are folders below /sdcard/.apps: <package>/version holds the
+versionCode and the *.apk files are its base and split APKs, which is what
+`pm list packages -3 --show-versioncode` and `pm path` report.
+
+Contacts, messages and the call log are the tables data, sms and calls of the
+SQLite database /sdcard/.providers.db, which `content query` reads.
+"""
+import os
+import shlex
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+DEVICE_ROOT = "/sdcard"
+
+
+class LinkThrottle:
+    """Hold data back so it never leaves faster than rate bytes per second"""
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.available_at = time.monotonic()
+
+    @classmethod
+    def from_env(cls):
+        mbps = float(os.environ.get("FAKE_ADB_BANDWIDTH", "0"))
+        return cls(mbps * 1024 * 1024 if mbps > 0 else None)
+
+    def consume(self, count):
+        if not self.rate or not count:
+            return
+        # Every caller books its slot on the shared link, then waits for it
+        with self.lock:
+            now = time.monotonic()
+            self.available_at = max(self.available_at, now) + count / self.rate
+            delay = self.available_at - now
+        time.sleep(delay)
+
+
+def to_host(text, root):
+    return text.replace(DEVICE_ROOT, root)
+
+
+def to_device(data, root):
+    return data.replace(root.encode(), DEVICE_ROOT.encode())
+
+
+# Shell function standing in for the package manager; {apps} is the host folder of the apps
+PM_FUNCTION = """pm() {{
+  sleep {latency}
+  case "$1" in
+    list) for d in {apps}/*/; do [ -d "$d" ] && echo "package:$(basename "$d") versionCode:$(cat "$d/version")"; done ;;
+    path) for f in {apps}/"$2"/*.apk; do [ -f "$f" ] && echo "package:$f"; done ;;
+  esac
+}}
+"""
+CONTENT_FUNCTION = """content() {{ {python} {script} content {root} "$@"; }}
+"""
+PROVIDER_TABLES = {
+    "content://com.android.contacts/data": "data",
+    "content://sms": "sms",
+    "content://call_log/calls": "calls",
+}
+
+
+def host_command(command, root):
+    """Translate a device shell command into one that runs on the host"""
+    if command.startswith("getprop"):
+        if "ro.product.model" in command:
+            return "echo " + shlex.quote(os.environ.get("FAKE_ADB_MODEL", "Pixel 7"))
+        return "true"
+    if "pm " in command:
+        return PM_FUNCTION.format(apps=shlex.quote(os.path.join(root, ".apps")),
+                                  latency=float(os.environ.get("FAKE_ADB_PM_LATENCY", "0"))) + to_host(command, root)
+    if command.startswith("content "):
+        return CONTENT_FUNCTION.format(python=shlex.quote(sys.executable),
+                                       script=shlex.quote(os.path.abspath(__file__)),
+                                       root=shlex.quote(root)) + command
+    return to_host(command, root)
+
+
+def stream_output(process, root, write, throttle=None):
+    """Copy a process's stdout to write, mapping host paths back to /sdcard"""
+    # Hold back a partial root path at the end of each chunk until the next one arrives
+    keep = len(root.encode()) - 1
+    pending = b""
+    for chunk in iter(lambda: process.stdout.read(65536), b""):
+        pending = to_device(pending + chunk, root)
+        if throttle:
+            throttle.consume(max(0, len(pending) - keep))
+        write(pending[:-keep])
+        pending = pending[-keep:]
+    write(pending)
+
+
+def copy_file(source, target, throttle):
+    if not throttle.rate:
+        shutil.copy2(source, target)
+        return
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        for block in iter(lambda: src.read(65536), b""):
+            throttle.consume(len(block))
+            dst.write(block)
+    shutil.copystat(source, target)
+
+
+def run_shell(args, root):
+    process = subprocess.Popen(["sh", "-c", host_command(" ".join(args), root)], stdout=subprocess.PIPE)
+    stream_output(process, root, sys.stdout.buffer.write, LinkThrottle.from_env())
+    sys.stdout.buffer.flush()
+    return process.wait()
+
+
+def pull(args, root):
+    args = [arg for arg in args if not arg.startswith("-")]
+    sources, dest = args[:-1], args[-1]
+    pulled = 0
+    file_latency = float(os.environ.get("FAKE_ADB_FILE_LATENCY", "0"))
+    throttle = LinkThrottle.from_env()
+    for source in sources:
+        host_source = to_host(source, root)
+        if not os.path.exists(host_source):
+            sys.stderr.write(f"adb: error: remote object '{source}' does not exist\n")
+            return 1
+        if os.path.isdir(host_source):
+            target = os.path.join(dest, os.path.basename(host_source.rstrip("/")))
+            shutil.copytree(host_source, target, dirs_exist_ok=True,
+                            copy_function=lambda src, dst: copy_file(src, dst, throttle))
+            count = sum(len(files) for _, _, files in os.walk(host_source))
+            time.sleep(file_latency * count)
+            pulled += count
+        else:
+            target = os.path.join(dest, os.path.basename(host_source)) if os.path.isdir(dest) else dest
+            copy_file(host_source, target, throttle)
+            time.sleep(file_latency)
+            pulled += 1
+    print(f"{' '.join(sources)}: {pulled} files pulled.")
+    return 0
+
+
+def content_query(args, root):
+    """`content query --uri U [--projection a:b] [--where W] [--sort S]` against .providers.db"""
+    options = dict(zip(args[1::2], args[2::2]))
+    table = PROVIDER_TABLES.get(options.get("--uri"))
+    if args[:1] != ["query"] or table is None:
+        sys.stderr.write(f"Error while accessing provider: {options.get('--uri')}\n")
+        return 1
+    columns = options["--projection"].split(":") if "--projection" in options else ["*"]
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if "--where" in options:
+        sql += f" WHERE {options['--where']}"
+    if "--sort" in options:
+        sql += f" ORDER BY {options['--sort']}"
+    db = sqlite3.connect(os.path.join(root, ".providers.db"))
+    try:
+        cursor = db.execute(sql)
+    except sqlite3.OperationalError as e:
+        if "no such table" not in str(e):
+            raise
+        # A device without this provider's data
+        print("No result found.")
+        return 0
+    names = [column[0] for column in cursor.description]
+    out = sys.stdout.buffer
+    count = 0
+    for count, row in enumerate(cursor, 1):
+        values = ", ".join(f"{name}={'NULL' if value is None else value}" for name, value in zip(names, row))
+        out.write(f"Row: {count - 1} {values}\n".encode())
+    if not count:
+        out.write(b"No result found.\n")
+    out.flush()
+    db.close()
+    return 0
+
+
+def main(argv):
+    if argv[:1] == ["content"]:
+        # The `content` shell function of a device command
+        return content_query(argv[2:], os.path.abspath(argv[1]))
+    root = os.environ.get("FAKE_ADB_ROOT")
+    if not root:
+        sys.stderr.write("FAKE_ADB_ROOT is not set\n")
+        return 1
+    root = os.path.abspath(root)
+    time.sleep(float(os.environ.get("FAKE_ADB_LATENCY", "0")))
+
+    serial = os.environ.get("FAKE_ADB_SERIAL", "FAKE0001")
+    while argv and argv[0] == "-s":
+        argv = argv[2:]
+    if not argv:
+        return 1
+
+    command, args = argv[0], argv[1:]
+    if command == "devices":
+        print("List of devices attached")
+        print(f"{serial}\tdevice")
+        print()
+        return 0
+    if command == "track-devices":
+        # Report the (fixed) device list once, then stay attached like adb does
+        listing = f"{serial}\tdevice product:fake model:{os.environ.get('FAKE_ADB_MODEL', 'Pixel 7').replace(' ', '_')}\n"
+        sys.stdout.write(f"{len(listing.encode()):04x}{listing}")
+        sys.stdout.flush()
+        while True:
+            time.sleep(3600)
+    if command == "get-serialno":
+        print(serial)
+        return 0
+    if command in ("shell", "exec-out"):
+        return run_shell(args, root)
+    if command == "exec-in":
+        return subprocess.call(["sh", "-c", host_command(" ".join(args), root)])
+    if command == "pull":
+        return pull(args, root)
+    sys.stderr.write(f"fake adb: unsupported command {command}\n")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""Stand-in for the adb server used by the benchmarks
+
+Speaks enough of the adb server socket protocol for AdbClient: host:version,
+host:devices(-l), host:transport(-any), shell,v2,raw:, shell:, exec: and the
+sync service (STAT, RECV, SEND, QUIT) plus host:track-devices(-l), which pushes
+a new list whenever set_serials() changes the attached devices. Like
+fake_adb.py, a host directory plays the part of the device's /sdcard, and
+--bandwidth caps the data rate of the simulated link shared by all connections,
+and --stream-bandwidth the rate of each single transfer (the per-file ceiling
+of slow device storage or adbd), so the best number of parallel transfers is
+about their ratio.
+
+host:connect, host:disconnect and host:pair attach wireless devices by
+address (the pairing code is 123456); drop() cuts a device off mid-transfer
+like a Wi-Fi outage, until it is connected again.
+
+    python benchmarks/fake_adb_server.py --root /tmp/fake_sdcard --port 5038 --bandwidth 40
+"""
+import argparse
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import threading
+
+from fake_adb import LinkThrottle, host_command, stream_output, to_host
+
+PAIRING_CODE = "123456"
+
+
+def device_line(serial):
+    model = os.environ.get("FAKE_ADB_MODEL", "Pixel 7").replace(" ", "_")
+    return f"{serial}\tdevice product:fake model:{model} device:fake transport_id:1\n"
+
+
+class AdbRequestHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.serial = None
+
+    def read_exactly(self, count):
+        data = b""
+        while len(data) < count:
+            chunk = self.request.recv(count - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def read_request(self):
+        length = int(self.read_exactly(4), 16)
+        return self.read_exactly(length).decode("utf-8")
+
+    def okay(self, payload=None):
+        self.request.sendall(b"OKAY")
+        if payload is not None:
+            data = payload.encode("utf-8")
+            self.request.sendall(b"%04x" % len(data) + data)
+
+    def fail(self, message):
+        data = message.encode("utf-8")
+        self.request.sendall(b"FAIL" + b"%04x" % len(data) + data)
+
+    def handle(self):
+        try:
+            request = self.read_request()
+            if request == "host:version":
+                self.okay("0029")
+            elif request in ("host:devices", "host:devices-l"):
+                self.okay("".join(device_line(serial) for serial in self.server.serials))
+            elif request in ("host:track-devices", "host:track-devices-l"):
+                self.track_devices()
+            elif request == "host:transport-any" or request.startswith("host:transport:"):
+                serial = request.split(":", 2)[2] if request.startswith("host:transport:") else self.server.serials[0]
+                if serial not in self.server.serials:
+                    self.fail(f"device '{serial}' not found")
+                    return
+                self.okay()
+                self.serial = serial
+                with self.server.changed:
+                    self.server.active.add(self)
+                self.handle_device(self.read_request())
+            elif request.startswith("host:connect:"):
+                address = request.split(":", 2)[2]
+                attached = address in self.server.serials
+                if not attached:
+                    self.server.set_serials(self.server.serials + [address])
+                self.okay(f"{'already connected' if attached else 'connected'} to {address}")
+            elif request.startswith("host:disconnect:"):
+                address = request.split(":", 2)[2]
+                self.server.set_serials([serial for serial in self.server.serials if serial != address])
+                self.okay(f"disconnected {address}")
+            elif request.startswith("host:pair:"):
+                _, _, code, address = request.split(":", 3)
+                if code == PAIRING_CODE:
+                    self.okay(f"Successfully paired to {address} [guid=adb-FAKE0001]")
+                else:
+                    self.okay("Failed: Wrong password or connection was dropped.")
+            else:
+                self.fail(f"unknown host service {request}")
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self.server.changed:
+                self.server.active.discard(self)
+
+    def track_devices(self):
+        self.request.sendall(b"OKAY")
+        with self.server.changed:
+            while True:
+                serials = list(self.server.serials)
+                data = "".join(device_line(serial) for serial in serials).encode("utf-8")
+                self.request.sendall(b"%04x" % len(data) + data)
+                while self.server.serials == serials:
+                    self.server.changed.wait()
+
+    def handle_device(self, service):
+        root = self.server.root
+        if service.startswith("shell,v2,raw:"):
+            self.okay()
+            process = subprocess.Popen(["sh", "-c", host_command(service.split(":", 1)[1], root)],
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stream_output(process, root, lambda data: data and self.request.sendall(
+                struct.pack("<BI", 1, len(data)) + data), self.server.throttle)
+            stderr = process.stderr.read()
+            if stderr:
+                self.request.sendall(struct.pack("<BI", 2, len(stderr)) + stderr)
+            self.request.sendall(struct.pack("<BIB", 3, 1, process.wait() & 0xff))
+        elif service.startswith("shell:") or service.startswith("exec:"):
+            self.okay()
+            process = subprocess.Popen(["sh", "-c", host_command(service.split(":", 1)[1], root)],
+                                       stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            try:
+                stream_output(process, root, self.request.sendall, self.server.throttle)
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                process.wait()
+        elif service == "sync:":
+            self.okay()
+            self.handle_sync()
+        else:
+            self.fail(f"unknown device service {service}")
+
+    def handle_sync(self):
+        root = self.server.root
+        while True:
+            header = self.read_exactly(8)
+            request, length = header[:4], struct.unpack("<I", header[4:])[0]
+            if request == b"QUIT":
+                return
+            argument = self.read_exactly(length).decode("utf-8")
+            if request == b"SEND":
+                self.receive_file(to_host(argument.rsplit(",", 1)[0], root))
+                continue
+            path = to_host(argument, root)
+            if request == b"STAT":
+                try:
+                    st = os.stat(path)
+                    self.request.sendall(b"STAT" + struct.pack("<III", st.st_mode, st.st_size & 0xffffffff,
+                                                               int(st.st_mtime)))
+                except OSError:
+                    self.request.sendall(b"STAT" + struct.pack("<III", 0, 0, 0))
+            elif request == b"RECV":
+                stream = LinkThrottle(self.server.stream_rate)
+                try:
+                    with open(path, "rb") as f:
+                        for block in iter(lambda: f.read(64 * 1024), b""):
+                            stream.consume(len(block))
+                            self.server.throttle.consume(len(block))
+                            self.request.sendall(b"DATA" + struct.pack("<I", len(block)) + block)
+                    self.request.sendall(b"DONE" + struct.pack("<I", 0))
+                except OSError as e:
+                    message = str(e).encode("utf-8")
+                    self.request.sendall(b"FAIL" + struct.pack("<I", len(message)) + message)
+            else:
+                message = b"unsupported sync request"
+                self.request.sendall(b"FAIL" + struct.pack("<I", len(message)) + message)
+
+    def receive_file(self, path):
+        """Store DATA chunks up to DONE in path, like adbd does for a push"""
+        error = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            f = open(path + ".push", "wb")
+        except OSError as e:
+            f = None
+            error = str(e)
+        while True:
+            header = self.read_exactly(8)
+            response, length = header[:4], struct.unpack("<I", header[4:])[0]
+            if response == b"DONE":
+                break
+            block = self.read_exactly(length)
+            self.server.throttle.consume(length)
+            if f is not None:
+                f.write(block)
+        if f is not None:
+            f.close()
+            os.replace(path + ".push", path)
+            os.utime(path, (length, length))
+            self.request.sendall(b"OKAY" + struct.pack("<I", 0))
+        else:
+            message = error.encode("utf-8")
+            self.request.sendall(b"FAIL" + struct.pack("<I", len(message)) + message)
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, root, port=0, serials=("FAKE0001",), bandwidth=None, stream_bandwidth=None):
+        super().__init__(("127.0.0.1", port), AdbRequestHandler)
+        self.root = os.path.abspath(root)
+        self.serials = list(serials)
+        self.changed = threading.Condition()
+        # Handlers of open device connections
+        self.active = set()
+        self.throttle = LinkThrottle(bandwidth * 1024 * 1024 if bandwidth else None)
+        self.stream_rate = stream_bandwidth * 1024 * 1024 if stream_bandwidth else None
+
+    def set_serials(self, serials):
+        """Attach or detach fake devices; trackers are told about the change"""
+        with self.changed:
+            self.serials = list(serials)
+            self.changed.notify_all()
+
+    def drop(self, serial):
+        """Take serial away and break its open connections, like a Wi-Fi outage"""
+        with self.changed:
+            self.serials = [known for known in self.serials if known != serial]
+            self.changed.notify_all()
+            handlers = [handler for handler in self.active if handler.serial == serial]
+        for handler in handlers:
+            try:
+                handler.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def start_server(root, port=0, serials=("FAKE0001",), bandwidth=None, stream_bandwidth=None):
+    """Serve root in a background thread; returns (server, port). Bandwidths are in MB/s"""
+    server = FakeAdbServer(root, port, serials, bandwidth, stream_bandwidth)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", required=True, help="folder served as /sdcard")
+    parser.add_argument("--port", type=int, default=5038)
+    parser.add_argument("--serial", action="append", help="device serial (repeat for several)")
+    parser.add_argument("--bandwidth", type=float, default=None, help="link speed in MB/s (default unlimited)")
+    parser.add_argument("--stream-bandwidth", type=float, default=None,
+                        help="speed of a single transfer in MB/s (default unlimited)")
+    args = parser.parse_args()
+    server = FakeAdbServer(args.root, args.port, args.serial or ["FAKE0001"], args.bandwidth, args.stream_bandwidth)
+    print(f"fake adb server on 127.0.0.1:{server.server_address[1]} serving {server.root}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
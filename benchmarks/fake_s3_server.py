@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""Stand-in for an S3-compatible object store (MinIO and friends) used by the benchmarks
+
+Serves path-style requests (/bucket/key) with just enough of the S3 API for
+object_store.py: PUT, GET, HEAD and DELETE of objects, and multipart uploads
+(POST ?uploads, PUT ?partNumber&uploadId, POST ?uploadId, DELETE ?uploadId).
+Every request must carry a valid Signature Version 4 for the given access
+key, and a body must match its x-amz-content-sha256. Objects are files in a
+host directory; --bandwidth caps the upload rate shared by all connections,
+like the uplink to a remote bucket.
+
+    python benchmarks/fake_s3_server.py --root /tmp/fake_bucket --port 9000 --bandwidth 40
+"""
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pixel_backup.object_store import UNSIGNED_PAYLOAD, sign_request
+
+from fake_adb import LinkThrottle
+
+ACCESS_KEY = "fakeaccesskey"
+SECRET_KEY = "fakesecretkey"
+AUTHORIZATION = re.compile(r"AWS4-HMAC-SHA256 Credential=([^/]+)/(\d{8})/([^/]+)/s3/aws4_request, "
+                           r"SignedHeaders=([^,]+), Signature=([0-9a-f]{64})")
+
+
+class S3RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def error(self, status, code, message=""):
+        self.reply(status, f"<Error><Code>{code}</Code><Message>{message or code}</Message></Error>".encode("utf-8"),
+                   {"Content-Type": "application/xml"})
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = b""
+        while len(body) < length:
+            chunk = self.rfile.read(min(length - len(body), 1024 * 1024))
+            if not chunk:
+                break
+            self.server.throttle.consume(len(chunk))
+            body += chunk
+        return body
+
+    def authorized(self, path, query, body):
+        """Check the request's signature by signing it again with the known secret"""
+        match = AUTHORIZATION.fullmatch(self.headers.get("Authorization", ""))
+        if not match or match.group(1) != ACCESS_KEY:
+            return False
+        payload_hash = self.headers.get("x-amz-content-sha256", "")
+        if payload_hash != UNSIGNED_PAYLOAD and payload_hash != hashlib.sha256(body).hexdigest():
+            return False
+        signed = {name: self.headers.get(name, "") for name in match.group(4).split(";")
+                  if name not in ("host", "x-amz-date", "x-amz-content-sha256")}
+        now = datetime.strptime(self.headers.get("x-amz-date", ""), "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+        expected = sign_request(self.command, self.headers.get("host", ""), path, query, signed, payload_hash,
+                                ACCESS_KEY, SECRET_KEY, match.group(3), now)
+        return expected["Authorization"] == self.headers.get("Authorization")
+
+    def handle_request(self):
+        parts = urlsplit(self.path)
+        query = dict(parse_qsl(parts.query, keep_blank_values=True))
+        body = self.read_body() if self.command in ("PUT", "POST") else b""
+        if not self.authorized(parts.path, query, body):
+            self.error(403, "SignatureDoesNotMatch")
+            return
+        bucket, _, key = unquote(parts.path).lstrip("/").partition("/")
+        if bucket != self.server.bucket or not key:
+            self.error(404, "NoSuchBucket")
+            return
+        path = os.path.join(self.server.root, *key.split("/"))
+        server = self.server
+
+        if self.command == "POST" and "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            os.makedirs(os.path.join(server.uploads, upload_id))
+            self.reply(200, f"<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>"
+                            f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>".encode("utf-8"))
+        elif self.command == "PUT" and "uploadId" in query:
+            folder = os.path.join(server.uploads, query["uploadId"])
+            if not os.path.isdir(folder):
+                self.error(404, "NoSuchUpload")
+                return
+            with open(os.path.join(folder, f"{int(query['partNumber']):05d}"), "wb") as f:
+                f.write(body)
+            self.reply(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+        elif self.command == "POST" and "uploadId" in query:
+            folder = os.path.join(server.uploads, query["uploadId"])
+            numbers = [int(number) for number in re.findall(rb"<PartNumber>(\d+)</PartNumber>", body)]
+            if not os.path.isdir(folder) or not numbers:
+                self.error(404, "NoSuchUpload")
+                return
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".upload", "wb") as f:
+                for number in numbers:
+                    with open(os.path.join(folder, f"{number:05d}"), "rb") as part:
+                        shutil.copyfileobj(part, f)
+            os.replace(path + ".upload", path)
+            shutil.rmtree(folder)
+            self.reply(200, f"<CompleteMultipartUploadResult><Key>{key}</Key>"
+                            f"</CompleteMultipartUploadResult>".encode("utf-8"))
+        elif self.command == "DELETE" and "uploadId" in query:
+            shutil.rmtree(os.path.join(server.uploads, query["uploadId"]), ignore_errors=True)
+            self.reply(204)
+        elif self.command == "PUT":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(body)
+            self.reply(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+        elif self.command in ("GET", "HEAD"):
+            if not os.path.isfile(path):
+                self.error(404, "NoSuchKey")
+                return
+            with open(path, "rb") as f:
+                data = f.read()
+            self.reply(200, data, {"Content-Type": "application/octet-stream"})
+        elif self.command == "DELETE":
+            if os.path.isfile(path):
+                os.remove(path)
+            self.reply(204)
+        else:
+            self.error(405, "MethodNotAllowed")
+
+    do_GET = do_HEAD = do_PUT = do_POST = do_DELETE = handle_request
+
+
+class FakeS3Server(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, root, bucket="backups", port=0, bandwidth=None):
+        super().__init__(("127.0.0.1", port), S3RequestHandler)
+        self.root = os.path.abspath(root)
+        self.bucket = bucket
+        # Parts of unfinished multipart uploads
+        self.uploads = os.path.join(self.root, ".uploads")
+        os.makedirs(self.uploads, exist_ok=True)
+        self.throttle = LinkThrottle(bandwidth * 1024 * 1024 if bandwidth else None)
+
+    def pending_uploads(self):
+        """Multipart uploads started and neither completed nor aborted"""
+        return os.listdir(self.uploads)
+
+
+def start_server(root, bucket="backups", port=0, bandwidth=None):
+    """Serve root in a background thread; returns (server, endpoint URL). bandwidth is in MB/s"""
+    server = FakeS3Server(root, bucket, port, bandwidth)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", required=True, help="folder holding the bucket's objects")
+    parser.add_argument("--bucket", default="backups")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--bandwidth", type=float, default=None, help="upload speed in MB/s (default unlimited)")
+    args = parser.parse_args()
+    server = FakeS3Server(args.root, args.bucket, args.port, args.bandwidth)
+    print(f"fake S3 on http://127.0.0.1:{server.server_address[1]}, bucket {args.bucket} in {server.root}")
+    print(f"AWS_ACCESS_KEY_ID={ACCESS_KEY} AWS_SECRET_ACCESS_KEY={SECRET_KEY}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""Reproducible benchmark suite against a simulated Pixel
+
+Builds a synthetic /sdcard (see synthetic_device.py), serves it through
+fake_adb_server.py (or the fake_adb.py binary with --transport binary) at an
+optional link bandwidth, and times the operations the toolkit spends its time
+in: the preview scan, the media pull, a repeat incremental pull, compression,
+backup size calculation and the history refresh. Results are written as JSON;
+--compare reports the change against an earlier result file and exits with
+status 1 when a scenario got slower than --tolerance allows.
+
+    python benchmarks/run_benchmarks.py --profile quick --bandwidth 40 --output results.json
+    python benchmarks/run_benchmarks.py --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pixel_backup.adb_client import AdbClient
+from pixel_backup.catalog import BackupCatalog
+from pixel_backup.compression import compress_folder
+from pixel_backup.engine import format_size, get_folder_size
+from pixel_backup.manifest import BackupManifest, manifest_path, plan_transfers
+from pixel_backup.preview import PreviewModel
+from pixel_backup.scan import DeviceScanner
+from pixel_backup.tar_stream import TarStreamPuller
+from pixel_backup.transfer import ParallelPuller
+
+from fake_adb_server import start_server
+from synthetic_device import PROFILES, build_tree, load_profile
+
+FAKE_ADB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_adb.py")
+
+# The folders load_file_preview searches for a custom preview with every type ticked
+PREVIEW_PATHS = ["/sdcard/DCIM/Camera", "/sdcard/Movies", "/sdcard/Documents", "/sdcard/Music",
+                 "/sdcard/Download", "/sdcard/Pictures"]
+
+HISTORY_ENTRIES = 2000
+
+
+class SkipScenario(Exception):
+    """The scenario cannot run here (no display, GUI dependencies missing)"""
+
+
+def load_gui():
+    """The GUI class, for scenarios that time its methods directly"""
+    try:
+        from pixel_backup_tool import PixelBackupToolkit
+    except ImportError as e:
+        raise SkipScenario(f"GUI not importable: {e}")
+    return PixelBackupToolkit
+
+
+class Suite:
+    def __init__(self, client, device, work, args):
+        self.client = client
+        self.device = device
+        self.work = work
+        self.args = args
+        self.media = os.path.join(work, "Media")
+
+    def media_files(self, manifest=None):
+        scanner = DeviceScanner(self.client)
+        to_pull, skipped = [], []
+        for source in PREVIEW_PATHS:
+            pulls, skips = plan_transfers(manifest, scanner.scan([source]), source, self.media)
+            to_pull.extend(pulls)
+            skipped.extend(skips)
+        return to_pull, skipped
+
+    def puller(self):
+        if self.args.mode == "tar":
+            return TarStreamPuller(self.client)
+        return ParallelPuller(self.client, workers=self.args.workers)
+
+    def scan(self):
+        """The file preview: stream the listing into the model and show the first page"""
+        model = PreviewModel()
+        batch = []
+        for entry in DeviceScanner(self.client).scan(PREVIEW_PATHS):
+            batch.append(entry)
+            if len(batch) >= 2000:
+                model.append(batch)
+                model.refresh()
+                batch = []
+        model.append(batch)
+        model.refresh(force=True)
+        model.page(0, 40)
+        return {"files": model.loaded}
+
+    def pull(self):
+        """backup_media: scan, plan and transfer every media folder"""
+        shutil.rmtree(self.media, ignore_errors=True)
+        to_pull, _ = self.media_files()
+        results = self.puller().transfer(to_pull)
+        failed = [result for result in results if not result.ok]
+        if failed:
+            raise RuntimeError(f"{len(failed)} files failed, first: {failed[0].error}")
+        manifest = BackupManifest(manifest_path(self.work, "bench"), "bench", {})
+        pulled = {entry.path: entry for entry, _ in to_pull}
+        for result in results:
+            manifest.record(pulled[result.remote], os.path.relpath(result.local, self.work))
+        manifest.save()
+        return {"files": len(results), "bytes": sum(result.size for result in results)}
+
+    def incremental(self):
+        """A second backup of an unchanged device: scan and compare only"""
+        manifest = BackupManifest.load(manifest_path(self.work, "bench"), "bench")
+        to_pull, skipped = self.media_files(manifest)
+        if to_pull:
+            raise RuntimeError(f"{len(to_pull)} unchanged files planned for transfer")
+        return {"files": len(skipped)}
+
+    def compression(self):
+        zip_path = os.path.join(self.work, "backup.zip")
+        compress_folder(self.media, zip_path, self.args.level, self.args.workers)
+        size = os.path.getsize(zip_path)
+        os.remove(zip_path)
+        return {"bytes": folder_bytes(self.media), "zip_bytes": size}
+
+    def folder_size(self):
+        return {"bytes": get_folder_size(self.media)}
+
+    def history_refresh(self):
+        """Load a catalog of HISTORY_ENTRIES backups into the history tab"""
+        gui = load_gui()
+        import tkinter as tk
+        from tkinter import ttk
+        try:
+            root = tk.Tk()
+        except tk.TclError as e:
+            raise SkipScenario(f"no display: {e}")
+        catalog = BackupCatalog(":memory:")
+        for i in range(HISTORY_ENTRIES):
+            catalog.add_backup({'date': "2025-01-01 12:00", 'type': 'Full', 'size': "1.0 GB",
+                                'location': os.path.join(self.work, f"backup_{i}"), 'details': ""})
+        try:
+            root.withdraw()
+            app = types.SimpleNamespace(history_tree=ttk.Treeview(root, columns=("date", "type", "size",
+                                                                                  "location", "details", "device")),
+                                        catalog=catalog, history_loaded_id=0)
+            while gui.load_history_page(app):
+                root.update()
+            root.update()
+        finally:
+            root.destroy()
+            catalog.close()
+        return {"entries": HISTORY_ENTRIES}
+
+
+SCENARIOS = ["scan", "pull", "incremental", "compression", "folder_size", "history_refresh"]
+
+
+def folder_bytes(folder):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(folder) for name in names)
+
+
+def run_scenario(suite, name, repeat):
+    runs = []
+    info = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        info = getattr(suite, name)()
+        runs.append(time.perf_counter() - start)
+    result = {"seconds": statistics.median(runs), "runs": runs}
+    result.update(info)
+    if "bytes" in info:
+        result["mb_per_s"] = info["bytes"] / 1024 / 1024 / result["seconds"]
+    if "files" in info:
+        result["files_per_s"] = info["files"] / result["seconds"]
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Print the change per scenario; returns the names that regressed"""
+    regressions = []
+    for name, result in results["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before or result.get("prerequisite") or "seconds" not in result or "seconds" not in before:
+            continue
+        change = result["seconds"] / before["seconds"] - 1
+        flag = ""
+        if change > tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"  {name:<16}{before['seconds']:8.3f} s -> {result['seconds']:8.3f} s  {change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", default="quick", help=f"one of {', '.join(PROFILES)} or a JSON file")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every file count in the profile")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--bandwidth", type=float, default=None, help="simulated link speed in MB/s")
+    parser.add_argument("--transport", choices=["server", "binary"], default="server")
+    parser.add_argument("--mode", choices=["pull", "tar"], default="pull")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--level", default="balanced")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", action="append", choices=SCENARIOS, help="run only these scenarios")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown before failing")
+    args = parser.parse_args()
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {key: getattr(args, key) for key in ("profile", "scale", "seed", "bandwidth", "transport",
+                                                       "mode", "workers", "level", "repeat")},
+        "results": {},
+    }
+
+    with tempfile.TemporaryDirectory() as device, tempfile.TemporaryDirectory() as work:
+        results["device"] = build_tree(device, load_profile(args.profile), args.scale, args.seed)
+        print(f"device: {results['device']['files']} files, {format_size(results['device']['bytes'])}")
+
+        os.environ["FAKE_ADB_ROOT"] = device
+        if args.bandwidth:
+            os.environ["FAKE_ADB_BANDWIDTH"] = str(args.bandwidth)
+        server = None
+        if args.transport == "server":
+            server, port = start_server(device, bandwidth=args.bandwidth)
+            client = AdbClient(FAKE_ADB, port=port)
+        else:
+            client = AdbClient(FAKE_ADB, use_server=False)
+
+        suite = Suite(client, device, work, args)
+        try:
+            # pull feeds incremental, compression and folder_size, so it always runs first
+            for name in SCENARIOS:
+                if args.only and name not in args.only and name != "pull":
+                    continue
+                prerequisite = bool(args.only) and name not in args.only
+                try:
+                    result = run_scenario(suite, name, 1 if prerequisite else args.repeat)
+                except SkipScenario as e:
+                    result = {"skipped": str(e)}
+                if prerequisite:
+                    result["prerequisite"] = True
+                results["results"][name] = result
+                if "skipped" in result:
+                    print(f"  {name:<16}skipped ({result['skipped']})")
+                else:
+                    rate = f"{result['mb_per_s']:8.1f} MB/s" if "mb_per_s" in result else \
+                           f"{result.get('files_per_s', 0):8.0f} files/s"
+                    print(f"  {name:<16}{result['seconds']:8.3f} s  {rate}")
+        finally:
+            client.close()
+            if server:
+                server.shutdown()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"compared with {args.compare} ({baseline.get('commit')}, {baseline.get('timestamp')})")
+        if baseline.get("config") != results["config"]:
+            print("  note: the baseline was run with different settings")
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Synthetic /sdcard trees for the fake adb device
+
+A profile lists groups of files: the folder they live in, how many there are,
+a size distribution and whether the content is incompressible (camera output,
+video, music) or text-like. Trees are built from a seed, so the same profile
+always produces the same files, sizes and modification times.
+
+    python benchmarks/synthetic_device.py --profile camera-roll --scale 2 /tmp/fake_sdcard
+"""
+import argparse
+import json
+import math
+import os
+import random
+import time
+
+MB = 1024 * 1024
+DAY = 24 * 3600
+
+# folder, file count, name pattern, size distribution, content
+PROFILES = {
+    "quick": [
+        {"folder": "DCIM/Camera", "count": 600, "name": "PXL_{i:06d}.jpg",
+         "size": {"dist": "lognormal", "median": 120 * 1024, "sigma": 0.6}},
+        {"folder": "DCIM/Camera", "count": 6, "name": "PXL_{i:06d}.mp4",
+         "size": {"dist": "uniform", "min": 4 * MB, "max": 12 * MB}},
+        {"folder": "Pictures/Screenshots", "count": 800, "name": "Screenshot_{i:06d}.png",
+         "size": {"dist": "lognormal", "median": 40 * 1024, "sigma": 0.4}},
+        {"folder": "Movies", "count": 3, "name": "movie_{i:03d}.mp4", "size": {"dist": "fixed", "size": 16 * MB}},
+        {"folder": "Documents", "count": 300, "name": "notes_{i:04d}.txt",
+         "size": {"dist": "lognormal", "median": 20 * 1024, "sigma": 0.8}, "content": "text"},
+        {"folder": "Download", "count": 100, "name": "download_{i:04d}.pdf",
+         "size": {"dist": "lognormal", "median": 200 * 1024, "sigma": 1.0}},
+        {"folder": "Music", "count": 40, "name": "track_{i:03d}.mp3", "size": {"dist": "fixed", "size": MB}},
+    ],
+    "camera-roll": [
+        {"folder": "DCIM/Camera", "count": 20000, "name": "PXL_{i:06d}.jpg",
+         "size": {"dist": "lognormal", "median": 24 * 1024, "sigma": 0.5}},
+        {"folder": "Pictures/Screenshots", "count": 5000, "name": "Screenshot_{i:06d}.png",
+         "size": {"dist": "lognormal", "median": 8 * 1024, "sigma": 0.4}},
+    ],
+    "videos": [
+        {"folder": "DCIM/Camera", "count": 12, "name": "PXL_{i:06d}_4k.mp4",
+         "size": {"dist": "uniform", "min": 32 * MB, "max": 96 * MB}},
+        {"folder": "Movies", "count": 4, "name": "movie_{i:03d}.mp4", "size": {"dist": "fixed", "size": 128 * MB}},
+    ],
+}
+
+
+def load_profile(name_or_path):
+    """A built-in profile by name, or a JSON file holding a list of groups"""
+    if name_or_path in PROFILES:
+        return PROFILES[name_or_path]
+    with open(name_or_path) as f:
+        return json.load(f)
+
+
+def sample_size(rng, spec):
+    dist = spec.get("dist", "fixed")
+    if dist == "fixed":
+        return int(spec["size"])
+    if dist == "uniform":
+        return rng.randint(int(spec["min"]), int(spec["max"]))
+    if dist == "lognormal":
+        return max(1, int(rng.lognormvariate(math.log(spec["median"]), spec.get("sigma", 0.5))))
+    raise ValueError(f"unknown size distribution {dist}")
+
+
+class ContentSource:
+    """Cheap file contents: slices of a random pool, or generated words"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.pool = rng.getrandbits(8 * 4 * MB).to_bytes(4 * MB, "little")
+        words = [bytes(rng.choice(b"abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 9)))
+                 for _ in range(2000)]
+        self.text = b" ".join(rng.choice(words) for _ in range(400000))
+
+    def write(self, f, size, content):
+        pool = self.text if content == "text" else self.pool
+        offset = self.rng.randrange(len(pool))
+        written = 0
+        while written < size:
+            block = pool[offset:offset + min(MB, size - written)]
+            f.write(block)
+            written += len(block)
+            offset = (offset + len(block)) % len(pool)
+
+
+def build_tree(root, groups, scale=1.0, seed=1, now=None):
+    """Write the groups below root; returns a summary of what was created"""
+    rng = random.Random(seed)
+    source = ContentSource(rng)
+    now = now or time.time()
+    summary = {"files": 0, "bytes": 0, "folders": {}}
+    for group in groups:
+        folder = os.path.join(root, *group["folder"].split("/"))
+        os.makedirs(folder, exist_ok=True)
+        age = group.get("age_days", 365) * DAY
+        for i in range(max(1, int(group["count"] * scale))):
+            path = os.path.join(folder, group["name"].format(i=i))
+            size = sample_size(rng, group["size"])
+            with open(path, "wb") as f:
+                source.write(f, size, group.get("content", "random"))
+            mtime = int(now - rng.random() * age)
+            os.utime(path, (mtime, mtime))
+            summary["files"] += 1
+            summary["bytes"] += size
+            summary["folders"][group["folder"]] = summary["folders"].get(group["folder"], 0) + 1
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", help="folder to fill; served as /sdcard by fake_adb")
+    parser.add_argument("--profile", default="quick", help=f"one of {', '.join(PROFILES)} or a JSON file")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every file count")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    summary = build_tree(args.root, load_profile(args.profile), args.scale, args.seed)
+    print(f"{summary['files']} files, {summary['bytes'] / MB:.1f} MB in {args.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Backup engine components used by the Pixel Backup Toolkit"""
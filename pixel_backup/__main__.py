@@ -0,0 +1,5 @@
+import sys
+
+from pixel_backup.cli import main
+
+sys.exit(main())
@@ -0,0 +1,454 @@
+"""In-process client for the adb server protocol
+
+Every `adb` invocation forks a client process that connects to the adb server
+on localhost:5037 and forwards one request. This module speaks that socket
+protocol directly, so thousands of small commands cost a socket round trip
+each instead of a process start. Sync connections (used for STAT, RECV and
+SEND) stay open in a small per-device pool and are reused.
+
+When no server can be reached, every method falls back to running the `adb`
+binary, so callers never need to care which path was taken.
+"""
+import os
+import posixpath
+import shlex
+import socket
+import struct
+import subprocess
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5037
+
+# Shell protocol (shell,v2) packet ids
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+
+# Largest DATA chunk adbd accepts in a sync SEND
+SYNC_DATA_MAX = 64 * 1024
+
+DeviceInfo = namedtuple("DeviceInfo", ["serial", "state", "properties"])
+RemoteStat = namedtuple("RemoteStat", ["mode", "size", "mtime"])
+
+
+class AdbError(Exception):
+    """The adb server or device rejected a request"""
+
+
+def parse_device_list(text):
+    """Parse `adb devices -l` / host:devices-l output into DeviceInfo tuples"""
+    devices = []
+    for line in text.splitlines():
+        if not line.strip() or line.startswith("List of devices") or line.startswith("*"):
+            continue
+        parts = line.split()
+        if len(parts) < 2:
+            continue
+        properties = dict(part.split(":", 1) for part in parts[2:] if ":" in part)
+        devices.append(DeviceInfo(parts[0], parts[1], properties))
+    return devices
+
+
+class AdbConnection:
+    """One socket to the adb server"""
+
+    def __init__(self, host, port, timeout=None):
+        self.sock = socket.create_connection((host, port), timeout=10)
+        self.sock.settimeout(timeout)
+        # Sync requests are tiny; don't let Nagle hold them back
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send_request(self, payload):
+        data = payload.encode("utf-8")
+        self.sock.sendall(b"%04x" % len(data) + data)
+        self.read_status()
+
+    def read_status(self):
+        status = self.read_exactly(4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbError(self.read_string())
+        raise AdbError(f"unexpected adb server response {status!r}")
+
+    def read_string(self):
+        length = int(self.read_exactly(4), 16)
+        return self.read_exactly(length).decode("utf-8", "replace")
+
+    def read_exactly(self, count):
+        chunks = []
+        while count:
+            chunk = self.sock.recv(min(count, 1024 * 1024))
+            if not chunk:
+                raise AdbError("connection closed by adb server")
+            chunks.append(chunk)
+            count -= len(chunk)
+        return b"".join(chunks)
+
+    def close(self):
+        try:
+            # shutdown also wakes up a thread blocked reading this socket
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class SocketStream:
+    """Binary file-like reader over a service connection (exec:, shell:)"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.reader = connection.sock.makefile("rb")
+
+    def read(self, size=-1):
+        return self.reader.read(size)
+
+    def readline(self, size=-1):
+        return self.reader.readline(size)
+
+    def __iter__(self):
+        return iter(self.reader)
+
+    def close(self):
+        self.reader.close()
+        self.connection.close()
+
+
+class ProcessStream:
+    """Binary file-like reader over an `adb` child process"""
+
+    def __init__(self, process):
+        self.process = process
+
+    def read(self, size=-1):
+        return self.process.stdout.read(size)
+
+    def readline(self, size=-1):
+        return self.process.stdout.readline(size)
+
+    def __iter__(self):
+        return iter(self.process.stdout)
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.stdout.close()
+        self.process.wait()
+
+
+class AdbClient:
+    """Talk to the adb server directly, falling back to the adb binary"""
+
+    def __init__(self, adb_path="adb", host=DEFAULT_HOST, port=DEFAULT_PORT, use_server=True, pool_size=4):
+        self.adb_path = adb_path
+        self.host = host
+        self.port = port
+        self.use_server = use_server
+        self.pool_size = pool_size
+        self._pool = {}
+        self._pool_lock = threading.Lock()
+        self._server_checked = False
+
+    # -- connection management -------------------------------------------
+
+    def server_available(self):
+        """True if requests go to the server socket instead of the binary"""
+        if not self.use_server:
+            return False
+        if self._server_checked:
+            return True
+        try:
+            self.connect().close()
+        except OSError:
+            # Start the server the way the adb binary would, then try once more
+            try:
+                subprocess.run([self.adb_path, "start-server"], capture_output=True, timeout=10)
+                self.connect().close()
+            except (OSError, subprocess.SubprocessError):
+                self.use_server = False
+                return False
+        self._server_checked = True
+        return True
+
+    def connect(self, timeout=None):
+        return AdbConnection(self.host, self.port, timeout)
+
+    def transport(self, serial, timeout=None):
+        """Open a connection switched to a device"""
+        connection = self.connect(timeout)
+        try:
+            connection.send_request(f"host:transport:{serial}" if serial else "host:transport-any")
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    @contextmanager
+    def sync_connection(self, serial):
+        """Borrow a pooled sync connection for serial"""
+        with self._pool_lock:
+            idle = self._pool.setdefault(serial, [])
+            connection = idle.pop() if idle else None
+        if connection is None:
+            connection = self.transport(serial, timeout=60)
+            try:
+                connection.send_request("sync:")
+            except Exception:
+                connection.close()
+                raise
+        try:
+            yield connection
+        except Exception:
+            # The protocol state is unknown after an error, never reuse it
+            connection.close()
+            raise
+        with self._pool_lock:
+            idle = self._pool.setdefault(serial, [])
+            if len(idle) < self.pool_size:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def close(self, serial=None):
+        """Close all pooled connections, or only those to serial (after its link dropped)"""
+        with self._pool_lock:
+            if serial is None:
+                pools = list(self._pool.values())
+                self._pool.clear()
+            else:
+                pools = [self._pool.pop(serial, [])]
+        for idle in pools:
+            for connection in idle:
+                try:
+                    connection.sock.sendall(b"QUIT" + struct.pack("<I", 0))
+                except OSError:
+                    pass
+                connection.close()
+
+    def command(self, serial, *args):
+        """Command line for the adb binary"""
+        command = [self.adb_path]
+        if serial:
+            command.extend(["-s", serial])
+        command.extend(args)
+        return command
+
+    # -- host services ---------------------------------------------------
+
+    def host_request(self, request):
+        connection = self.connect(timeout=10)
+        try:
+            connection.send_request(request)
+            return connection.read_string()
+        finally:
+            connection.close()
+
+    def devices(self):
+        """List connected devices as DeviceInfo tuples"""
+        if self.server_available():
+            return parse_device_list(self.host_request("host:devices-l"))
+        result = subprocess.run(self.command(None, "devices", "-l"), capture_output=True, text=True, timeout=5)
+        return parse_device_list(result.stdout)
+
+    def connect_device(self, address):
+        """Attach a device over wireless debugging like `adb connect`; returns the server's message"""
+        return self.host_command_text(f"host:connect:{address}", "connect", address)
+
+    def disconnect_device(self, address):
+        return self.host_command_text(f"host:disconnect:{address}", "disconnect", address)
+
+    def pair_device(self, address, code):
+        """Pair with a device's wireless debugging pairing port like `adb pair`"""
+        return self.host_command_text(f"host:pair:{code}:{address}", "pair", address, code)
+
+    def host_command_text(self, request, *args):
+        """The message of a host request, or of the adb command doing the same"""
+        if self.server_available():
+            return self.host_request(request).strip()
+        result = subprocess.run(self.command(None, *args), capture_output=True, text=True, timeout=30)
+        return (result.stdout + result.stderr).strip()
+
+    # -- shell -----------------------------------------------------------
+
+    def shell(self, command, serial=None, timeout=None):
+        """Run a shell command; returns (exit status, stdout bytes, stderr bytes)"""
+        if not self.server_available():
+            result = subprocess.run(self.command(serial, "shell", command), capture_output=True, timeout=timeout)
+            return result.returncode, result.stdout, result.stderr
+
+        connection = self.transport(serial, timeout)
+        try:
+            connection.send_request(f"shell,v2,raw:{command}")
+            stdout = []
+            stderr = []
+            status = None
+            while status is None:
+                try:
+                    header = connection.read_exactly(5)
+                except AdbError:
+                    break
+                packet_id, length = struct.unpack("<BI", header)
+                data = connection.read_exactly(length)
+                if packet_id == SHELL_STDOUT:
+                    stdout.append(data)
+                elif packet_id == SHELL_STDERR:
+                    stderr.append(data)
+                elif packet_id == SHELL_EXIT:
+                    status = data[0] if data else 0
+            return (255 if status is None else status), b"".join(stdout), b"".join(stderr)
+        finally:
+            connection.close()
+
+    def open_exec(self, command, serial=None):
+        """Run command like `adb exec-out` and return a binary stream of its raw stdout"""
+        if not self.server_available():
+            process = subprocess.Popen(self.command(serial, "exec-out", command),
+                                       stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            return ProcessStream(process)
+        connection = self.transport(serial)
+        try:
+            connection.send_request(f"exec:{command}")
+        except Exception:
+            connection.close()
+            raise
+        return SocketStream(connection)
+
+    # -- sync ------------------------------------------------------------
+
+    @staticmethod
+    def sync_request(connection, request_id, path):
+        data = path.encode("utf-8")
+        connection.sock.sendall(request_id + struct.pack("<I", len(data)) + data)
+
+    def stat(self, path, serial=None):
+        """Stat a device file; returns RemoteStat (mode 0 if it does not exist)"""
+        if not self.server_available():
+            status, out, _ = self.shell(f"stat -c '%f %s %Y' {shlex.quote(path)}", serial)
+            if status != 0:
+                return RemoteStat(0, 0, 0)
+            mode, size, mtime = out.split()
+            return RemoteStat(int(mode, 16), int(size), int(mtime))
+        with self.sync_connection(serial) as connection:
+            self.sync_request(connection, b"STAT", path)
+            response = connection.read_exactly(16)
+            if response[:4] != b"STAT":
+                raise AdbError(f"unexpected sync response {response[:4]!r}")
+            return RemoteStat(*struct.unpack("<III", response[4:]))
+
+    def pull(self, remote, local, serial=None, on_bytes=None, is_canceled=None, mtime=None, keep_partial=False):
+        """Copy a device file to local; raises AdbError on failure
+
+        mtime, when known from a scan, is applied like `adb pull -a` would.
+        The file arrives as local + ".part"; with keep_partial, what arrived
+        of an interrupted pull is left there for a resume.
+        """
+        if not self.server_available():
+            result = subprocess.run(self.command(serial, "pull", "-a", remote, local),
+                                    capture_output=True, text=True)
+            if result.returncode != 0:
+                raise AdbError(result.stderr.strip() or f"adb pull {remote} failed")
+            return
+
+        tmp_path = local + ".part"
+        try:
+            with open(tmp_path, "wb") as f:
+                self.pull_stream(remote, f.write, serial, on_bytes, is_canceled)
+        except Exception:
+            if not keep_partial and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, local)
+        if mtime is not None:
+            os.utime(local, (mtime, mtime))
+
+    def pull_stream(self, remote, write, serial=None, on_bytes=None, is_canceled=None):
+        """Hand the bytes of a device file to write as they arrive; raises AdbError on failure
+
+        Without a server the bytes come from `adb exec-out cat`, which cannot
+        tell a missing file from an empty one.
+        """
+        if not self.server_available():
+            stream = self.open_exec(f"cat {shlex.quote(remote)}", serial)
+            try:
+                for block in iter(lambda: stream.read(SYNC_DATA_MAX), b""):
+                    write(block)
+                    if on_bytes:
+                        on_bytes(len(block))
+                    if is_canceled and is_canceled():
+                        raise AdbError("canceled")
+            finally:
+                stream.close()
+            return
+
+        with self.sync_connection(serial) as connection:
+            self.sync_request(connection, b"RECV", remote)
+            while True:
+                header = connection.read_exactly(8)
+                response, length = header[:4], struct.unpack("<I", header[4:])[0]
+                if response == b"DONE":
+                    break
+                if response == b"FAIL":
+                    raise AdbError(connection.read_exactly(length).decode("utf-8", "replace"))
+                if response != b"DATA":
+                    raise AdbError(f"unexpected sync response {response!r}")
+                write(connection.read_exactly(length))
+                if on_bytes:
+                    on_bytes(length)
+                if is_canceled and is_canceled():
+                    # Mid-transfer the connection is in an unknown state
+                    raise AdbError("canceled")
+
+    def push(self, source, remote, serial=None, mtime=None, on_bytes=None, is_canceled=None, mode=0o644):
+        """Write the binary stream source to a device file; raises AdbError on failure
+
+        Missing device folders are created. mtime, when given, becomes the
+        device file's modification time like `adb push --sync` keeps it.
+        Without a server the bytes go through `adb exec-in`.
+        """
+        if not self.server_available():
+            quoted = shlex.quote(remote)
+            command = f"mkdir -p {shlex.quote(posixpath.dirname(remote))} && cat > {quoted}"
+            if mtime is not None:
+                command += f" && touch -m -d @{int(mtime)} {quoted}"
+            process = subprocess.Popen(self.command(serial, "exec-in", command), stdin=subprocess.PIPE,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            try:
+                for block in iter(lambda: source.read(SYNC_DATA_MAX), b""):
+                    process.stdin.write(block)
+                    if on_bytes:
+                        on_bytes(len(block))
+                    if is_canceled and is_canceled():
+                        process.kill()
+                        raise AdbError("canceled")
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            error = process.stderr.read().decode("utf-8", "replace").strip()
+            if process.wait() != 0:
+                raise AdbError(error or f"adb exec-in to {remote} failed")
+            return
+
+        with self.sync_connection(serial) as connection:
+            self.sync_request(connection, b"SEND", f"{remote},{mode}")
+            for block in iter(lambda: source.read(SYNC_DATA_MAX), b""):
+                connection.sock.sendall(b"DATA" + struct.pack("<I", len(block)) + block)
+                if on_bytes:
+                    on_bytes(len(block))
+                if is_canceled and is_canceled():
+                    # adbd drops the half written file when the connection goes away
+                    raise AdbError("canceled")
+            connection.sock.sendall(b"DONE" + struct.pack("<I", int(time.time() if mtime is None else mtime)))
+            header = connection.read_exactly(8)
+            response, length = header[:4], struct.unpack("<I", header[4:])[0]
+            if response == b"FAIL":
+                raise AdbError(connection.read_exactly(length).decode("utf-8", "replace"))
+            if response != b"OKAY":
+                raise AdbError(f"unexpected sync response {response!r}")
@@ -0,0 +1,266 @@
+"""App backups, one package at a time
+
+A single `adb backup -apk -all` redid every app on every run (and most apps
+opt out of it since Android 12). Apps are backed up as their installed APKs
+instead: `pm list packages -3 --show-versioncode` lists the third-party
+packages with their versions, batched `pm path` calls find the base and
+split APKs of each, and packages are pulled by several workers at once,
+largest first.
+
+APKs are kept in a store below the backup location, one folder per package
+and versionCode (apks/<package>/<versionCode>/), shared by every backup and
+device. A package whose APKs are all in the store already is not pulled
+again. Each backup gets its APKs linked from the store (copied where links
+are not possible) into Apps/<package>/, and an apps.json listing every
+package's version, status and timing.
+
+Two devices backed up at once may need the same version: APKs are pulled
+into a folder of their own below apks/.incoming/ and moved into place once
+complete, so neither sees the other's partial files. After a run the store
+keeps the KEEP_VERSIONS most recently used versions of each package it
+backed up; backups keep their own links to older ones.
+"""
+import json
+import os
+import shlex
+import shutil
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from pixel_backup.scan import RemoteFile
+from pixel_backup.tar_stream import MAX_COMMAND_LENGTH
+from pixel_backup.transfer import ParallelPuller
+from pixel_backup.verify import run_device_commands, stat_device_files
+
+APK_STORE = "apks"
+INCOMING = ".incoming"
+APPS_FOLDER = "Apps"
+APPS_REPORT = "apps.json"
+# Versions of a package the store keeps
+KEEP_VERSIONS = 2
+# Versions used, and pulls started, this recently are never pruned
+STORE_GRACE = 24 * 60 * 60
+# Packages whose APKs are looked up by one `pm path` loop
+PATH_BATCH = 32
+UNKNOWN_VERSION = "unknown"
+
+# status of a package in a backup
+STORED = "stored"
+PULLED = "pulled"
+FAILED = "failed"
+
+AppPackage = namedtuple("AppPackage", ["name", "version", "apks"])
+AppResult = namedtuple("AppResult", ["package", "version", "status", "apks", "size", "pulled_bytes", "seconds",
+                                     "error"])
+
+
+def list_packages(adb, serial=None):
+    """package -> versionCode of the third-party apps on the device"""
+    _, output, _ = adb.shell("pm list packages -3 --show-versioncode", serial, timeout=60)
+    packages = {}
+    for line in output.decode("utf-8", "replace").splitlines():
+        if not line.startswith("package:"):
+            continue
+        name, _, version = line[len("package:"):].strip().partition(" versionCode:")
+        if name:
+            packages[name] = version.strip() or UNKNOWN_VERSION
+    return packages
+
+
+def build_path_commands(packages, batch=PATH_BATCH, max_length=MAX_COMMAND_LENGTH):
+    """`pm path` loops over batches of packages; each package's APK lines follow an @package line"""
+    loop = "for p in{}; do echo \"@$p\"; pm path \"$p\"; done"
+    commands = []
+    names = ""
+    count = 0
+    for name in packages:
+        argument = " " + shlex.quote(name)
+        if names and (count >= batch or len(loop) + len(names) + len(argument) > max_length):
+            commands.append(loop.format(names))
+            names = ""
+            count = 0
+        names += argument
+        count += 1
+    if names:
+        commands.append(loop.format(names))
+    return commands
+
+
+def apk_paths(adb, serial, packages, workers=4):
+    """package -> device paths of its APKs (base first, then splits)"""
+    paths = {}
+    current = None
+    # Enough batches to keep every worker busy: each `pm` call takes a moment to start
+    batch = max(1, min(PATH_BATCH, -(-len(packages) // workers)))
+    for line in run_device_commands(adb, serial, build_path_commands(packages, batch), workers):
+        line = line.strip()
+        if line.startswith("@"):
+            current = paths.setdefault(line[1:], [])
+        elif line.startswith("package:") and current is not None:
+            current.append(line[len("package:"):])
+    return paths
+
+
+def store_folder(store_root, package, version):
+    return os.path.join(store_root, package, version)
+
+
+def link_or_copy(source, target):
+    """Hard-link source to target, or copy it across file systems"""
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def prune_store(store_root, packages, keep=KEEP_VERSIONS, grace=STORE_GRACE):
+    """Remove all but the keep most recently used versions of packages, and abandoned pulls
+
+    Returns how many folders were removed.
+    """
+    cutoff = time.time() - grace
+    removed = 0
+    folders = []
+    for package in packages:
+        package_folder = os.path.join(store_root, package)
+        try:
+            versions = [os.path.join(package_folder, name) for name in os.listdir(package_folder)]
+        except OSError:
+            continue
+        versions.sort(key=os.path.getmtime, reverse=True)
+        folders.extend(versions[keep:])
+    incoming = os.path.join(store_root, INCOMING)
+    if os.path.isdir(incoming):
+        folders.extend(os.path.join(incoming, name) for name in os.listdir(incoming))
+    for folder in folders:
+        try:
+            if os.path.getmtime(folder) > cutoff:
+                continue
+            shutil.rmtree(folder)
+            removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+class AppBackup:
+    """Back up the APKs of a device's third-party apps, reusing those already in the store"""
+
+    def __init__(self, adb, serial=None, store_root="apks", workers=4, slots=None, reconnect=None):
+        self.adb = adb
+        self.serial = serial
+        self.store_root = store_root
+        self.workers = max(1, workers)
+        # Shared with other transfers on this host (see scheduler.HostLimits)
+        self.slots = slots
+        self.puller = ParallelPuller(adb, serial, workers=1, reconnect=reconnect)
+
+    def packages(self):
+        """AppPackage per third-party app, with a RemoteFile per APK"""
+        versions = list_packages(self.adb, self.serial)
+        paths = apk_paths(self.adb, self.serial, list(versions), self.workers)
+        stats = stat_device_files(self.adb, self.serial, [path for apks in paths.values() for path in apks],
+                                  self.workers)
+        packages = []
+        for name, version in versions.items():
+            apks = [RemoteFile(path, *stats[path]) for path in paths.get(name, []) if path in stats]
+            packages.append(AppPackage(name, version, apks))
+        return packages
+
+    def missing(self, package):
+        """(RemoteFile, store path) of the package's APKs the store does not hold yet"""
+        folder = store_folder(self.store_root, package.name, package.version)
+        missing = []
+        for entry in package.apks:
+            local = os.path.join(folder, entry.path.rsplit("/", 1)[-1])
+            # Without a versionCode nothing tells two builds apart
+            if package.version == UNKNOWN_VERSION or not os.path.isfile(local) \
+                    or os.path.getsize(local) != entry.size:
+                missing.append((entry, local))
+        return missing
+
+    def back_up(self, package, backup_folder, on_bytes=None, is_canceled=None):
+        """Pull what the store lacks of one package and link its APKs into the backup"""
+        if not package.apks:
+            return AppResult(package.name, package.version, FAILED, 0, 0, 0, 0.0, "no APK found")
+        started = time.monotonic()
+        size = sum(entry.size for entry in package.apks)
+        missing = self.missing(package)
+        error = None
+        if missing:
+            error = self.pull(missing, on_bytes, is_canceled)
+        if error is None:
+            target = os.path.join(backup_folder, APPS_FOLDER, package.name)
+            os.makedirs(target, exist_ok=True)
+            folder = store_folder(self.store_root, package.name, package.version)
+            try:
+                # Marks the version as used for prune_store
+                os.utime(folder)
+                for entry in package.apks:
+                    name = entry.path.rsplit("/", 1)[-1]
+                    link_or_copy(os.path.join(folder, name), os.path.join(target, name))
+            except OSError as e:
+                error = str(e)
+        status = FAILED if error else PULLED if missing else STORED
+        return AppResult(package.name, package.version, status, len(package.apks), size,
+                         sum(entry.size for entry, _ in missing) if status == PULLED else 0,
+                         round(time.monotonic() - started, 3), error)
+
+    def pull(self, missing, on_bytes=None, is_canceled=None):
+        """Pull (RemoteFile, store path) pairs through a folder of this pull's own; returns an error or None"""
+        incoming = os.path.join(self.store_root, INCOMING)
+        os.makedirs(incoming, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=incoming)
+        try:
+            staged = [(entry, os.path.join(staging, os.path.basename(local))) for entry, local in missing]
+            if self.slots:
+                with self.slots:
+                    results = self.puller.pull_unit(staged, on_bytes, is_canceled)
+            else:
+                results = self.puller.pull_unit(staged, on_bytes, is_canceled)
+            errors = [result.error for result in results if not result.ok]
+            if len(results) < len(missing):
+                errors.append("canceled")
+            if errors:
+                return errors[0]
+            for (_, local), (_, path) in zip(missing, staged):
+                os.makedirs(os.path.dirname(local), exist_ok=True)
+                os.replace(path, local)
+            return None
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def run(self, backup_folder, on_result=None, is_canceled=None, on_bytes=None):
+        """Back up every app and write apps.json; returns an AppResult per package, in backup order"""
+        packages = self.packages()
+        # Largest first, so one huge game does not finish last on its own
+        packages.sort(key=lambda package: sum(entry.size for entry, _ in self.missing(package)), reverse=True)
+        results = []
+        lock = threading.Lock()
+
+        def back_up(package):
+            if is_canceled and is_canceled():
+                return
+            try:
+                result = self.back_up(package, backup_folder, on_bytes, is_canceled)
+            except OSError as e:
+                result = AppResult(package.name, package.version, FAILED, len(package.apks), 0, 0, 0.0, str(e))
+            with lock:
+                results.append(result)
+                if on_result:
+                    on_result(result)
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            list(pool.map(back_up, packages))
+        prune_store(self.store_root, [package.name for package in packages])
+
+        os.makedirs(backup_folder, exist_ok=True)
+        with open(os.path.join(backup_folder, APPS_REPORT), "w", encoding="utf-8") as f:
+            json.dump({"packages": [result._asdict() for result in sorted(results)]}, f, indent=1)
+        return results
+
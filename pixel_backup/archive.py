@@ -0,0 +1,302 @@
+"""Indexed backup archives (.pba)
+
+Finding anything in a ZIP archive starts with its central directory at the
+end of the file, and adding to it rewrites that directory. A backup archive
+is two files instead:
+
+* name.pba holds the members' bytes back to back, each stored as-is or raw
+  deflated, with nothing in between
+* name.pba.idx is the index, a sequence of segments, one per write: a
+  fixed-size record per member (offset, sizes, CRC-32, mtime, method),
+  then the members' names, then nothing else
+
+Listing a backup reads only the index, a few dozen bytes per file. A member
+is read through a memory map of the data file, from its offset, so taking
+one photo out of a 50 GB archive reads only that photo. Appending writes
+new members after the existing data and one new segment after the existing
+index; nothing already written changes. A segment carries the length the
+data file had once its members were written and a CRC of its records, so an
+append that was cut off leaves a torn segment that is ignored, and data
+past the last good segment that the next append overwrites. The data file is
+synced to disk before its segment is written, so after a crash no good
+segment points past the data. A member added again under the same name
+replaces the earlier copy in the listing.
+"""
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import namedtuple
+
+from pixel_backup.compression import ParallelArchiveWriter, is_compressible
+
+ARCHIVE_SUFFIX = ".pba"
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"PBAINDX1"
+# Segment header: magic, member count, name bytes, data file length, CRC-32 of records and names
+SEGMENT = struct.Struct("<4sIIQI")
+SEGMENT_MAGIC = b"SEGM"
+# Member record: offset, stored size, size, CRC-32, mtime, method
+RECORD = struct.Struct("<QQQIqB")
+STORED = 0
+DEFLATED = 1
+BLOCK_SIZE = 1024 * 1024
+
+ArchiveEntry = namedtuple("ArchiveEntry", ["name", "offset", "stored_size", "size", "crc", "mtime", "method"])
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def is_indexed_archive(path):
+    """True if path is the data file of an indexed archive"""
+    try:
+        with open(index_path(path), "rb") as f:
+            return f.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+    except OSError:
+        return False
+
+
+def read_index(path):
+    """(name -> ArchiveEntry, data length) from the index of the archive at path
+
+    Reading stops at the first torn or damaged segment.
+    """
+    entries, data_end, _ = read_segments(path)
+    return entries, data_end
+
+
+def read_segments(path):
+    """Like read_index, plus the length of the index up to its last good segment"""
+    with open(index_path(path), "rb") as f:
+        data = f.read()
+    if not data.startswith(INDEX_MAGIC):
+        raise ValueError(f"{path} is not an indexed backup archive")
+    entries = {}
+    data_end = 0
+    position = len(INDEX_MAGIC)
+    while position + SEGMENT.size <= len(data):
+        magic, count, names_length, segment_end, crc = SEGMENT.unpack_from(data, position)
+        body_start = position + SEGMENT.size
+        body_end = body_start + count * RECORD.size + names_length
+        if magic != SEGMENT_MAGIC or body_end > len(data) or zlib.crc32(data[body_start:body_end]) != crc:
+            break
+        names = data[body_start + count * RECORD.size:body_end].decode("utf-8").split("\0")
+        segment = {name: ArchiveEntry(name, *record)
+                   for name, record in zip(names, RECORD.iter_unpack(data[body_start:body_start + count * RECORD.size]))}
+        # Replaced members move to the end, where the new copy is
+        for name in segment.keys() & entries.keys():
+            del entries[name]
+        entries.update(segment)
+        data_end = segment_end
+        position = body_end
+    return entries, data_end, position
+
+
+def remove_archive(path):
+    """Delete the data file and the index of an archive"""
+    for name in (path, index_path(path)):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+class MemberStream:
+    """Read-only stream of one member, inflated as it is read"""
+
+    def __init__(self, view, method):
+        self.view = view
+        self.position = 0
+        self.decompressor = zlib.decompressobj(-15) if method == DEFLATED else None
+        self.pending = b""
+
+    def read(self, size=-1):
+        if self.decompressor is None:
+            end = len(self.view) if size is None or size < 0 else min(len(self.view), self.position + size)
+            data = bytes(self.view[self.position:end])
+            self.position = end
+            return data
+        if size is None or size < 0:
+            data = self.pending + self.decompressor.decompress(self.view[self.position:]) + self.decompressor.flush()
+            self.position = len(self.view)
+            self.pending = b""
+            return data
+        while len(self.pending) < size and (self.position < len(self.view) or self.decompressor.unconsumed_tail):
+            if self.decompressor.unconsumed_tail:
+                chunk = self.decompressor.unconsumed_tail
+            else:
+                chunk = self.view[self.position:self.position + BLOCK_SIZE]
+                self.position += len(chunk)
+            self.pending += self.decompressor.decompress(chunk, max(size, BLOCK_SIZE))
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+    def close(self):
+        self.view.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class IndexedArchive:
+    """Read an indexed archive; members can be read from several threads at once"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries, self.data_end = read_index(path)
+        self._file = None
+        self._map = None
+        self._lock = threading.Lock()
+
+    def members(self):
+        """name -> ArchiveEntry, in the order they were added"""
+        return self.entries
+
+    def mapped(self):
+        with self._lock:
+            if self._map is None:
+                self._file = open(self.path, "rb")
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            return self._map
+
+    def view(self, name):
+        """The stored bytes of a member, straight from the memory map"""
+        entry = self.entries[name]
+        if entry.offset + entry.stored_size > self.data_end:
+            raise ValueError(f"{name} lies outside the archive data")
+        if not entry.stored_size:
+            return memoryview(b"")
+        return memoryview(self.mapped())[entry.offset:entry.offset + entry.stored_size]
+
+    def open(self, name):
+        return MemberStream(self.view(name), self.entries[name].method)
+
+    def read(self, name):
+        """A member's bytes; raises ValueError if they do not match its CRC"""
+        with self.open(name) as stream:
+            data = stream.read()
+        if zlib.crc32(data) != self.entries[name].crc:
+            raise ValueError(f"{name} is damaged (CRC mismatch)")
+        return data
+
+    def extract(self, name, folder):
+        """Write a member below folder under its name; returns the path"""
+        entry = self.entries[name]
+        target = os.path.join(folder, *name.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        crc = 0
+        with self.open(name) as stream, open(target, "wb") as f:
+            for block in iter(lambda: stream.read(BLOCK_SIZE), b""):
+                crc = zlib.crc32(block, crc)
+                f.write(block)
+        if crc != entry.crc:
+            raise ValueError(f"{name} is damaged (CRC mismatch)")
+        os.utime(target, (entry.mtime, entry.mtime))
+        return target
+
+    def extract_all(self, folder):
+        for name in self.entries:
+            self.extract(name, folder)
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._file.close()
+                self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class IndexedArchiveWriter(ParallelArchiveWriter):
+    """Write an indexed archive, or with append add to an existing one
+
+    Members become visible when close() writes their index segment; abort()
+    leaves an appended archive as it was.
+    """
+
+    def __init__(self, path, level="balanced", workers=None, max_pending_bytes=256 * 1024 * 1024, append=False):
+        self.appending = append and is_indexed_archive(path)
+        if self.appending:
+            _, self.start, index_end = read_segments(path)
+            # Drop what an interrupted append left behind
+            with open(index_path(path), "r+b") as f:
+                f.truncate(index_end)
+            self.data = open(path, "r+b")
+            self.data.truncate(self.start)
+            self.data.seek(self.start)
+        else:
+            self.start = 0
+            self.data = open(path, "wb")
+            with open(index_path(path), "wb") as f:
+                f.write(INDEX_MAGIC)
+        self.records = []
+        super().__init__(path, level, workers, max_pending_bytes)
+
+    def _record(self, path, arcname, offset, stored_size, size, crc, method):
+        self.records.append((arcname, (offset, stored_size, size, crc, int(os.path.getmtime(path)), method)))
+
+    def _write_file(self, path, arcname):
+        """Copy a file in blocks, deflating it on the way if it compresses"""
+        offset = self.data.tell()
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15) if is_compressible(path) else None
+        crc = 0
+        size = 0
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+                crc = zlib.crc32(block, crc)
+                size += len(block)
+                self.data.write(compressor.compress(block) if compressor else block)
+        if compressor:
+            self.data.write(compressor.flush())
+        self._record(path, arcname, offset, self.data.tell() - offset, size, crc,
+                     DEFLATED if compressor else STORED)
+
+    def _write_raw(self, path, arcname, data, crc, size, compressed):
+        offset = self.data.tell()
+        self.data.write(data)
+        self._record(path, arcname, offset, len(data), size, crc, DEFLATED if compressed else STORED)
+
+    def _close_archive(self):
+        # The members must be on disk before a segment points at them
+        self.data.flush()
+        os.fsync(self.data.fileno())
+        self.data.close()
+        if not self.records:
+            return
+        names = "\0".join(name for name, _ in self.records).encode("utf-8")
+        body = b"".join(RECORD.pack(*record) for _, record in self.records) + names
+        end = self.records[-1][1][0] + self.records[-1][1][1]
+        with open(index_path(self.path), "ab") as f:
+            f.write(SEGMENT.pack(SEGMENT_MAGIC, len(self.records), len(names), end, zlib.crc32(body)) + body)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _discard(self):
+        if not self.data.closed:
+            self.data.close()
+        if self.appending:
+            with open(self.path, "r+b") as f:
+                f.truncate(self.start)
+        else:
+            remove_archive(self.path)
+
+
+def pack_folder(folder, path, level="balanced", workers=None, append=False):
+    """Write (or with append, add) every file below folder to the indexed archive at path"""
+    writer = IndexedArchiveWriter(path, level, workers, append=append)
+    try:
+        writer.add_tree(folder)
+    except Exception:
+        writer.abort()
+        raise
+    writer.close()
+    return path
@@ -0,0 +1,180 @@
+"""Persistent catalog of backups and the files in them
+
+An SQLite database that outlives the application. Every finished backup is a
+row in `backups` (the history record), and every file it holds is a row in
+`files`: its device path, size, mtime, hash and the member name inside the
+backup folder, ZIP archive or repository snapshot.
+
+File contents are kept once in `contents` and referenced from `files`.
+Content is identified by the file's hash when the backup was verified, and by
+device path, size and mtime otherwise. Indexes on the file name and on the
+owning backup keep "which backups contain IMG_1234.jpg" to milliseconds with
+thousands of backups in the catalog; triggers keep a running total of unique
+content bytes, so that question is a single-row read.
+"""
+import os
+import posixpath
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    type TEXT NOT NULL,
+    size TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL DEFAULT 0,
+    location TEXT NOT NULL,
+    details TEXT NOT NULL DEFAULT '',
+    device TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS contents (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    backup_id INTEGER NOT NULL REFERENCES backups(id) ON DELETE CASCADE,
+    content_id INTEGER NOT NULL REFERENCES contents(id),
+    name TEXT NOT NULL,
+    path TEXT,
+    size INTEGER NOT NULL,
+    mtime INTEGER,
+    hash TEXT,
+    member TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    unique_bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals (id, unique_bytes) VALUES (1, 0);
+CREATE TRIGGER IF NOT EXISTS contents_added AFTER INSERT ON contents BEGIN
+    UPDATE totals SET unique_bytes = unique_bytes + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS contents_removed AFTER DELETE ON contents BEGIN
+    UPDATE totals SET unique_bytes = unique_bytes - OLD.size;
+END;
+CREATE INDEX IF NOT EXISTS backups_location ON backups(location);
+CREATE INDEX IF NOT EXISTS files_name ON files(name);
+CREATE INDEX IF NOT EXISTS files_backup ON files(backup_id);
+CREATE INDEX IF NOT EXISTS files_content ON files(content_id);
+"""
+
+
+def default_catalog_path():
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.path.join(base, "pixel_backup", "catalog.db")
+
+
+def content_key(path, size, mtime, file_hash=None):
+    """What makes two catalogued files the same content"""
+    if file_hash:
+        return f"sha256:{file_hash}"
+    return f"{path}\0{size}\0{mtime}"
+
+
+class BackupCatalog:
+    """The catalog database; safe to share between threads"""
+
+    def __init__(self, path=None):
+        self.path = path or default_catalog_path()
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self._lock, self.db:
+            self.db.execute("PRAGMA foreign_keys = ON")
+            self.db.execute("PRAGMA journal_mode = WAL")
+            self.db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+    def add_backup(self, record, files=()):
+        """Store a history record and its files; returns the new backup id
+
+        files are dicts with path (device path or None), size, mtime, hash
+        and member (the name inside the backup).
+        """
+        files = list(files)
+        with self._lock, self.db:
+            cursor = self.db.execute(
+                "INSERT INTO backups (date, type, size, size_bytes, location, details, device) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (record.get("date", ""), record.get("type", ""), record.get("size", ""),
+                 sum(f["size"] for f in files), record.get("location", ""), record.get("details", ""),
+                 record.get("device", "")))
+            backup_id = cursor.lastrowid
+            keys = [content_key(f["path"] or f["member"], f["size"], f["mtime"], f.get("hash")) for f in files]
+            self.db.executemany("INSERT OR IGNORE INTO contents (key, size) VALUES (?, ?)",
+                                ((key, f["size"]) for key, f in zip(keys, files)))
+            self.db.executemany(
+                "INSERT INTO files (backup_id, content_id, name, path, size, mtime, hash, member) "
+                "VALUES (?, (SELECT id FROM contents WHERE key = ?), ?, ?, ?, ?, ?, ?)",
+                ((backup_id, key, posixpath.basename(f["member"]), f["path"], f["size"], f["mtime"],
+                  f.get("hash"), f["member"]) for key, f in zip(keys, files)))
+        return backup_id
+
+    def remove_backup(self, backup_id):
+        """Forget a backup and its files, and any content no other backup holds"""
+        with self._lock, self.db:
+            content_ids = [row[0] for row in self.db.execute(
+                "SELECT DISTINCT content_id FROM files WHERE backup_id = ?", (backup_id,))]
+            self.db.execute("DELETE FROM backups WHERE id = ?", (backup_id,))
+            self.db.executemany(
+                "DELETE FROM contents WHERE id = ? AND NOT EXISTS (SELECT 1 FROM files WHERE content_id = ?)",
+                ((content_id, content_id) for content_id in content_ids))
+
+    def remove_location(self, location):
+        for backup in self.backups_at(location):
+            self.remove_backup(backup["id"])
+
+    def backups_at(self, location):
+        with self._lock:
+            return [dict(row) for row in self.db.execute(
+                "SELECT * FROM backups WHERE location = ?", (location,))]
+
+    def backups(self, after_id=0, limit=None):
+        """History records with ids above after_id, oldest first, at most limit of them"""
+        query = "SELECT * FROM backups WHERE id > ? ORDER BY id"
+        params = [after_id]
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [dict(row) for row in self.db.execute(query, params)]
+
+    def __len__(self):
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM backups").fetchone()[0]
+
+    def files(self, backup_id):
+        with self._lock:
+            return [dict(row) for row in self.db.execute(
+                "SELECT name, path, size, mtime, hash, member FROM files WHERE backup_id = ? ORDER BY member",
+                (backup_id,))]
+
+    def find(self, name, limit=1000):
+        """Backups holding a file called name (wildcards * and ? allowed), newest first
+
+        Returns dicts with the backup's fields plus the file's member, path,
+        size and mtime.
+        """
+        operator = "GLOB" if any(c in name for c in "*?[") else "="
+        with self._lock:
+            return [dict(row) for row in self.db.execute(
+                "SELECT b.*, f.member, f.path, f.size AS file_size, f.mtime "
+                f"FROM files f JOIN backups b ON b.id = f.backup_id WHERE f.name {operator} ? "
+                "ORDER BY b.id DESC LIMIT ?", (name, limit))]
+
+    def unique_bytes(self):
+        """Bytes of distinct file content across all backups"""
+        with self._lock:
+            return self.db.execute("SELECT unique_bytes FROM totals").fetchone()[0]
+
+    def total_bytes(self):
+        """Bytes of all catalogued files, counting every copy"""
+        with self._lock:
+            return self.db.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM backups").fetchone()[0]
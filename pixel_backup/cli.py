@@ -0,0 +1,585 @@
+"""Command-line entry point for headless backups
+
+    python -m pixel_backup devices
+    python -m pixel_backup pair 192.168.1.20:37123 482913
+    python -m pixel_backup --connect 192.168.1.20:41234 backup media --type documents
+    python -m pixel_backup backup full --dest ~/Pixel_Backups --incremental
+    python -m pixel_backup backup media --type photos --config nightly.json
+    python -m pixel_backup backup full --all-devices --max-transfers 8
+    python -m pixel_backup backup media --type photos --storage s3 --s3-endpoint http://nas:9000 --s3-bucket phone
+    python -m pixel_backup resume
+    python -m pixel_backup scan --type videos --from 2024-01-01
+    python -m pixel_backup find 'PXL_2024*.jpg'
+    python -m pixel_backup verify ~/Pixel_Backups/20250101_120000.zip
+    python -m pixel_backup restore ~/Pixel_Backups/20250101_120000.zip
+    python -m pixel_backup compress ~/Pixel_Backups/20250101_120000
+    python -m pixel_backup compress --format indexed --append -o ~/Pixel_Backups/all.pba ~/Pixel_Media/new
+    python -m pixel_backup list ~/Pixel_Backups/20250101_120000.pba
+    python -m pixel_backup extract ~/Pixel_Backups/20250101_120000.pba DCIM/Camera/PXL_0001.jpg -o ~/Desktop
+
+Options not given on the command line come from --config (a JSON object with
+BackupConfig keys), then from the BackupConfig defaults. Exit status is 0 on
+success, 1 when the backup failed and 2 when no device was found. Finished
+backups are recorded in the backup catalog, shared with the GUI's history.
+S3 storage takes its credentials from AWS_ACCESS_KEY_ID and
+AWS_SECRET_ACCESS_KEY.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import zlib
+from datetime import datetime
+
+from pixel_backup.adb_client import AdbClient, AdbError
+from pixel_backup.catalog import BackupCatalog
+from pixel_backup.engine import (MEDIA_TYPES, BackupConfig, BackupEngine, BackupListener, connect_pixel_device,
+                                 find_adb, find_pixel_devices, format_size)
+from pixel_backup.progress import format_duration
+
+MEDIA_CATEGORIES = ("photos", "videos", "documents", "music", "downloads", "other_media")
+FULL_STEPS = ("system_data", "apps", "contacts", "messages", "call_logs")
+
+
+class ConsoleListener(BackupListener):
+    """Print backup progress; transfer progress is redrawn once a second on a terminal"""
+
+    def __init__(self, quiet=False, interval=1.0):
+        self.quiet = quiet
+        self.interval = interval
+        self.errors = 0
+        self.tracker = None
+        self.stopped = threading.Event()
+        self.live = sys.stderr.isatty() and not quiet
+
+    def status(self, text):
+        self.write(text)
+
+    def details(self, text, level=None):
+        if level == "error":
+            self.errors += 1
+            print(f"error: {text}", file=sys.stderr)
+        elif not self.quiet:
+            self.write(f"  {text}")
+
+    def track(self, tracker, base=0, span=100):
+        self.tracker = tracker
+        if self.live:
+            self.stopped.clear()
+            threading.Thread(target=self.redraw, daemon=True).start()
+
+    def stop_tracking(self):
+        self.stopped.set()
+        if self.live and self.tracker is not None:
+            sys.stderr.write("\n")
+        self.tracker = None
+
+    def redraw(self):
+        while not self.stopped.wait(self.interval):
+            tracker = self.tracker
+            if tracker is None or not tracker.total_files:
+                continue
+            rate = tracker.sample()
+            sys.stderr.write(f"\r  {tracker.done_files}/{tracker.total_files} files, "
+                             f"{format_size(tracker.done_bytes)} of {format_size(tracker.total_bytes)}, "
+                             f"{format_size(rate)}/s, {format_duration(tracker.eta())} left   ")
+            sys.stderr.flush()
+
+    def write(self, text):
+        if not self.quiet:
+            print(text, file=sys.stderr)
+
+
+def build_config(args):
+    """BackupConfig from --config, overridden by the flags that were given"""
+    data = {}
+    if args.config:
+        with open(args.config) as f:
+            data = json.load(f)
+    for key in ("backup_location", "media_backup_location", "compression_level", "archive_format", "transfer_workers",
+                "transfer_mode", "adaptive_transfers", "max_transfer_workers", "bandwidth_limit", "wire_compression",
+                "storage", "s3_endpoint", "s3_bucket", "s3_prefix", "s3_region",
+                "date_from", "date_to", "incremental", "dedup", "compress", "verify",
+                "screenshots", "large_files", "raw_images", "uhd_videos"):
+        value = getattr(args, key, None)
+        if value is not None:
+            data[key] = value
+    if getattr(args, "only", None):
+        for key in MEDIA_CATEGORIES:
+            data[key] = key in args.only
+    if getattr(args, "skip", None):
+        for key in FULL_STEPS:
+            if key in args.skip:
+                data[key] = False
+    return BackupConfig.from_dict(data)
+
+
+def connect(args, config=None):
+    """Return (AdbClient, serial) of the Pixel to work on, or exit with status 2
+
+    --connect (or a Wi-Fi connection in config) attaches the device over
+    wireless debugging first.
+    """
+    adb = AdbClient(args.adb or find_adb())
+    try:
+        device = connect_pixel_device(adb, config or BackupConfig(), args.serial, args.connect)
+    except (AdbError, OSError, subprocess.SubprocessError) as e:
+        print(f"error: cannot reach adb: {e}", file=sys.stderr)
+        sys.exit(2)
+    if not device:
+        print("error: no Pixel device connected", file=sys.stderr)
+        sys.exit(2)
+    return adb, device[0]
+
+
+def cmd_devices(args):
+    adb = AdbClient(args.adb or find_adb())
+    if args.connect:
+        attach_wireless(adb, args.connect)
+    for info in adb.devices():
+        print(f"{info.serial}\t{info.state}\t{info.properties.get('model', '').replace('_', ' ')}")
+    return 0
+
+
+def attach_wireless(adb, address):
+    """Connect to address over Wi-Fi, printing why it failed; returns the serial or None"""
+    from pixel_backup.wireless import connect_wireless
+    try:
+        return connect_wireless(adb, address)
+    except (AdbError, OSError, subprocess.SubprocessError) as e:
+        print(f"error: cannot connect to {address}: {e}", file=sys.stderr)
+        return None
+
+
+def cmd_connect(args):
+    serial = attach_wireless(AdbClient(args.adb or find_adb()), args.address)
+    if serial is None:
+        return 2
+    print(f"connected to {serial}")
+    return 0
+
+
+def cmd_pair(args):
+    from pixel_backup.wireless import pair_wireless
+    try:
+        print(pair_wireless(AdbClient(args.adb or find_adb()), args.address, args.code))
+    except (AdbError, OSError, subprocess.SubprocessError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+def report(args, engine, listener, record):
+    """Print the finished backup's record; returns the exit status"""
+    stats = engine.media_transfer_stats
+    failed = listener.errors or (stats and stats['failed'])
+    if record is None:
+        return 1 if failed else 0
+    if args.json:
+        print(json.dumps(record))
+    else:
+        print(f"Backup completed: {record['location']} ({record['size']})")
+        if record['details']:
+            print(f"  {record['details']}")
+    return 1 if failed else 0
+
+
+def cmd_backup(args):
+    config = build_config(args)
+    if args.all_devices:
+        return backup_all_devices(args, config)
+    adb, serial = connect(args, config)
+    listener = ConsoleListener(args.quiet)
+    engine = BackupEngine(config, adb, serial, listener, catalog=BackupCatalog(args.catalog))
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    try:
+        if args.kind == "full":
+            record = engine.run_full_backup(os.path.join(config.backup_location, stamp))
+        else:
+            record = engine.run_media_backup(os.path.join(config.media_backup_location, f"{stamp}_{args.type}"),
+                                             args.type)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        engine.cancel()
+        print("Backup canceled", file=sys.stderr)
+        return 1
+    finally:
+        adb.close()
+    return report(args, engine, listener, record)
+
+
+def cmd_resume(args):
+    from pixel_backup.journal import TransferJournal, find_interrupted
+    folder = args.folder
+    if not folder:
+        location = args.media_backup_location or build_config(args).media_backup_location
+        interrupted = find_interrupted(location)
+        if not interrupted:
+            print(f"error: no interrupted media backup in {location}", file=sys.stderr)
+            return 1
+        folder = interrupted[0]
+    journal = TransferJournal.load(folder)
+    if journal is None:
+        print(f"error: no interrupted backup in {folder}", file=sys.stderr)
+        return 1
+    # Continue on the device the backup was started from
+    args.serial = args.serial or journal.header.get("serial")
+    config = build_config(args)
+    adb, serial = connect(args, config)
+    listener = ConsoleListener(args.quiet)
+    engine = BackupEngine(config, adb, serial, listener, catalog=BackupCatalog(args.catalog))
+    listener.status(f"Resuming {folder}")
+    try:
+        record = engine.resume_media_backup(folder)
+    except KeyboardInterrupt:
+        engine.cancel()
+        print("Backup canceled; run resume again to continue", file=sys.stderr)
+        return 1
+    finally:
+        adb.close()
+    return report(args, engine, listener, record)
+
+
+def backup_all_devices(args, config):
+    """Back up every connected Pixel at once, one line per device status change"""
+    from pixel_backup.scheduler import BackupScheduler, HostLimits
+    adb = AdbClient(args.adb or find_adb())
+    if args.connect:
+        attach_wireless(adb, args.connect)
+    devices = find_pixel_devices(adb)
+    if not devices:
+        print("error: no Pixel device connected", file=sys.stderr)
+        return 2
+
+    printed = {}
+
+    def on_update(job):
+        # Jobs report from their own threads; print each new message once
+        text = job.details if job.active and job.details else job.status
+        if not args.quiet and printed.get(job.serial) != text:
+            printed[job.serial] = text
+            print(f"[{job.serial}] {text}", file=sys.stderr)
+
+    limits = HostLimits(args.max_transfers, args.max_disk_writes, config.bandwidth_limit)
+    scheduler = BackupScheduler(adb, config, limits, on_update, catalog=BackupCatalog(args.catalog))
+    scheduler.submit_all(devices, args.kind, args.type)
+    try:
+        while not scheduler.wait(0.5):
+            pass
+    except KeyboardInterrupt:
+        scheduler.cancel_all()
+        scheduler.wait()
+        print("Backup canceled", file=sys.stderr)
+        return 1
+    finally:
+        adb.close()
+
+    failed = False
+    for job in scheduler.jobs():
+        stats = job.engine.media_transfer_stats
+        if job.state != "done" or (stats and stats['failed']):
+            failed = True
+        if args.json:
+            print(json.dumps(job.record or {"device": job.serial, "error": job.error or job.status}))
+        elif job.record:
+            print(f"{job.serial}: {job.record['location']} ({job.record['size']})")
+        else:
+            print(f"{job.serial}: {job.error or job.status}")
+    return 1 if failed else 0
+
+
+def cmd_scan(args):
+    config = build_config(args)
+    adb, serial = connect(args, config)
+    engine = BackupEngine(config, adb, serial)
+    count = 0
+    total = 0
+    try:
+        for entry in engine.scan_preview(args.type):
+            count += 1
+            total += entry.size
+            if args.json:
+                print(json.dumps({"path": entry.path, "size": entry.size, "mtime": entry.mtime}))
+            else:
+                date = datetime.fromtimestamp(entry.mtime).strftime("%Y-%m-%d %H:%M:%S")
+                print(f"{format_size(entry.size):>10}  {date}  {entry.path}")
+    finally:
+        adb.close()
+    if not args.json:
+        print(f"Found {count} matching files ({format_size(total)})", file=sys.stderr)
+    return 0
+
+
+def cmd_find(args):
+    catalog = BackupCatalog(args.catalog)
+    if args.stats:
+        print(f"{len(catalog)} backups, {format_size(catalog.total_bytes())} of files, "
+              f"{format_size(catalog.unique_bytes())} unique")
+        return 0
+    if not args.name:
+        print("error: give a file name or --stats", file=sys.stderr)
+        return 2
+    matches = catalog.find(args.name)
+    for match in matches:
+        if args.json:
+            print(json.dumps({key: match[key] for key in ("id", "date", "type", "location", "device", "member",
+                                                         "path", "file_size", "mtime")}))
+        else:
+            print(f"{match['date']}  {match['type']:<10} {match['location']}  {match['member']}")
+    if not args.json:
+        print(f"Found in {len({match['id'] for match in matches})} backups", file=sys.stderr)
+    return 0 if matches else 1
+
+
+def catalog_location(catalog, location):
+    """location the way the catalog recorded it, whether given relative or absolute"""
+    location = location.rstrip("/\\")
+    if not catalog.backups_at(location) and catalog.backups_at(os.path.abspath(location)):
+        return os.path.abspath(location)
+    return location
+
+
+def cmd_verify(args):
+    from pixel_backup.verify import MISMATCH, OK, UNREADABLE, BackupVerifier, catalog_references, summarize
+    catalog = BackupCatalog(args.catalog)
+    location = catalog_location(catalog, args.location)
+    serial, device_files, known_hashes = catalog_references(catalog, location)
+    adb = None
+    if device_files and not args.local:
+        # Compare with the device the backup was taken from
+        args.serial = args.serial or serial
+        adb, serial = connect(args)
+    try:
+        results = BackupVerifier(location, adb, serial).verify(device_files, known_hashes, full=args.full)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if adb is not None:
+            adb.close()
+    for result in results:
+        if args.json:
+            print(json.dumps(result._asdict()))
+        elif result.status != OK:
+            print(f"{result.status:<10} {result.member}" + (f"  ({result.detail})" if result.detail else ""))
+    print(summarize(results), file=sys.stderr)
+    return 1 if any(result.status in (MISMATCH, UNREADABLE) for result in results) else 0
+
+
+def cmd_restore(args):
+    from pixel_backup.engine import format_restore_stats
+    from pixel_backup.verify import catalog_references
+    catalog = BackupCatalog(args.catalog)
+    location = catalog_location(catalog, args.location)
+    # Restore to the device the backup was taken from unless told otherwise
+    args.serial = args.serial or catalog_references(catalog, location)[0]
+    config = build_config(args)
+    adb, serial = connect(args, config)
+    listener = ConsoleListener(args.quiet)
+    engine = BackupEngine(config, adb, serial, listener, catalog=catalog)
+    try:
+        stats = engine.restore_backup(location, args.target)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        engine.cancel()
+        print("Restore canceled", file=sys.stderr)
+        return 1
+    finally:
+        adb.close()
+    print(f"Restore completed: {format_restore_stats(stats)}")
+    return 1 if stats['failed'] else 0
+
+
+def cmd_compress(args):
+    from pixel_backup.archive import ARCHIVE_SUFFIX, pack_folder
+    from pixel_backup.compression import compress_folder
+    from pixel_backup.engine import get_folder_size
+    folder = os.path.abspath(args.folder).rstrip(os.sep)
+    if args.format == "indexed":
+        path = pack_folder(folder, args.output or f"{folder}{ARCHIVE_SUFFIX}", args.level, args.workers, args.append)
+    elif args.append:
+        print("error: only indexed archives can be appended to", file=sys.stderr)
+        return 1
+    else:
+        path = compress_folder(folder, args.output or f"{folder}.zip", args.level, args.workers)
+    print(f"{path} ({format_size(get_folder_size(path))})")
+    return 0
+
+
+def cmd_list(args):
+    from pixel_backup.restore import BackupReader
+    try:
+        members = BackupReader(args.location).members()
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    for member, (size, mtime) in members.items():
+        if args.json:
+            print(json.dumps({"member": member, "size": size, "mtime": mtime}))
+        else:
+            print(f"{datetime.fromtimestamp(mtime):%Y-%m-%d %H:%M}  {format_size(size):>10}  {member}")
+    print(f"{len(members)} files, {format_size(sum(size for size, _ in members.values()))}", file=sys.stderr)
+    return 0
+
+
+def cmd_extract(args):
+    from pixel_backup.restore import BackupReader
+    try:
+        reader = BackupReader(args.location)
+        members = reader.members()
+        missing = [member for member in args.members if member not in members]
+        if missing:
+            print(f"error: not in the backup: {', '.join(missing)}", file=sys.stderr)
+            return 1
+        for member in args.members or members:
+            print(reader.extract(member, args.output, members[member][1]))
+    except (OSError, ValueError, zlib.error) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def add_config_options(parser):
+    parser.add_argument("--config", help="JSON file with backup options")
+    parser.add_argument("--dest", dest="backup_location", help="folder for full backups")
+    parser.add_argument("--media-dest", dest="media_backup_location", help="folder for media backups")
+    parser.add_argument("--only", nargs="+", choices=MEDIA_CATEGORIES, help="media categories to include")
+    parser.add_argument("--skip-screenshots", dest="screenshots", action="store_const", const=True,
+                        help="leave Pictures/Screenshots out of photo backups")
+    parser.add_argument("--large-files", action="store_const", const=True, help="only files over 5MB")
+    parser.add_argument("--raw-images", action="store_const", const=True, help="only RAW (.dng) camera images")
+    parser.add_argument("--uhd-videos", action="store_const", const=True, help="only 4K videos")
+    parser.add_argument("--from", dest="date_from", help="first modification date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", help="last modification date (YYYY-MM-DD)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pixel_backup", description="Headless Google Pixel backups over ADB")
+    parser.add_argument("--adb", help="path to the adb executable")
+    parser.add_argument("-s", "--serial", help="device to use when several are connected")
+    parser.add_argument("--connect", metavar="ADDRESS",
+                        help="attach the device at host[:port] over wireless debugging first")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("devices", help="list connected devices").set_defaults(func=cmd_devices)
+
+    pair = commands.add_parser("pair", help="pair with a device over wireless debugging (once per host)")
+    pair.add_argument("address", help="host:port shown next to the pairing code")
+    pair.add_argument("code", help="six digit pairing code")
+    pair.set_defaults(func=cmd_pair)
+
+    connect_parser = commands.add_parser("connect", help="attach a device over wireless debugging")
+    connect_parser.add_argument("address", help="host[:port] shown under Wireless debugging")
+    connect_parser.set_defaults(func=cmd_connect)
+
+    backup = commands.add_parser("backup", help="run a full or media backup")
+    backup.add_argument("kind", choices=["full", "media"])
+    backup.add_argument("--type", choices=MEDIA_TYPES, default="custom", help="media backup type")
+    add_config_options(backup)
+    backup.add_argument("--skip", nargs="+", choices=FULL_STEPS, help="full backup steps to leave out")
+    backup.add_argument("--incremental", action="store_const", const=True, help="only new or changed media")
+    backup.add_argument("--dedup", action="store_const", const=True,
+                        help="store full backups in the deduplicating repository")
+    backup.add_argument("--no-compress", dest="compress", action="store_const", const=False)
+    backup.add_argument("--no-verify", dest="verify", action="store_const", const=False)
+    backup.add_argument("--level", dest="compression_level", choices=["fast", "balanced", "maximum"])
+    backup.add_argument("--archive-format", choices=["zip", "indexed"],
+                        help="archive compressed backups as ZIP or as an indexed archive (.pba)")
+    backup.add_argument("--workers", dest="transfer_workers", type=int, help="parallel transfers")
+    backup.add_argument("--mode", dest="transfer_mode", choices=["pull", "tar"])
+    backup.add_argument("--fixed-workers", dest="adaptive_transfers", action="store_const", const=False,
+                        help="keep --workers transfers in flight instead of adapting to the link")
+    backup.add_argument("--max-workers", dest="max_transfer_workers", type=int,
+                        help="most parallel transfers an adaptive transfer may use")
+    backup.add_argument("--bandwidth-limit", type=float, help="cap transfers at this many MB/s "
+                                                               "(across all devices with --all-devices)")
+    backup.add_argument("--wire-compression", choices=["auto", "always", "never"],
+                        help="gzip compressible files on their way from the device (auto: over Wi-Fi only)")
+    backup.add_argument("--storage", choices=["local", "s3"],
+                        help="local folders, or an S3-compatible bucket the backup is uploaded to as it is taken")
+    backup.add_argument("--s3-endpoint", help="object store URL, e.g. https://s3.eu-central-1.amazonaws.com")
+    backup.add_argument("--s3-bucket", help="bucket for --storage s3")
+    backup.add_argument("--s3-prefix", help="key prefix of the backups in the bucket")
+    backup.add_argument("--s3-region", help="region requests are signed for (default us-east-1)")
+    backup.add_argument("--all-devices", action="store_true", help="back up every connected Pixel at once")
+    backup.add_argument("--max-transfers", type=int, default=8,
+                        help="transfers in flight across all devices (with --all-devices)")
+    backup.add_argument("--max-disk-writes", type=int, default=2,
+                        help="backups archived or stored at the same time (with --all-devices)")
+    backup.add_argument("--catalog", help="backup catalog database (default: the one the GUI uses)")
+    backup.add_argument("--json", action="store_true", help="print the history record as JSON")
+    backup.add_argument("-q", "--quiet", action="store_true", help="only print errors and the result")
+    backup.set_defaults(func=cmd_backup)
+
+    resume = commands.add_parser("resume", help="finish an interrupted media backup")
+    resume.add_argument("folder", nargs="?", help="backup folder (default: the latest interrupted one)")
+    resume.add_argument("--media-dest", dest="media_backup_location", help="where to look for interrupted backups")
+    resume.add_argument("--catalog", help="backup catalog database (default: the one the GUI uses)")
+    resume.add_argument("--json", action="store_true", help="print the history record as JSON")
+    resume.add_argument("-q", "--quiet", action="store_true", help="only print errors and the result")
+    resume.set_defaults(func=cmd_resume, config=None)
+
+    scan = commands.add_parser("scan", help="list the files a media backup would include")
+    scan.add_argument("--type", choices=MEDIA_TYPES, default="custom")
+    add_config_options(scan)
+    scan.add_argument("--json", action="store_true", help="one JSON object per file")
+    scan.set_defaults(func=cmd_scan)
+
+    find = commands.add_parser("find", help="search the backup catalog for a file")
+    find.add_argument("name", nargs="?", help="file name; * and ? match any text and any character")
+    find.add_argument("--stats", action="store_true", help="show catalog totals instead")
+    find.add_argument("--catalog", help="backup catalog database (default: the one the GUI uses)")
+    find.add_argument("--json", action="store_true", help="one JSON object per match")
+    find.set_defaults(func=cmd_find)
+
+    verify = commands.add_parser("verify", help="check a backup folder or archive against the device")
+    verify.add_argument("location")
+    verify.add_argument("--full", action="store_true", help="hash every file again, not only changed ones")
+    verify.add_argument("--local", action="store_true",
+                        help="compare only with hashes from earlier verifications, without the device")
+    verify.add_argument("--catalog", help="backup catalog database (default: the one the GUI uses)")
+    verify.add_argument("--json", action="store_true", help="one JSON object per file")
+    verify.set_defaults(func=cmd_verify)
+
+    restore = commands.add_parser("restore", help="push a backup folder or archive back to the device")
+    restore.add_argument("location")
+    restore.add_argument("--target", help="device folder for files the catalog has no device path for "
+                                          "(default: /sdcard/Restored/<backup name>)")
+    restore.add_argument("--workers", dest="transfer_workers", type=int, help="parallel pushes")
+    restore.add_argument("--catalog", help="backup catalog database (default: the one the GUI uses)")
+    restore.add_argument("-q", "--quiet", action="store_true", help="only print errors and the result")
+    restore.set_defaults(func=cmd_restore, config=None)
+
+    compress = commands.add_parser("compress", help="compress a backup folder into an archive")
+    compress.add_argument("folder")
+    compress.add_argument("-o", "--output", help="archive path (default: folder.zip or folder.pba)")
+    compress.add_argument("--format", choices=["zip", "indexed"], default="zip",
+                          help="ZIP, or an indexed archive that lists instantly and can be appended to")
+    compress.add_argument("--append", action="store_true",
+                          help="add the folder to an existing indexed archive instead of replacing it")
+    compress.add_argument("--level", choices=["fast", "balanced", "maximum"], default="balanced")
+    compress.add_argument("--workers", type=int, default=None)
+    compress.set_defaults(func=cmd_compress)
+
+    list_parser = commands.add_parser("list", help="list the files in a backup folder or archive")
+    list_parser.add_argument("location")
+    list_parser.add_argument("--json", action="store_true", help="one JSON object per file")
+    list_parser.set_defaults(func=cmd_list)
+
+    extract = commands.add_parser("extract", help="copy files out of a backup folder or archive")
+    extract.add_argument("location")
+    extract.add_argument("members", nargs="*", help="paths as shown by list (default: all)")
+    extract.add_argument("-o", "--output", default=".", help="folder to extract into (default: current)")
+    extract.set_defaults(func=cmd_extract)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
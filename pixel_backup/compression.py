@@ -0,0 +1,208 @@
+"""Type-aware parallel ZIP compression
+
+JPEG, HEIC, MP4 and friends are already compressed, so deflating them burns
+CPU for nothing; they are stored as-is. Everything else is deflated on a
+thread pool (zlib releases the GIL) at a level that actually follows the
+"fast"/"balanced"/"maximum" setting, and a single writer thread appends the
+finished members to the archive.
+
+Files can be added while a transfer is still running, so compression
+overlaps with pulling instead of being a second full pass at the end. The
+archive can also go to a write-only stream, such as an upload to object
+storage (see object_store.py), instead of a file. The same pipeline writes
+indexed backup archives (see archive.py).
+"""
+import os
+import queue
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+COMPRESSION_LEVELS = {"fast": 1, "balanced": 6, "maximum": 9}
+
+INCOMPRESSIBLE_EXTENSIONS = {
+    ".jpg", ".jpeg", ".heic", ".heif", ".png", ".gif", ".webp", ".avif",
+    ".mp4", ".mov", ".mkv", ".webm", ".3gp", ".m4v",
+    ".mp3", ".m4a", ".aac", ".ogg", ".opus", ".flac",
+    ".zip", ".gz", ".tgz", ".xz", ".bz2", ".zst", ".7z", ".rar", ".apk", ".obb", ".jar",
+    ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".epub",
+}
+
+# Compressible files above this size are deflated by the writer while streaming
+# from disk instead of being held in memory by a worker
+LARGE_FILE_LIMIT = 64 * 1024 * 1024
+
+
+def is_compressible(name):
+    return os.path.splitext(name)[1].lower() not in INCOMPRESSIBLE_EXTENSIONS
+
+
+def deflate_file(path, level):
+    """Raw-deflate a whole file; returns (data, crc32, size, compressed)"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    data = compressor.compress(raw) + compressor.flush()
+    crc = zlib.crc32(raw) & 0xffffffff
+    if len(data) >= len(raw):
+        # Not worth it: keep the original bytes
+        return raw, crc, len(raw), False
+    return data, crc, len(raw), True
+
+
+class ParallelArchiveWriter:
+    """Build an archive from files added by any number of threads
+
+    Small compressible files are deflated by the pool; a single writer
+    thread stores members in the order they were queued. Subclasses store
+    them: _write_file for a file the writer reads itself (large or
+    incompressible), _write_raw for one a worker already compressed, and
+    _close_archive / _discard to finish or drop the archive at path.
+    """
+
+    def __init__(self, path, level="balanced", workers=None, max_pending_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.level = COMPRESSION_LEVELS.get(level, level if isinstance(level, int) else 6)
+        self.added = set()
+        self.pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 2)
+        self.pending = queue.Queue()
+        self.error = None
+        self._lock = threading.Lock()
+        self._budget = threading.Condition()
+        self._pending_bytes = 0
+        self._max_pending_bytes = max_pending_bytes
+        self._writer = threading.Thread(target=self._write_members, daemon=True)
+        self._writer.start()
+
+    def add(self, path, arcname):
+        """Queue a file for the archive; blocks while too much data is in flight"""
+        with self._lock:
+            if arcname in self.added:
+                return
+            self.added.add(arcname)
+        size = os.path.getsize(path)
+        if not is_compressible(path) or size > LARGE_FILE_LIMIT:
+            self.pending.put((path, arcname, None, 0))
+            return
+
+        # Bound memory: wait until enough compressed members have been written
+        with self._budget:
+            while self._pending_bytes and self._pending_bytes + size > self._max_pending_bytes:
+                self._budget.wait()
+            self._pending_bytes += size
+        self.pending.put((path, arcname, self.pool.submit(deflate_file, path, self.level), size))
+
+    def add_tree(self, folder):
+        """Queue every file below folder that has not been added yet"""
+        for root, _, names in os.walk(folder):
+            for name in names:
+                path = os.path.join(root, name)
+                self.add(path, os.path.relpath(path, folder).replace(os.sep, "/"))
+
+    def _write_members(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            path, arcname, future, size = item
+            try:
+                if future is None:
+                    self._write_file(path, arcname)
+                else:
+                    self._write_raw(path, arcname, *future.result())
+            except Exception as e:
+                self.error = self.error or e
+            finally:
+                if size:
+                    with self._budget:
+                        self._pending_bytes -= size
+                        self._budget.notify_all()
+
+    def _finish(self):
+        self.pending.put(None)
+        self._writer.join()
+        self.pool.shutdown()
+
+    def close(self):
+        """Finish the archive; raises the first error any member hit"""
+        self._finish()
+        if self.error:
+            self._discard()
+            raise self.error
+        self._close_archive()
+
+    def abort(self):
+        """Stop writing and remove the partial archive"""
+        try:
+            self._finish()
+        except Exception:
+            pass
+        self._discard()
+
+
+class ParallelZipWriter(ParallelArchiveWriter):
+    """Build a ZIP archive from files added by any number of threads
+
+    With fileobj the archive is written there, and zip_path only names it.
+    """
+
+    def __init__(self, zip_path, level="balanced", workers=None, max_pending_bytes=256 * 1024 * 1024,
+                 fileobj=None):
+        self.zip_path = zip_path
+        self.fileobj = fileobj
+        # zipfile writes data descriptors when the stream cannot seek back to a header
+        self.archive = zipfile.ZipFile(fileobj or zip_path, "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+        super().__init__(zip_path, level, workers, max_pending_bytes)
+
+    def _write_file(self, path, arcname):
+        compress_type = zipfile.ZIP_DEFLATED if is_compressible(path) else zipfile.ZIP_STORED
+        self.archive.write(path, arcname, compress_type, self.level)
+
+    def _write_raw(self, path, arcname, data, crc, size, compressed):
+        """Append a member whose data was already compressed by a worker
+
+        zipfile has no public API for precompressed members, so the local
+        header is written the same way ZipFile.write does it internally.
+        """
+        info = zipfile.ZipInfo.from_file(path, arcname)
+        info.compress_type = zipfile.ZIP_DEFLATED if compressed else zipfile.ZIP_STORED
+        info.CRC = crc
+        info.file_size = size
+        info.compress_size = len(data)
+        archive = self.archive
+        archive._writecheck(info)
+        archive._didModify = True
+        info.header_offset = archive.fp.tell()
+        archive.fp.write(info.FileHeader())
+        archive.fp.write(data)
+        archive.filelist.append(info)
+        archive.NameToInfo[info.filename] = info
+        archive.start_dir = archive.fp.tell()
+
+    def _close_archive(self):
+        self.archive.close()
+        if self.fileobj is not None:
+            self.fileobj.close()
+
+    def _discard(self):
+        try:
+            self.archive.close()
+        except Exception:
+            pass
+        if self.fileobj is not None:
+            self.fileobj.abort()
+        elif os.path.exists(self.zip_path):
+            os.remove(self.zip_path)
+
+
+def compress_folder(folder, zip_path, level="balanced", workers=None):
+    """Write folder into a ZIP archive at zip_path"""
+    writer = ParallelZipWriter(zip_path, level, workers)
+    try:
+        writer.add_tree(folder)
+    except Exception:
+        writer.abort()
+        raise
+    writer.close()
+    return zip_path
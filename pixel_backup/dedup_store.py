@@ -0,0 +1,234 @@
+"""Content-addressed deduplicating backup repository
+
+Layout of a repository folder:
+
+    repository.json          format marker and chunk size
+    objects/ab/abcdef...     file contents, one object per chunk, named by sha256
+    snapshots/<id>.json      one small index per backup: path -> size, mtime, chunks
+
+Files are cut into fixed-size chunks, so an unchanged 4 GB video costs a few
+hundred hash lookups on the next backup instead of another 4 GB on disk.
+Objects nobody references any more are removed by gc().
+
+Several devices can ingest into one repository while a backup is deleted.
+An ingest holds repository.lock shared until its snapshot is written, and gc
+holds it exclusively, so gc never sees chunks that a snapshot about to be
+written relies on. gc also leaves temporary files alone, and objects
+written within the last GC_GRACE seconds.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+REPOSITORY_FILE = "repository.json"
+LOCK_FILE = "repository.lock"
+CHUNK_SIZE = 4 * 1024 * 1024
+# Objects this young are never collected
+GC_GRACE = 60 * 60
+
+
+class ContentStore:
+    """A deduplicating repository of backup snapshots"""
+
+    VERSION = 1
+
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.snapshots_dir = os.path.join(root, "snapshots")
+        self.chunk_size = CHUNK_SIZE
+        try:
+            with open(os.path.join(root, REPOSITORY_FILE), "r", encoding="utf-8") as f:
+                self.chunk_size = json.load(f).get("chunk_size", CHUNK_SIZE)
+        except FileNotFoundError:
+            pass
+
+    @classmethod
+    def create(cls, root):
+        """Open the repository at root, initializing it if needed"""
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "snapshots"), exist_ok=True)
+        marker = os.path.join(root, REPOSITORY_FILE)
+        if not os.path.exists(marker):
+            with open(marker, "w", encoding="utf-8") as f:
+                json.dump({"version": cls.VERSION, "chunk_size": CHUNK_SIZE}, f)
+        return cls(root)
+
+    @staticmethod
+    def is_repository(path):
+        return os.path.isfile(os.path.join(path, REPOSITORY_FILE))
+
+    @classmethod
+    def for_snapshot(cls, location):
+        """Return the store a snapshot file belongs to, or None if location is not a snapshot"""
+        if not location.endswith(".json"):
+            return None
+        root = os.path.dirname(os.path.dirname(location))
+        if os.path.basename(os.path.dirname(location)) != "snapshots" or not cls.is_repository(root):
+            return None
+        return cls(root)
+
+    @contextmanager
+    def locked(self, exclusive=False):
+        """Hold the repository lock: shared while ingesting, exclusive while collecting garbage"""
+        f = open(os.path.join(self.root, LOCK_FILE), "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            else:
+                # No shared locks here: ingests take turns
+                while True:
+                    try:
+                        f.seek(0)
+                        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.1)
+            yield
+        finally:
+            f.close()
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def put_chunk(self, data):
+        """Store a chunk unless an identical one exists; returns (digest, bytes added)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per thread: several devices may be ingesting into one repository
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return digest, len(data)
+
+    def add_file(self, path):
+        """Store a file's contents; returns (chunk digests, new bytes written)"""
+        chunks = []
+        added = 0
+        with open(path, "rb") as f:
+            for data in iter(lambda: f.read(self.chunk_size), b""):
+                digest, new_bytes = self.put_chunk(data)
+                chunks.append(digest)
+                added += new_bytes
+        return chunks, added
+
+    def create_snapshot(self, folder, snapshot_id, snapshot_type="Full", on_file=None):
+        """Store every file below folder and write a snapshot index for them
+
+        Returns (snapshot path, snapshot dict).
+        """
+        with self.locked():
+            files = {}
+            added = 0
+            for root, _, names in os.walk(folder):
+                for name in names:
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    chunks, new_bytes = self.add_file(path)
+                    added += new_bytes
+                    files[os.path.relpath(path, folder).replace(os.sep, "/")] = {
+                        "size": stat.st_size,
+                        "mtime": int(stat.st_mtime),
+                        "chunks": chunks,
+                    }
+                    if on_file:
+                        on_file(path, stat.st_size)
+
+            snapshot = {
+                "id": snapshot_id,
+                "date": datetime.now().strftime("%Y-%m-%d %H:%M"),
+                "type": snapshot_type,
+                "size": sum(entry["size"] for entry in files.values()),
+                "added": added,
+                "files": files,
+            }
+            os.makedirs(self.snapshots_dir, exist_ok=True)
+            snapshot_path = os.path.join(self.snapshots_dir, f"{snapshot_id}.json")
+            tmp_path = snapshot_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, snapshot_path)
+            return snapshot_path, snapshot
+
+    def load_snapshot(self, snapshot_path):
+        with open(snapshot_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def snapshot_paths(self):
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        return sorted(os.path.join(self.snapshots_dir, name)
+                      for name in os.listdir(self.snapshots_dir) if name.endswith(".json"))
+
+    def restore(self, snapshot_path, dest):
+        """Rebuild the files of a snapshot below dest"""
+        snapshot = self.load_snapshot(snapshot_path)
+        for relpath, entry in snapshot["files"].items():
+            target = os.path.join(dest, *relpath.split("/"))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as out:
+                for digest in entry["chunks"]:
+                    with open(self.object_path(digest), "rb") as chunk:
+                        shutil.copyfileobj(chunk, out)
+            os.utime(target, (entry["mtime"], entry["mtime"]))
+        return len(snapshot["files"])
+
+    def snapshot_size(self, snapshot_path):
+        """Logical size of the files in a snapshot"""
+        return self.load_snapshot(snapshot_path)["size"]
+
+    def stored_size(self):
+        """Bytes actually used by stored objects"""
+        total = 0
+        for root, _, names in os.walk(self.objects_dir):
+            for name in names:
+                total += os.path.getsize(os.path.join(root, name))
+        return total
+
+    def delete_snapshot(self, snapshot_path):
+        """Remove a snapshot and the objects only it referenced"""
+        os.remove(snapshot_path)
+        return self.gc()
+
+    def gc(self, grace=GC_GRACE):
+        """Delete objects no snapshot references; returns (objects, bytes) freed
+
+        Objects written within the last grace seconds are kept.
+        """
+        with self.locked(exclusive=True):
+            referenced = set()
+            for path in self.snapshot_paths():
+                for entry in self.load_snapshot(path)["files"].values():
+                    referenced.update(entry["chunks"])
+
+            removed = 0
+            freed = 0
+            cutoff = time.time() - grace
+            for root, _, names in os.walk(self.objects_dir):
+                for name in names:
+                    if name in referenced or name.endswith(".tmp"):
+                        continue
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    if stat.st_mtime > cutoff:
+                        continue
+                    os.remove(path)
+                    freed += stat.st_size
+                    removed += 1
+        return removed, freed
@@ -0,0 +1,135 @@
+"""Event-driven device tracking
+
+Instead of running `adb devices` and `getprop` every time someone asks, a
+background thread holds a `host:track-devices-l` stream open to the adb server
+(or an `adb track-devices -l` process when there is no server socket). The
+server pushes the full device list whenever it changes, and the watcher keeps
+a table that callers can read instantly.
+"""
+import subprocess
+import threading
+from collections import namedtuple
+
+from pixel_backup.adb_client import AdbError, parse_device_list
+
+TrackedDevice = namedtuple("TrackedDevice", ["serial", "state", "model"])
+
+
+class DeviceWatcher:
+    """Keep a table of connected devices current in a background thread"""
+
+    def __init__(self, client, on_change=None, retry_interval=2.0):
+        self.client = client
+        self.on_change = on_change
+        self.retry_interval = retry_interval
+        self.error = None
+        self.ready = threading.Event()
+        self._devices = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stream = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        stream = self._stream
+        if stream is not None:
+            stream.close()
+
+    def devices(self):
+        """Current device table as a list of TrackedDevice"""
+        with self._lock:
+            return list(self._devices.values())
+
+    def get(self, serial):
+        with self._lock:
+            return self._devices.get(serial)
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.track()
+            except (AdbError, OSError, ValueError) as e:
+                self.error = "ADB not found" if isinstance(e, FileNotFoundError) else str(e)
+                self.update([])
+            # The stream ended: server restarted or adb went away; try again shortly
+            self._stop.wait(self.retry_interval)
+
+    def open_stream(self):
+        if self.client.server_available():
+            connection = self.client.connect()
+            try:
+                connection.send_request("host:track-devices-l")
+            except Exception:
+                connection.close()
+                raise
+            return TrackStream(connection.read_exactly, connection.close)
+        process = subprocess.Popen(self.client.command(None, "track-devices", "-l"),
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+        def read_exactly(count):
+            data = process.stdout.read(count)
+            if len(data) < count:
+                raise AdbError("adb track-devices ended")
+            return data
+
+        def close():
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            process.wait()
+
+        return TrackStream(read_exactly, close)
+
+    def track(self):
+        self._stream = self.open_stream()
+        try:
+            while not self._stop.is_set():
+                length = int(self._stream.read_exactly(4), 16)
+                text = self._stream.read_exactly(length).decode("utf-8", "replace") if length else ""
+                self.error = None
+                self.update(parse_device_list(text))
+        finally:
+            self._stream.close()
+            self._stream = None
+
+    def update(self, infos):
+        """Replace the table with a fresh device list and notify on changes"""
+        with self._lock:
+            previous = dict(self._devices)
+        table = {}
+        for info in infos:
+            known = previous.get(info.serial)
+            model = info.properties.get("model", "").replace("_", " ")
+            if not model and known is not None:
+                model = known.model
+            if not model and info.state == "device":
+                model = self.read_model(info.serial)
+            table[info.serial] = TrackedDevice(info.serial, info.state, model)
+
+        with self._lock:
+            self._devices = table
+        self.ready.set()
+        if table != previous and self.on_change:
+            self.on_change(list(table.values()))
+
+    def read_model(self, serial):
+        """Ask a newly connected device for its model when the list didn't include it"""
+        try:
+            _, output, _ = self.client.shell("getprop ro.product.model", serial, timeout=5)
+            return output.decode("utf-8", "replace").strip()
+        except (AdbError, OSError, subprocess.SubprocessError):
+            return ""
+
+
+class TrackStream:
+    """Length-prefixed device list stream from the server or an adb process"""
+
+    def __init__(self, read_exactly, close):
+        self.read_exactly = read_exactly
+        self.close = close
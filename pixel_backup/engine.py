@@ -0,0 +1,1041 @@
+"""Headless backup engine
+
+Everything a backup needs, driven by a plain BackupConfig instead of Tk
+variables, so the same code runs behind the GUI, from the command line and
+from cron. Nothing here imports tkinter or Pillow. Progress is reported to a
+BackupListener; the default one ignores everything and answers yes to every
+question.
+"""
+import os
+import shutil
+import sqlite3
+import subprocess
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+from pixel_backup.adb_client import AdbClient, AdbError
+from pixel_backup.apps import APK_STORE, FAILED, PULLED, STORED, AppBackup
+from pixel_backup.archive import ARCHIVE_SUFFIX, IndexedArchiveWriter, index_path, is_indexed_archive
+from pixel_backup.filters import MediaFilter
+from pixel_backup.journal import (JOURNAL_FILE, PARTIAL_SUFFIX, TransferJournal, partial_file, resume_file,
+                                  verify_prefix)
+from pixel_backup.manifest import BackupManifest, device_relpath, manifest_path, plan_transfers
+from pixel_backup.object_store import ObjectStore, UploadingPuller, is_remote_location
+from pixel_backup.progress import ProgressTracker
+from pixel_backup.providers import export_provider
+from pixel_backup.restore import BackupRestorer
+from pixel_backup.scan import DeviceScanner
+from pixel_backup.tar_stream import TarStreamPuller
+from pixel_backup.throttle import ConcurrencyController, RateLimiter
+from pixel_backup.transfer import ParallelPuller
+from pixel_backup.verify import MISMATCH, UNREADABLE, BackupVerifier, catalog_references, summarize, verify_streamed
+from pixel_backup.wireless import WirelessLink, connect_wireless, is_wireless_serial, wire_compression_enabled
+
+MEDIA_TYPES = ("photos", "videos", "documents", "custom")
+
+
+class BackupConfig:
+    """Backup options as plain values; the defaults match the GUI's"""
+
+    DEFAULTS = {
+        # Full backup steps
+        "system_data": True,
+        "apps": True,
+        "contacts": True,
+        "messages": True,
+        "call_logs": True,
+        # Media categories
+        "photos": True,
+        "videos": True,
+        "documents": True,
+        "music": True,
+        "downloads": True,
+        "other_media": True,
+        # Media filters (preview and media backups)
+        "date_from": None,
+        "date_to": None,
+        "large_files": False,
+        # True leaves Pictures/Screenshots out of photo backups
+        "screenshots": False,
+        "raw_images": False,
+        "uhd_videos": False,
+        # Locations
+        "backup_location": os.path.expanduser("~/Pixel_Backups"),
+        "media_backup_location": os.path.expanduser("~/Pixel_Media"),
+        # Settings
+        "verify": True,
+        "compress": True,
+        "compression_level": "balanced",
+        # "zip", or "indexed": an archive with a separate index that lists instantly and takes appends
+        "archive_format": "zip",
+        "incremental": False,
+        "dedup": False,
+        "transfer_workers": 4,
+        "transfer_mode": "pull",
+        # transfer_workers is where an adaptive transfer starts
+        "adaptive_transfers": True,
+        "max_transfer_workers": 16,
+        # MB/s, 0 for no cap
+        "bandwidth_limit": 0,
+        # "usb" or "wifi": which attached Pixel to prefer; wifi_address is connected when none is attached
+        "connection": "usb",
+        "wifi_address": "",
+        # gzip compressible files on the wire: "auto" (over Wi-Fi), "always" or "never"
+        "wire_compression": "auto",
+        # "local" folders, or "s3": straight into a bucket of an S3-compatible object store
+        "storage": "local",
+        "s3_endpoint": "",
+        "s3_bucket": "",
+        "s3_prefix": "pixel-backups",
+        "s3_region": "us-east-1",
+    }
+
+    def __init__(self, **options):
+        unknown = set(options) - set(self.DEFAULTS)
+        if unknown:
+            raise TypeError(f"unknown backup options: {', '.join(sorted(unknown))}")
+        for key, value in self.DEFAULTS.items():
+            setattr(self, key, options.get(key, value))
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a config from JSON-style data; dates are YYYY-MM-DD strings"""
+        data = dict(data)
+        for key in ("date_from", "date_to"):
+            if isinstance(data.get(key), str):
+                data[key] = datetime.strptime(data[key], "%Y-%m-%d")
+        return cls(**data)
+
+    def to_dict(self):
+        data = {key: getattr(self, key) for key in self.DEFAULTS}
+        for key in ("date_from", "date_to"):
+            if data[key] is not None:
+                data[key] = data[key].strftime("%Y-%m-%d")
+        return data
+
+
+class BackupListener:
+    """Receives progress from a running backup; override what you need"""
+
+    def status(self, text):
+        pass
+
+    def details(self, text, level=None):
+        """level is None, "ok", "warning" or "error\""""
+        pass
+
+    def progress(self, percent):
+        pass
+
+    def track(self, tracker, base=0, span=100):
+        """Progress from base to base + span now follows tracker (a ProgressTracker)"""
+        pass
+
+    def stop_tracking(self):
+        pass
+
+    def confirm(self, question):
+        """Asked when a step fails; returning False stops the backup"""
+        return True
+
+
+def format_size(size):
+    """Format size in bytes to human-readable format"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024.0:
+            return f"{size:.1f} {unit}"
+        size /= 1024.0
+    return f"{size:.1f} TB"
+
+
+def get_folder_size(path):
+    """Calculate total size of a folder, archive or repository snapshot"""
+    from pixel_backup.dedup_store import ContentStore
+    store = ContentStore.for_snapshot(path)
+    if store:
+        return store.snapshot_size(path)
+    if is_indexed_archive(path):
+        return os.path.getsize(path) + os.path.getsize(index_path(path))
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for entry in os.scandir(path):
+        if entry.is_file():
+            total += entry.stat().st_size
+        elif entry.is_dir():
+            total += get_folder_size(entry.path)
+    return total
+
+
+def find_adb():
+    """Locate ADB executable in common locations"""
+    paths = [
+        os.path.join(os.environ.get("ANDROID_HOME", ""), "platform-tools", "adb"),
+        "/usr/bin/adb",
+        "/usr/local/bin/adb",
+        "adb"  # Try system path
+    ]
+    for path in paths:
+        if os.path.exists(path):
+            return path
+    return "adb"  # Fallback to hoping it's in PATH
+
+
+def find_pixel_devices(adb):
+    """List (serial, model) for every connected, authorized Pixel"""
+    pixels = []
+    for info in adb.devices():
+        if info.state != 'device':
+            continue
+        model = info.properties.get("model", "").replace("_", " ")
+        if not model:
+            _, output, _ = adb.shell('getprop ro.product.model', info.serial, timeout=5)
+            model = output.decode('utf-8', 'replace').strip()
+        if "Pixel" in model:
+            pixels.append((info.serial, model))
+    return pixels
+
+
+def find_pixel_device(adb, serial=None, connection="usb"):
+    """Return (serial, model) of the connected Pixel to back up, or None
+
+    With serial, only that device is considered. Otherwise a Pixel attached
+    over connection ("usb" or "wifi") is preferred.
+    """
+    devices = [device for device in find_pixel_devices(adb) if not serial or device[0] == serial]
+    devices.sort(key=lambda device: is_wireless_serial(device[0]) != (connection == "wifi"))
+    return devices[0] if devices else None
+
+
+def connect_pixel_device(adb, config, serial=None, address=None):
+    """find_pixel_device for config, attaching a Pixel over Wi-Fi first when asked to
+
+    address defaults to a wireless serial, then to config.wifi_address when
+    config.connection is "wifi". A failed Wi-Fi connection is only
+    reported; a Pixel attached by USB may still be found.
+    """
+    connection = config.connection
+    if address is None and is_wireless_serial(serial):
+        address = serial
+    if address is None and connection == "wifi":
+        address = config.wifi_address
+    if address:
+        connection = "wifi"
+        try:
+            attached = connect_wireless(adb, address)
+            serial = serial or attached
+        except AdbError as e:
+            print(f"Wi-Fi connection to {address} failed: {e}")
+    return find_pixel_device(adb, serial, connection)
+
+
+def full_media_paths(config):
+    """(device folder, backup folder name) pairs pulled by a full backup"""
+    media_paths = []
+    if config.photos:
+        media_paths.append(("DCIM/Camera", "Photos"))
+    if config.videos:
+        media_paths.append(("Movies", "Videos"))
+    if config.documents:
+        media_paths.append(("Documents", "Documents"))
+    if config.music:
+        media_paths.append(("Music", "Music"))
+    if config.downloads:
+        media_paths.append(("Download", "Downloads"))
+    if config.other_media:
+        media_paths.append(("Pictures", "Other Pictures"))
+        media_paths.append(("Podcasts", "Podcasts"))
+    return media_paths
+
+
+def media_type_paths(config, media_type):
+    """(device folder, backup folder name) pairs pulled by a media backup"""
+    media_paths = []
+    if media_type == "photos":
+        media_paths.append(("DCIM/Camera", "Photos"))
+        if not config.screenshots:
+            media_paths.append(("Pictures/Screenshots", "Screenshots"))
+    elif media_type == "videos":
+        media_paths.append(("Movies", "Videos"))
+        media_paths.append(("DCIM/Camera", "Video Clips"))
+    elif media_type == "documents":
+        media_paths.append(("Documents", "Documents"))
+        media_paths.append(("Download", "Downloads"))
+    else:  # Custom
+        if config.photos:
+            media_paths.append(("DCIM/Camera", "Photos"))
+        if config.videos:
+            media_paths.append(("Movies", "Videos"))
+        if config.documents:
+            media_paths.append(("Documents", "Documents"))
+        if config.music:
+            media_paths.append(("Music", "Music"))
+        if config.downloads:
+            media_paths.append(("Download", "Downloads"))
+        if config.other_media:
+            media_paths.append(("Pictures", "Other Pictures"))
+    return media_paths
+
+
+def format_transfer_stats(stats):
+    """Describe how much a media backup transferred versus skipped"""
+    if not stats:
+        return ""
+    text = (f"Transferred {stats['transferred']} files ({format_size(stats['transferred_bytes'])}), "
+            f"skipped {stats['skipped']} unchanged ({format_size(stats['skipped_bytes'])})")
+    if stats.get('resumed'):
+        text += f", {stats['resumed']} finished before the interruption"
+    if stats['failed']:
+        text += f", {stats['failed']} failed"
+    return text
+
+
+def format_app_stats(results):
+    """Describe how many apps a backup pulled versus found in the APK store"""
+    if not results:
+        return ""
+    pulled = [result for result in results if result.status == PULLED]
+    stored = sum(1 for result in results if result.status == STORED)
+    failed = len(results) - len(pulled) - stored
+    text = (f"{len(results)} apps: {len(pulled)} pulled ({format_size(sum(result.pulled_bytes for result in pulled))}), "
+            f"{stored} already stored")
+    if failed:
+        text += f", {failed} failed"
+    return text
+
+
+def format_restore_stats(stats):
+    """Describe what a restore pushed versus found already on the device"""
+    text = (f"Pushed {stats['pushed']} files ({format_size(stats['pushed_bytes'])}), "
+            f"{stats['present']} already on the device")
+    if stats['skipped']:
+        text += f", {stats['skipped']} adb backup archives left out"
+    if stats['failed']:
+        text += f", {stats['failed']} failed"
+    return text
+
+
+class BackupEngine:
+    """Runs full and media backups for one device, and restores them
+
+    run_full_backup and run_media_backup return the history record of the
+    finished backup ({date, type, size, location, details}), or None if it
+    was canceled or found nothing to back up. With a catalog (a
+    BackupCatalog) the record and the files of the backup are stored in it,
+    and the record gets the catalog id.
+    """
+
+    def __init__(self, config, adb=None, serial=None, listener=None, limits=None, catalog=None):
+        self.config = config
+        self.adb = adb or AdbClient(find_adb())
+        self.serial = serial
+        self.listener = listener or BackupListener()
+        # Host-wide limits shared with other devices' engines (see scheduler.HostLimits)
+        self.limits = limits
+        self.catalog = catalog
+        self.canceled = False
+        self.media_transfer_stats = None
+        # AppResult per package of the last app backup
+        self.app_results = []
+        # Local path -> (RemoteFile, hash) of every media file pulled by this run
+        self.pulled_files = {}
+
+    def cancel(self):
+        self.canceled = True
+
+    def bandwidth_limiter(self):
+        """The host-wide bandwidth cap, else this backup's own, else None"""
+        if self.limits and self.limits.bandwidth:
+            return self.limits.bandwidth
+        if self.config.bandwidth_limit:
+            return RateLimiter(self.config.bandwidth_limit * 1024 * 1024)
+        return None
+
+    def counted_bytes(self, tracker):
+        """on_bytes callback feeding tracker and holding transfers under the bandwidth cap"""
+        limiter = self.bandwidth_limiter()
+        if limiter is None:
+            return tracker.add_bytes
+
+        def on_bytes(count):
+            tracker.add_bytes(count)
+            limiter.consume(count)
+        return on_bytes
+
+    def disk_write_slot(self):
+        """Held while archiving or storing a finished backup"""
+        return self.limits.disk_writes if self.limits else nullcontext()
+
+    def open_store(self):
+        """The ObjectStore backups are uploaded to, or None when they stay in local folders
+
+        Raises ValueError if the storage settings are incomplete.
+        """
+        if self.config.storage != "s3":
+            return None
+        return ObjectStore.from_config(self.config)
+
+    # -- full backup -----------------------------------------------------
+
+    def run_full_backup(self, backup_folder):
+        store = self.open_store()
+        try:
+            return self.full_backup(backup_folder, store)
+        finally:
+            if store is not None:
+                store.close()
+
+    def full_backup(self, backup_folder, store):
+        """run_full_backup, uploading to store (an open ObjectStore) unless it is None"""
+        config = self.config
+        listener = self.listener
+        self.media_transfer_stats = None
+        self.app_results = []
+        self.pulled_files = {}
+        # Object name of the backup below the store's prefix
+        name = os.path.relpath(backup_folder, config.backup_location).replace(os.sep, "/")
+        dedup = config.dedup
+        if dedup and store is not None:
+            listener.details("Deduplication needs local storage; uploading the backup without it", "warning")
+            dedup = False
+        os.makedirs(backup_folder, exist_ok=True)
+
+        # Initialize backup steps
+        backup_steps = []
+        if config.system_data:
+            backup_steps.append(("System Data", self.backup_system_data))
+        if config.apps:
+            backup_steps.append(("Apps", self.backup_apps))
+        if config.contacts:
+            backup_steps.append(("Contacts", self.backup_contacts))
+        if config.messages:
+            backup_steps.append(("Messages", self.backup_messages))
+        if config.call_logs:
+            backup_steps.append(("Call Logs", self.backup_call_logs))
+
+        # Media backups
+        media_backups = full_media_paths(config)
+
+        # Compress pulled media while the transfer is still running; with a store the archive is uploaded as it grows
+        archive_writer = None
+        on_file = None
+        if config.compress and not dedup:
+            if config.archive_format == "indexed" and store is None:
+                archive_writer = IndexedArchiveWriter(f"{backup_folder}{ARCHIVE_SUFFIX}", config.compression_level)
+            else:
+                if config.archive_format == "indexed":
+                    listener.details("Indexed archives need local storage; uploading a ZIP archive", "warning")
+                from pixel_backup.compression import ParallelZipWriter
+                archive_writer = ParallelZipWriter(f"{backup_folder}.zip", config.compression_level,
+                                                   fileobj=store.open_upload(f"{name}.zip") if store else None)
+            on_file = lambda path: archive_writer.add(path, os.path.relpath(path, backup_folder).replace(os.sep, "/"))
+        # Uncompressed media streams from the device straight into the store
+        media_store = store if archive_writer is None else None
+
+        media_tracker = ProgressTracker()
+        if media_backups:
+            backup_steps.append(("Media", lambda folder: self.backup_media(media_backups, folder, media_tracker,
+                                                                           on_file, media_store)))
+
+        total_steps = len(backup_steps)
+        current_step = 0
+
+        # Execute each backup step
+        for step_name, step_func in backup_steps:
+            if self.canceled:
+                break
+
+            current_step += 1
+            listener.status(f"Backing up {step_name} ({current_step}/{total_steps})")
+            listener.progress((current_step - 1) * 100 / total_steps)
+            if step_name == "Media":
+                # The media step reports bytes, so it fills its share of the bar smoothly
+                listener.track(media_tracker, (current_step - 1) * 100 / total_steps, 100 / total_steps)
+
+            try:
+                start_time = time.time()
+                listener.details(f"Starting {step_name} backup...")
+
+                # Execute the backup step
+                result = step_func(backup_folder)
+                listener.stop_tracking()
+
+                if not result:
+                    listener.details(f"Failed to backup {step_name}", "error")
+                    if listener.confirm(f"Failed to backup {step_name}. Continue?"):
+                        continue
+                    else:
+                        break
+
+                elapsed = time.time() - start_time
+                listener.details(f"{step_name} backup completed in {elapsed:.1f} seconds", "ok")
+                listener.progress(current_step * 100 / total_steps)
+
+            except Exception as e:
+                listener.stop_tracking()
+                listener.details(f"Error during {step_name} backup: {str(e)}", "error")
+                if not listener.confirm(f"Error during {step_name} backup. Continue?"):
+                    break
+
+        if self.canceled:
+            if archive_writer:
+                archive_writer.abort()
+            return None
+
+        # Finalize backup; the catalog lists the files before they are archived
+        details = ", ".join(filter(None, [format_app_stats(self.app_results),
+                                          format_transfer_stats(self.media_transfer_stats)]))
+        files = self.catalog_files(backup_folder)
+        staging_folder = backup_folder
+        size = None
+        if dedup:
+            # The repository stores files by content, so they are checked on the way in
+            if config.verify:
+                details = ", ".join(filter(None, [details, self.verify_backup(
+                    backup_folder, backup_folder, config.backup_location, files, store=False)]))
+            listener.status("Storing backup in repository...")
+            listener.details("Deduplicating files...")
+
+            try:
+                from pixel_backup.dedup_store import ContentStore
+                with self.disk_write_slot():
+                    store = ContentStore.create(os.path.join(config.backup_location, "repository"))
+                    snapshot_path, snapshot = store.create_snapshot(backup_folder, os.path.basename(backup_folder))
+
+                # Remove the staging folder once the snapshot is written
+                shutil.rmtree(backup_folder)
+                backup_folder = snapshot_path
+                details = ", ".join(filter(None, [details, f"{format_size(snapshot['added'])} new data stored"]))
+            except Exception as e:
+                listener.details(f"Repository storage failed: {str(e)}", "warning")
+        elif store is not None:
+            try:
+                backup_folder, size, summary = self.finish_upload(store, name, backup_folder, archive_writer, files)
+                details = ", ".join(filter(None, [details, summary]))
+            except Exception as e:
+                if archive_writer:
+                    archive_writer.abort()
+                listener.details(f"Upload failed: {str(e)}; the backup stays in {backup_folder}", "warning")
+        elif archive_writer:
+            listener.status("Compressing backup...")
+            listener.details(f"Finishing {'indexed' if config.archive_format == 'indexed' else 'ZIP'} archive...")
+
+            try:
+                # Media is already in the archive; add what the other steps wrote
+                with self.disk_write_slot():
+                    archive_writer.add_tree(backup_folder)
+                    archive_writer.close()
+
+                # Remove original folder if the archive succeeded
+                shutil.rmtree(backup_folder)
+                backup_folder = archive_writer.path
+            except Exception as e:
+                archive_writer.abort()
+                listener.details(f"Compression failed: {str(e)}", "warning")
+
+        if config.verify and not dedup and store is None and not self.canceled:
+            details = ", ".join(filter(None, [details, self.verify_backup(
+                backup_folder, staging_folder, config.backup_location, files)]))
+
+        return self.history_record('Full', backup_folder, details, files, size)
+
+    def finish_upload(self, store, name, staging_folder, zip_writer, files):
+        """Complete a full backup to object storage; returns (location, size, verification summary)
+
+        The archive has been uploading since the transfer started, or, without
+        compression, the media went straight into objects and the rest of the
+        staging folder follows it. The staging folder is checked against the
+        device before it is removed.
+        """
+        config = self.config
+        listener = self.listener
+        summary = ""
+        if zip_writer:
+            listener.status("Compressing backup...")
+            listener.details("Finishing ZIP archive upload...")
+            with self.disk_write_slot():
+                zip_writer.add_tree(staging_folder)
+                zip_writer.close()
+            if config.verify and not self.canceled:
+                summary = self.verify_backup(staging_folder, staging_folder, config.backup_location, files,
+                                             store=False)
+            location, size = store.url(f"{name}.zip"), zip_writer.fileobj.size
+        else:
+            listener.status("Uploading backup...")
+            size = sum(uploaded for _, uploaded in store.upload_tree(staging_folder, name))
+            size += sum(entry.size for entry, _ in self.pulled_files.values())
+            if config.verify and not self.canceled:
+                summary = self.verify_upload(staging_folder, files)
+            location = store.url(name)
+        shutil.rmtree(staging_folder)
+        return location, size, summary
+
+    def history_record(self, backup_type, location, details, files=(), size=None):
+        """The history entry of a finished backup; size is measured at location unless given"""
+        record = {
+            'date': datetime.now().strftime("%Y-%m-%d %H:%M"),
+            'type': backup_type,
+            'size': format_size(get_folder_size(location) if size is None else size),
+            'location': location,
+            'details': details,
+            'device': self.serial or ""
+        }
+        if self.catalog is not None:
+            try:
+                record['id'] = self.catalog.add_backup(record, files)
+            except Exception as e:
+                self.listener.details(f"Could not record backup in the catalog: {str(e)}", "warning")
+        return record
+
+    def catalog_files(self, backup_folder):
+        """Catalog entries for every file below backup_folder; pulled media keep their device path
+
+        Media streamed to object storage never reached the folder and is
+        listed from pulled_files.
+        """
+        files = []
+        listed = set()
+        for root, _, names in os.walk(backup_folder):
+            for name in names:
+                if name == JOURNAL_FILE or name.endswith(PARTIAL_SUFFIX):
+                    continue
+                local = os.path.join(root, name)
+                stat = os.stat(local)
+                entry, file_hash = self.pulled_files.get(local, (None, None))
+                listed.add(local)
+                files.append({
+                    'path': entry.path if entry else None,
+                    'size': stat.st_size,
+                    'mtime': entry.mtime if entry else int(stat.st_mtime),
+                    'hash': file_hash,
+                    'member': os.path.relpath(local, backup_folder).replace(os.sep, "/"),
+                })
+        for local, (entry, file_hash) in self.pulled_files.items():
+            if local not in listed and not os.path.exists(local):
+                files.append({
+                    'path': entry.path,
+                    'size': entry.size,
+                    'mtime': entry.mtime,
+                    'hash': file_hash,
+                    'member': os.path.relpath(local, backup_folder).replace(os.sep, "/"),
+                })
+        return files
+
+    def verify_backup(self, location, backup_folder, backup_root, files=(), store=True):
+        """Compare the backup at location with the device files it was pulled from
+
+        location is backup_folder or the archive it was packed into. The
+        hashes go into the manifest below backup_root, pulled_files and the
+        catalog entries in files. Every mismatch is reported; returns a
+        summary for the history details.
+        """
+        listener = self.listener
+        listener.status("Verifying backup...")
+        device_files = {os.path.relpath(local, backup_folder).replace(os.sep, "/"): entry
+                        for local, (entry, _) in self.pulled_files.items()}
+        tracker = ProgressTracker()
+        listener.track(tracker)
+        try:
+            verifier = BackupVerifier(location, self.adb, self.serial)
+            results = verifier.verify(device_files, on_bytes=tracker.add_bytes,
+                                      on_total=tracker.set_totals, on_file=tracker.add_file,
+                                      is_canceled=lambda: self.canceled, store=store)
+        except Exception as e:
+            listener.details(f"Verification failed: {str(e)}", "warning")
+            return ""
+        finally:
+            listener.stop_tracking()
+
+        hashes = {result.member: result.local_hash for result in results}
+        for catalog_file in files:
+            catalog_file['hash'] = hashes.get(catalog_file['member'], catalog_file['hash'])
+
+        manifest = BackupManifest.load(manifest_path(backup_root, self.serial), self.serial)
+        for local, (entry, _) in list(self.pulled_files.items()):
+            file_hash = hashes.get(os.path.relpath(local, backup_folder).replace(os.sep, "/"))
+            self.pulled_files[local] = (entry, file_hash)
+            known = manifest.files.get(device_relpath(entry.path))
+            if known is not None and known["mtime"] == entry.mtime:
+                known["hash"] = file_hash
+        # A bad copy must not let the next incremental run skip the file
+        for result in results:
+            if result.status in (MISMATCH, UNREADABLE) and result.device_path:
+                manifest.forget(result.device_path)
+        manifest.save()
+        return self.report_verification(results)
+
+    def verify_upload(self, backup_folder, files=()):
+        """Compare the media streamed to object storage with the device files it came from
+
+        Every file was hashed on its way to the store, which checks the
+        payload hash of each signed request, so the hashes stand for what
+        was stored. Returns a summary for the history details.
+        """
+        listener = self.listener
+        listener.status("Verifying backup...")
+        device_files = {}
+        hashes = {}
+        for local, (entry, file_hash) in self.pulled_files.items():
+            member = os.path.relpath(local, backup_folder).replace(os.sep, "/")
+            device_files[member] = entry
+            hashes[member] = file_hash
+        try:
+            results = verify_streamed(self.adb, self.serial, device_files, hashes, lambda: self.canceled)
+        except Exception as e:
+            listener.details(f"Verification failed: {str(e)}", "warning")
+            return ""
+        return self.report_verification(results)
+
+    def report_verification(self, results):
+        """Report every mismatch of a verification; returns its summary"""
+        listener = self.listener
+        for result in results:
+            if result.status == MISMATCH:
+                listener.details(f"{result.member} does not match {result.device_path or 'its earlier copy'}",
+                                 "error")
+            elif result.status == UNREADABLE:
+                listener.details(f"{result.member} could not be read: {result.detail}", "error")
+        summary = summarize(results)
+        listener.details(summary, "error" if any(r.status in (MISMATCH, UNREADABLE) for r in results) else "ok")
+        return summary
+
+    def backup_system_data(self, backup_folder):
+        """Backup system data using ADB"""
+        try:
+            backup_file = os.path.join(backup_folder, "system_data.ab")
+            result = subprocess.run(self.adb.command(self.serial, 'backup', '-f', backup_file, '-system'),
+                                  capture_output=True, text=True, timeout=300)
+            return result.returncode == 0
+        except Exception as e:
+            print(f"System data backup error: {str(e)}")
+            return False
+
+    def backup_apps(self, backup_folder):
+        """Backup the APKs of all user apps; APKs stored by an earlier backup are not pulled again"""
+        config = self.config
+        listener = self.listener
+        link = WirelessLink(self.adb, self.serial) if is_wireless_serial(self.serial) else None
+        limiter = self.bandwidth_limiter()
+        apps = AppBackup(self.adb, self.serial, os.path.join(config.backup_location, APK_STORE),
+                         config.transfer_workers, self.limits.transfers if self.limits else None,
+                         link.reconnect if link else None)
+
+        def on_result(result):
+            if result.status == FAILED:
+                listener.details(f"{result.package}: {result.error}", "error")
+            elif result.status == PULLED:
+                listener.details(f"{result.package} {result.version}: {result.apks} APKs "
+                                 f"({format_size(result.pulled_bytes)}) in {result.seconds:.1f}s")
+
+        try:
+            self.app_results = apps.run(backup_folder, on_result, lambda: self.canceled,
+                                        limiter.consume if limiter else None)
+        except (AdbError, OSError) as e:
+            print(f"Apps backup error: {str(e)}")
+            return False
+        listener.details(format_app_stats(self.app_results))
+        # One app that could not be pulled does not fail the step
+        return not self.app_results or any(result.status != FAILED for result in self.app_results)
+
+    def backup_contacts(self, backup_folder):
+        """Export contacts from the contacts provider into contacts.db"""
+        return self.backup_provider("contacts", "Contacts", backup_folder)
+
+    def backup_messages(self, backup_folder):
+        """Export SMS messages from the telephony provider into messages.db"""
+        return self.backup_provider("messages", "Messages", backup_folder)
+
+    def backup_call_logs(self, backup_folder):
+        """Export the call log into call_logs.db"""
+        return self.backup_provider("call_logs", "Call logs", backup_folder)
+
+    def backup_provider(self, kind, label, backup_folder):
+        """Fetch the rows added since the last backup and copy the device's whole database into the backup"""
+        try:
+            start = time.monotonic()
+            added, removed, total = export_provider(self.adb, self.serial, self.config.backup_location, kind,
+                                                    backup_folder, lambda: self.canceled)
+        except (AdbError, OSError, sqlite3.Error) as e:
+            print(f"{label} backup error: {str(e)}")
+            return False
+        self.listener.details(f"{label}: {added} new rows, {removed} removed in {time.monotonic() - start:.1f}s, "
+                              f"{total} in total")
+        return True
+
+    def backup_media(self, media_paths, backup_folder, tracker=None, on_file=None, store=None):
+        """Backup media files from device"""
+        try:
+            media_folder = os.path.join(backup_folder, "Media")
+            os.makedirs(media_folder, exist_ok=True)
+
+            self.media_transfer_stats = self.pull_media(media_paths, media_folder, self.config.backup_location, tracker,
+                                                        on_file, store=store)
+            return True
+        except Exception as e:
+            print(f"Media backup error: {str(e)}")
+            return False
+
+    # -- media backup ----------------------------------------------------
+
+    def run_media_backup(self, backup_folder, media_type, journal=None):
+        """Back up media_type into backup_folder, journaling every file that arrives
+
+        journal is given when resuming (see resume_media_backup). The journal
+        stays in the folder until a run ends with every file backed up. With
+        S3 storage the files stream into the bucket instead, under the name of
+        backup_folder, and a failed run is started again rather than resumed.
+        """
+        store = self.open_store()
+        try:
+            return self.media_backup(backup_folder, media_type, journal, store)
+        finally:
+            if store is not None:
+                store.close()
+
+    def media_backup(self, backup_folder, media_type, journal, store):
+        """run_media_backup, streaming to store (an open ObjectStore) unless it is None"""
+        listener = self.listener
+        self.pulled_files = {}
+        media_paths = media_type_paths(self.config, media_type)
+        if store is None:
+            os.makedirs(backup_folder, exist_ok=True)
+            if journal is None:
+                journal = TransferJournal.create(backup_folder, self.serial, media_type, self.config)
+
+        listener.details("Comparing device files with the last backup..."
+                         if self.config.incremental else "Counting files...")
+
+        tracker = ProgressTracker()
+        listener.track(tracker)
+        try:
+            stats = self.pull_media(media_paths, backup_folder, self.config.media_backup_location, tracker,
+                                    media_filter=MediaFilter.from_config(self.config), journal=journal, store=store)
+        finally:
+            listener.stop_tracking()
+            if journal is not None:
+                journal.close()
+        self.media_transfer_stats = stats
+
+        if self.canceled:
+            return None
+        if not stats['failed'] and journal is not None:
+            journal.finish()
+        if stats['transferred'] == 0 and stats['skipped'] == 0 and not stats['resumed'] and not stats['failed']:
+            listener.details("No files found to backup!", "warning")
+            return None
+        details = format_transfer_stats(stats)
+        files = self.catalog_files(backup_folder)
+        if store is not None:
+            if self.config.verify:
+                details = ", ".join(filter(None, [details, self.verify_upload(backup_folder, files)]))
+            name = os.path.relpath(backup_folder, self.config.media_backup_location).replace(os.sep, "/")
+            return self.history_record(media_type.capitalize(), store.url(name), details, files,
+                                       sum(catalog_file['size'] for catalog_file in files))
+        if self.config.verify:
+            details = ", ".join(filter(None, [details, self.verify_backup(
+                backup_folder, backup_folder, self.config.media_backup_location, files)]))
+        return self.history_record(media_type.capitalize(), backup_folder, details, files)
+
+    def resume_media_backup(self, backup_folder):
+        """Finish an interrupted media backup in backup_folder, with the options it was started with"""
+        journal = TransferJournal.load(backup_folder)
+        if journal is None:
+            raise ValueError(f"No interrupted backup in {backup_folder}")
+        serial = journal.header.get("serial")
+        if serial and self.serial and serial != self.serial:
+            raise ValueError(f"{backup_folder} is a backup of device {serial}")
+        self.config = BackupConfig.from_dict(journal.header["config"])
+        return self.run_media_backup(backup_folder, journal.header["media_type"], journal)
+
+    def pull_media(self, media_paths, backup_folder, backup_root, tracker=None, on_file=None, media_filter=None,
+                   journal=None, store=None):
+        """Pull media_paths with parallel workers, recording every file in the device manifest
+
+        In incremental mode only files that are new or changed since the last
+        backup to backup_root are pulled. tracker (a ProgressTracker) receives
+        byte and file counts from the transfer as it runs, and on_file is
+        called with the local path of every file as soon as it has arrived.
+        With media_filter (a MediaFilter) only the files it matches are listed.
+        With journal (a TransferJournal) every arrived file is journaled, and
+        when resuming, files it lists as done are kept and partial files
+        continued where they stopped. With store (an ObjectStore) nothing is
+        written below backup_folder: every file streams into the object named
+        by its path below backup_root, and is hashed on the way.
+        """
+        config = self.config
+        tracker = tracker or ProgressTracker()
+        manifest = BackupManifest.load(manifest_path(backup_root, self.serial), self.serial)
+        scanner = DeviceScanner(self.adb, self.serial)
+
+        # Compare the device listing of every category with the manifest
+        to_pull = []
+        skipped = []
+        seen = set()
+        for path, name in media_paths:
+            source = f'/sdcard/{path}'
+            listing = media_filter.scan(scanner, source) if media_filter else scanner.scan([source])
+            entries = [entry for entry in listing if entry.path not in seen]
+            seen.update(entry.path for entry in entries)
+            pulls, skips = plan_transfers(manifest if config.incremental else None, entries, source,
+                                          os.path.join(backup_folder, name))
+            to_pull.extend(pulls)
+            skipped.extend(skips)
+
+        # What an interrupted run already finished or left half written
+        finished = []
+        partials = []
+        if journal is not None and journal.loaded:
+            remaining = []
+            for entry, local in to_pull:
+                if journal.is_done(entry, local):
+                    finished.append((entry, local))
+                    continue
+                partial = partial_file(entry, local)
+                if partial and verify_prefix(self.adb, self.serial, entry.path, *partial):
+                    partials.append((entry, local) + partial)
+                    continue
+                if partial and partial[0] != local:
+                    # Does not match the device any more: pull it again from the start
+                    os.remove(partial[0])
+                remaining.append((entry, local))
+            to_pull = remaining
+
+        tracker.set_totals(sum(entry.size for entry, _ in to_pull)
+                           + sum(entry.size - length for entry, _, _, length in partials),
+                           len(to_pull) + len(partials))
+
+        slots = self.limits.transfers if self.limits else None
+        controller = None
+        link = None
+        if config.transfer_mode == "tar" and store is None:
+            puller = TarStreamPuller(self.adb, self.serial, slots=slots)
+        elif store is not None:
+            if config.adaptive_transfers:
+                controller = ConcurrencyController(config.transfer_workers,
+                                                   maximum=max(config.max_transfer_workers, config.transfer_workers))
+            link = WirelessLink(self.adb, self.serial) if is_wireless_serial(self.serial) else None
+            puller = UploadingPuller(self.adb, store, backup_root, self.serial, workers=config.transfer_workers,
+                                     slots=slots, controller=controller, reconnect=link.reconnect if link else None)
+        else:
+            if config.adaptive_transfers:
+                controller = ConcurrencyController(config.transfer_workers,
+                                                   maximum=max(config.max_transfer_workers, config.transfer_workers))
+            link = WirelessLink(self.adb, self.serial) if is_wireless_serial(self.serial) else None
+            compress = wire_compression_enabled(config, self.adb, self.serial)
+            if compress:
+                self.listener.details("Compressing documents and other compressible files on the wire")
+            puller = ParallelPuller(self.adb, self.serial, workers=config.transfer_workers, slots=slots,
+                                    keep_partial=journal is not None, controller=controller,
+                                    reconnect=link.reconnect if link else None, compress=compress)
+        on_bytes = self.counted_bytes(tracker)
+        pulled = {entry.path: entry for entry, _ in to_pull}
+        pulled.update((entry.path, entry) for entry, _, _, _ in partials)
+        offsets = {entry.path: length for entry, _, _, length in partials}
+
+        def on_result(result):
+            tracker.add_result(result)
+            if result.ok:
+                if journal is not None:
+                    journal.record(pulled[result.remote], result.local)
+                if on_file:
+                    on_file(result.local)
+
+        results = []
+        for entry, local, path, length in partials:
+            if self.canceled:
+                break
+            with slots or nullcontext():
+                result = resume_file(self.adb, self.serial, entry, local, path, length, on_bytes,
+                                     lambda: self.canceled)
+            on_result(result)
+            results.append(result)
+        results.extend(puller.transfer(to_pull, on_result=on_result, is_canceled=lambda: self.canceled,
+                                       on_bytes=on_bytes))
+        if controller is not None and controller.history:
+            self.listener.details(f"Settled on {controller.limit} parallel transfers")
+        if link is not None and link.reconnects:
+            self.listener.details(f"Reconnected to {self.serial} {link.reconnects} times", "warning")
+
+        stats = {'transferred': 0, 'transferred_bytes': 0, 'failed': 0,
+                 'skipped': len(skipped), 'skipped_bytes': sum(entry.size for entry in skipped),
+                 'resumed': len(finished)}
+        # Hashes are filled in by verify_backup once the backup is complete, unless taken while uploading
+        hashes = puller.hashes if store is not None else {}
+        for entry, local in finished:
+            manifest.record(entry, os.path.relpath(local, backup_root))
+            self.pulled_files[local] = (entry, None)
+        for result in results:
+            if result.ok:
+                file_hash = hashes.get(result.local)
+                manifest.record(pulled[result.remote], os.path.relpath(result.local, backup_root), file_hash)
+                self.pulled_files[result.local] = (pulled[result.remote], file_hash)
+                stats['transferred'] += 1
+                # A continued partial file only moved its missing part
+                stats['transferred_bytes'] += result.size - offsets.get(result.remote, 0)
+            else:
+                stats['failed'] += 1
+                print(f"Failed to backup {result.remote}: {result.error}")
+        # A canceled backup is thrown away (or resumed from its journal), so its copies are not remembered
+        if not self.canceled:
+            manifest.save()
+        return stats
+
+    # -- restore ---------------------------------------------------------
+
+    def restore_backup(self, location, target=None):
+        """Push the files of the backup folder or archive at location back to the device
+
+        Files go to the device paths the catalog recorded for them, the rest
+        below target. Only files the device is missing or holds in another
+        version are pushed. Returns the restore stats.
+        """
+        if is_remote_location(location):
+            raise ValueError(f"{location} is in object storage; download it to restore from it")
+        listener = self.listener
+        device_files = {}
+        if self.catalog is not None:
+            _, device_files, _ = catalog_references(self.catalog, location)
+        restorer = BackupRestorer(location, self.adb, self.serial, self.config.transfer_workers,
+                                  self.limits.transfers if self.limits else None)
+
+        listener.status("Comparing the backup with the device...")
+        to_push, present, skipped = restorer.plan(device_files, target)
+        listener.details(f"{len(to_push)} files to push, {len(present)} already on the device")
+
+        tracker = ProgressTracker(sum(item.size for item in to_push), len(to_push))
+        listener.status("Restoring backup...")
+        listener.track(tracker)
+
+        def on_result(result):
+            tracker.add_result(result)
+            if not result.ok:
+                listener.details(f"Failed to restore {result.local}: {result.error}", "error")
+
+        try:
+            results = restorer.push(to_push, on_result, self.counted_bytes(tracker), lambda: self.canceled)
+        finally:
+            listener.stop_tracking()
+        pushed = [result for result in results if result.ok]
+        return {'pushed': len(pushed), 'pushed_bytes': sum(result.size for result in pushed),
+                'present': len(present), 'skipped': len(skipped), 'failed': len(results) - len(pushed)}
+
+    # -- preview ---------------------------------------------------------
+
+    def scan_preview(self, media_type, on_path=None):
+        """Yield a RemoteFile for every file a media backup preview shows
+
+        These are the files run_media_backup would pull, through the same
+        filter. on_path is called with each device folder before it is searched.
+        """
+        media_filter = MediaFilter.from_config(self.config)
+        scanner = DeviceScanner(self.adb, self.serial)
+        seen = set()
+        for path, _ in media_type_paths(self.config, media_type):
+            source = f'/sdcard/{path}'
+            if on_path:
+                on_path(source)
+            for entry in media_filter.scan(scanner, source):
+                if entry.path not in seen:
+                    seen.add(entry.path)
+                    yield entry
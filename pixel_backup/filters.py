@@ -0,0 +1,82 @@
+"""Media filters compiled into the device-side scan
+
+A MediaFilter turns the advanced filters of a BackupConfig (large files, RAW
+images, 4K videos and the date range) into `find` predicates once, so the
+device only reports matching files. Both the preview and the media backup
+scan through the same filter, so a filtered backup pulls exactly the files
+the preview listed.
+
+`find -mmin` counts whole minutes back from the moment the device runs it, so
+the date predicates are given a minute of slack and the exact bounds are then
+checked on the host against the timestamps computed here, an integer
+comparison per file.
+"""
+import fnmatch
+import math
+import posixpath
+import time
+from datetime import timedelta
+
+LARGE_FILE_SIZE = 5 * 1024 * 1024
+RAW_PATTERN = "*.dng"
+UHD_PATTERN = "*4k*"
+
+
+class MediaFilter:
+    """The advanced media filters, compiled for the device folders they apply to"""
+
+    def __init__(self, large_files=False, raw_images=False, uhd_videos=False, date_from=None, date_to=None,
+                 now=None):
+        self.large_files = large_files
+        self.raw_images = raw_images
+        self.uhd_videos = uhd_videos
+        # Bounds as epoch seconds; date_to names the last day included, so its bound is the midnight after it
+        self.date_from = date_from.timestamp() if date_from else None
+        self.date_to = (date_to + timedelta(days=1)).timestamp() if date_to else None
+        self.now = time.time() if now is None else now
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.large_files, config.raw_images, config.uhd_videos, config.date_from, config.date_to)
+
+    def patterns(self, path):
+        """Name patterns every file below device folder path has to match"""
+        patterns = []
+        if self.raw_images and "DCIM" in path:
+            patterns.append(RAW_PATTERN)
+        if self.uhd_videos and ("Movies" in path or "DCIM" in path):
+            patterns.append(UHD_PATTERN)
+        return patterns
+
+    def find_args(self, path):
+        """`find` predicates selecting the matching files below path"""
+        find_args = []
+        if self.large_files:
+            find_args.extend(['-size', '+5M'])
+        for pattern in self.patterns(path):
+            find_args.extend(['-name', pattern])
+        if self.date_from is not None:
+            minutes = math.ceil((self.now - self.date_from) / 60) + 1
+            find_args.extend(['-mmin', f'-{max(minutes, 1)}'])
+        if self.date_to is not None and self.date_to < self.now:
+            minutes = math.floor((self.now - self.date_to) / 60) - 1
+            if minutes > 0:
+                find_args.extend(['-mmin', f'+{minutes}'])
+        return find_args
+
+    def matches(self, entry, path):
+        """Exact check of a RemoteFile found below device folder path"""
+        if self.large_files and entry.size <= LARGE_FILE_SIZE:
+            return False
+        if self.date_from is not None and entry.mtime < self.date_from:
+            return False
+        if self.date_to is not None and entry.mtime >= self.date_to:
+            return False
+        name = posixpath.basename(entry.path)
+        return all(fnmatch.fnmatchcase(name, pattern) for pattern in self.patterns(path))
+
+    def scan(self, scanner, path):
+        """Yield the matching files below path from a DeviceScanner"""
+        for entry in scanner.scan([path], self.find_args(path)):
+            if self.matches(entry, path):
+                yield entry
@@ -0,0 +1,173 @@
+"""Transfer journal for resumable media backups
+
+A media backup appends one JSON line to `.transfer_journal` in its folder for
+every file that arrives, after a header line describing the backup (device,
+media type, options). Appending costs one small write per file and survives a
+crash, a pulled cable or Cancel. The journal is removed when a backup
+finishes with nothing left to pull.
+
+Resuming re-lists the device with the options from the header. Files the
+journal lists as done are skipped if they still match the device. Files left
+half written are checked before they are continued: the device hashes the
+same leading bytes (`head -c N | md5sum`), and only the rest is streamed with
+`tail -c +N+1`. An interrupted 100 GB backup then costs only what was missing.
+"""
+import hashlib
+import json
+import os
+import shlex
+import threading
+from datetime import datetime
+
+from pixel_backup.adb_client import AdbError
+from pixel_backup.transfer import TransferResult, continue_pull
+
+JOURNAL_FILE = ".transfer_journal"
+PARTIAL_SUFFIX = ".part"
+
+
+def journal_path(folder):
+    return os.path.join(folder, JOURNAL_FILE)
+
+
+def find_interrupted(location):
+    """Backup folders below location with an unfinished journal, newest first"""
+    try:
+        names = sorted(os.listdir(location), reverse=True)
+    except OSError:
+        return []
+    folders = [os.path.join(location, name) for name in names]
+    return [folder for folder in folders if os.path.isfile(journal_path(folder))]
+
+
+class TransferJournal:
+    """Files of one media backup that have fully arrived"""
+
+    def __init__(self, folder, header, done=None):
+        self.folder = folder
+        self.path = journal_path(folder)
+        self.header = header
+        # device path -> {size, mtime, local, hash}
+        self.done = done or {}
+        # Loaded from disk: the backup is being resumed
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._file = None
+
+    @classmethod
+    def create(cls, folder, serial, media_type, config):
+        """Start the journal of a new backup in folder"""
+        header = {"version": 1, "serial": serial, "media_type": media_type, "config": config.to_dict(),
+                  "started": datetime.now().strftime("%Y-%m-%d %H:%M")}
+        journal = cls(folder, header)
+        os.makedirs(folder, exist_ok=True)
+        with open(journal.path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+        return journal
+
+    @classmethod
+    def load(cls, folder):
+        """The journal of an interrupted backup in folder, or None if there is none"""
+        path = journal_path(folder)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return None
+        if not lines:
+            return None
+        header = json.loads(lines[0])
+        done = {}
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line may have been cut off by the crash
+                continue
+            done[record.pop("path")] = record
+        journal = cls(folder, header, done)
+        journal.loaded = True
+        return journal
+
+    def is_done(self, entry, local):
+        """True if entry (a RemoteFile) arrived in an earlier run and is unchanged on both ends"""
+        record = self.done.get(entry.path)
+        if record is None or record["size"] != entry.size or record["mtime"] != entry.mtime:
+            return False
+        try:
+            return os.path.getsize(local) == entry.size
+        except OSError:
+            return False
+
+    def record(self, entry, local, file_hash=None):
+        """Note that entry has fully arrived at local; safe to call from any thread"""
+        record = {"path": entry.path, "size": entry.size, "mtime": entry.mtime,
+                  "local": os.path.relpath(local, self.folder), "hash": file_hash}
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            self.done[entry.path] = record
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def finish(self):
+        """The backup is complete: the journal is no longer needed"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def partial_file(entry, local):
+    """(path, length) of what an interrupted transfer left of entry at local, or None"""
+    for path in (local + PARTIAL_SUFFIX, local):
+        try:
+            length = os.path.getsize(path)
+        except OSError:
+            continue
+        if 0 < length <= entry.size:
+            return path, length
+        return None
+    return None
+
+
+def local_md5(path, length, buffer_size=1024 * 1024):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        remaining = length
+        while remaining:
+            block = f.read(min(buffer_size, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+
+def verify_prefix(client, serial, remote, path, length):
+    """True if the first length bytes of local path match the device file"""
+    status, output, _ = client.shell(f"head -c {length} {shlex.quote(remote)} | md5sum", serial, timeout=None)
+    if status != 0 or not output.strip():
+        return False
+    return output.split()[0].decode("ascii", "replace") == local_md5(path, length)
+
+
+def resume_file(client, serial, entry, local, path, length, on_bytes=None, is_canceled=None):
+    """Append the rest of entry to the verified partial file path and move it to local"""
+    try:
+        if length < entry.size:
+            continue_pull(client, serial, entry.path, path, length, on_bytes, is_canceled)
+        if os.path.getsize(path) != entry.size:
+            return TransferResult(entry.path, local, entry.size, False, "size changed during backup")
+        os.replace(path, local)
+        os.utime(local, (entry.mtime, entry.mtime))
+    except (AdbError, OSError) as e:
+        return TransferResult(entry.path, local, entry.size, False, str(e))
+    return TransferResult(entry.path, local, entry.size, True, None)
@@ -0,0 +1,142 @@
+"""Per-device manifests for incremental media backups
+
+A manifest remembers every device file that has been backed up (keyed by its
+path relative to /sdcard) with the size and mtime it had at the time, and where
+the copy lives. The next run only pulls files that are new or whose size or
+mtime changed. Entries point into the backup that holds the copy, so deleting
+a backup has to forget them (forget_backup), or the next run would skip
+files whose only copy is gone.
+"""
+import hashlib
+import json
+import os
+
+MANIFEST_DIR = ".manifests"
+DEVICE_ROOT = "/sdcard/"
+# A backup folder keeps its name as a ZIP or indexed archive and as a repository snapshot
+PACKED_SUFFIXES = (".zip", ".pba", ".json")
+
+
+def manifest_path(backup_root, serial):
+    """Location of the manifest for one device below a backup location"""
+    safe_serial = "".join(c if c.isalnum() or c in "-_." else "_" for c in serial or "unknown")
+    return os.path.join(backup_root, MANIFEST_DIR, f"{safe_serial}.json")
+
+
+def device_relpath(path):
+    """Path of a device file relative to /sdcard"""
+    if path.startswith(DEVICE_ROOT):
+        return path[len(DEVICE_ROOT):]
+    return path.lstrip("/")
+
+
+def hash_file(path, algorithm="sha256", buffer_size=1024 * 1024):
+    """Hash a local file in large blocks"""
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(buffer_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BackupManifest:
+    """Files already backed up from one device"""
+
+    VERSION = 1
+
+    def __init__(self, path, serial=None, files=None):
+        self.path = path
+        self.serial = serial
+        self.files = files or {}
+
+    @classmethod
+    def load(cls, path, serial=None):
+        """Load a manifest, or start an empty one if none exists yet"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(path, serial)
+        return cls(path, data.get("serial", serial), data.get("files", {}))
+
+    def save(self):
+        """Write the manifest atomically so a crash never leaves half a file"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "serial": self.serial, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
+
+    def is_changed(self, entry):
+        """True if a device file (RemoteFile) is new or differs from the recorded copy"""
+        known = self.files.get(device_relpath(entry.path))
+        return known is None or known["size"] != entry.size or known["mtime"] != entry.mtime
+
+    def forget(self, device_path):
+        """Drop the entry of a device file, so the next run pulls it again"""
+        self.files.pop(device_relpath(device_path), None)
+
+    def forget_backup(self, name):
+        """Drop every entry whose copy lives in the backup folder called name; returns how many"""
+        dropped = [path for path, known in self.files.items()
+                   if known.get("location") and known["location"].replace(os.sep, "/").split("/", 1)[0] == name]
+        for path in dropped:
+            del self.files[path]
+        return len(dropped)
+
+    def record(self, entry, location, file_hash=None):
+        """Remember that a device file was backed up to location"""
+        self.files[device_relpath(entry.path)] = {
+            "size": entry.size,
+            "mtime": entry.mtime,
+            "hash": file_hash,
+            "location": location,
+        }
+
+
+def backup_name(location):
+    """Name of the backup folder a backup location (folder, archive or snapshot) was made from"""
+    name = os.path.basename(location.rstrip("/" + os.sep))
+    for suffix in PACKED_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def forget_backup(backup_root, location):
+    """Remove a deleted backup's files from the manifests of every device below backup_root"""
+    folder = os.path.join(backup_root, MANIFEST_DIR)
+    if not os.path.isdir(folder):
+        return 0
+    name = backup_name(location)
+    dropped = 0
+    for file_name in os.listdir(folder):
+        if not file_name.endswith(".json"):
+            continue
+        manifest = BackupManifest.load(os.path.join(folder, file_name))
+        count = manifest.forget_backup(name)
+        if count:
+            manifest.save()
+            dropped += count
+    return dropped
+
+
+def plan_transfers(manifest, entries, source, dest_folder):
+    """Split a device listing of source into files to pull and files to skip
+
+    Files are placed the way `adb pull <source> <dest_folder>` would lay them
+    out, so incremental and full backups share the same folder structure.
+    Without a manifest every file is pulled. Returns (to_pull, skipped);
+    to_pull holds (RemoteFile, local_path) pairs.
+    """
+    source = source.rstrip("/")
+    base = os.path.join(dest_folder, os.path.basename(source))
+    to_pull = []
+    skipped = []
+    for entry in entries:
+        if manifest is not None and not manifest.is_changed(entry):
+            skipped.append(entry)
+            continue
+        relative = entry.path[len(source):].lstrip("/") if entry.path.startswith(source + "/") else os.path.basename(entry.path)
+        to_pull.append((entry, os.path.join(base, *relative.split("/"))))
+    return to_pull, skipped
@@ -0,0 +1,446 @@
+"""Backups straight into an S3-compatible bucket
+
+With the "s3" storage backend nothing is staged on the computer first:
+media files stream from the device into one object each, and the ZIP
+archive of a full backup is written into a multipart upload while it is
+being built. Only the *.ab archives `adb backup` writes, and media waiting
+to be zipped, touch the disk; they are removed once uploaded.
+
+Large objects go up as multipart uploads whose parts are sent by a shared
+pool of threads. A writer blocks while every upload slot is busy, so memory
+stays at about (slots + open writers) x part size however fast the device
+delivers. Objects below one part are sent with a single PUT. The part size
+doubles every PARTS_PER_SIZE parts, which keeps archives far beyond
+10000 x 8 MiB within S3's part limit.
+
+Requests are signed with AWS Signature Version 4 using only the standard
+library, and addressed path-style (endpoint/bucket/key), which works with
+AWS S3, MinIO, Ceph and most other S3-compatible stores. Credentials come
+from AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY and, for temporary
+credentials, AWS_SESSION_TOKEN.
+"""
+import hashlib
+import hmac
+import http.client
+import os
+import posixpath
+import threading
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+
+from pixel_backup.adb_client import AdbError
+from pixel_backup.transfer import RECONNECT_RETRIES, ParallelPuller, TransferResult
+
+S3_SCHEME = "s3://"
+PART_SIZE = 8 * 1024 * 1024
+# Parts being uploaded at once, across all uploads of a store
+UPLOAD_SLOTS = 8
+# S3 numbers parts from 1 to 10000, of at most 5 GiB each
+MAX_PARTS = 10000
+MAX_PART_SIZE = 5 * 1024 * 1024 * 1024
+# The part size doubles after every this many parts, so an upload of unknown
+# length can grow to terabytes: 8 MiB parts cover 8 GB, then 16 MiB parts...
+PARTS_PER_SIZE = 1000
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+
+
+class S3Error(Exception):
+    """The object store rejected a request"""
+
+
+def is_remote_location(location):
+    """True for history locations that point into object storage"""
+    return str(location).startswith(S3_SCHEME)
+
+
+def signing_key(secret_key, date, region, service="s3"):
+    key = ("AWS4" + secret_key).encode("utf-8")
+    for part in (date, region, service, "aws4_request"):
+        key = hmac.new(key, part.encode("utf-8"), hashlib.sha256).digest()
+    return key
+
+
+def sign_request(method, host, path, query, headers, payload_hash, access_key, secret_key, region, now=None):
+    """Add the x-amz-* and Authorization headers of a Signature Version 4 request
+
+    path must already be URI-encoded; query is a dict of unencoded values.
+    """
+    now = now or datetime.now(timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date = amz_date[:8]
+    headers["host"] = host
+    headers["x-amz-date"] = amz_date
+    headers["x-amz-content-sha256"] = payload_hash
+    canonical_headers = {name.lower(): " ".join(str(value).split()) for name, value in headers.items()}
+    signed_headers = ";".join(sorted(canonical_headers))
+    canonical_query = "&".join(f"{quote(key, safe='~')}={quote(str(value), safe='~')}"
+                               for key, value in sorted(query.items()))
+    canonical_request = "\n".join([
+        method, path, canonical_query,
+        "".join(f"{name}:{canonical_headers[name]}\n" for name in sorted(canonical_headers)),
+        signed_headers, payload_hash])
+    scope = f"{date}/{region}/s3/aws4_request"
+    string_to_sign = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope,
+                                hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()])
+    signature = hmac.new(signing_key(secret_key, date, region), string_to_sign.encode("utf-8"),
+                         hashlib.sha256).hexdigest()
+    headers["Authorization"] = (f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+                                f"SignedHeaders={signed_headers}, Signature={signature}")
+    return headers
+
+
+def xml_text(body, tag):
+    """Text of the first tag anywhere in an XML response body, or None"""
+    try:
+        element = ElementTree.fromstring(body).find(f".//{{*}}{tag}")
+    except ElementTree.ParseError:
+        return None
+    return element.text if element is not None else None
+
+
+class S3Client:
+    """Minimal S3 API client: single PUTs, multipart uploads, HEAD, GET and DELETE"""
+
+    def __init__(self, endpoint, access_key, secret_key, region="us-east-1", session_token=None, timeout=60):
+        parts = urlsplit(endpoint if "://" in endpoint else f"https://{endpoint}")
+        self.secure = parts.scheme == "https"
+        self.host = parts.netloc
+        self.base_path = parts.path.rstrip("/")
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region or "us-east-1"
+        self.session_token = session_token
+        self.timeout = timeout
+        # One keep-alive connection per thread
+        self._local = threading.local()
+
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection_class = http.client.HTTPSConnection if self.secure else http.client.HTTPConnection
+            connection = self._local.connection = connection_class(self.host, timeout=self.timeout)
+        return connection
+
+    def request(self, method, bucket, key="", query=None, body=b"", headers=None, expect=(200,)):
+        """Send a signed request; returns (status, response headers, body) or raises S3Error"""
+        query = query or {}
+        path = quote(f"{self.base_path}/{bucket}" + (f"/{key}" if key else ""), safe="/~")
+        headers = dict(headers or {})
+        if self.session_token:
+            headers["x-amz-security-token"] = self.session_token
+        payload_hash = hashlib.sha256(body).hexdigest() if body is not None else UNSIGNED_PAYLOAD
+        sign_request(method, self.host, path, query, headers, payload_hash, self.access_key, self.secret_key,
+                     self.region)
+        target = path
+        if query:
+            target += "?" + "&".join(f"{quote(name, safe='~')}={quote(str(value), safe='~')}"
+                                     for name, value in sorted(query.items()))
+        for attempt in range(2):
+            connection = self.connection()
+            try:
+                connection.request(method, target, body=body or None, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                # A kept-alive connection the server has since closed; try once on a fresh one
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise S3Error(f"{method} {bucket}/{key} failed: {e}")
+        if response.status not in expect:
+            message = xml_text(data, "Message") or xml_text(data, "Code") or response.reason
+            raise S3Error(f"{method} {bucket}/{key}: {response.status} {message}")
+        return response.status, response.headers, data
+
+    def put_object(self, bucket, key, data):
+        _, headers, _ = self.request("PUT", bucket, key, body=bytes(data))
+        return headers.get("ETag")
+
+    def head_object(self, bucket, key):
+        """Size of an object, or None if it does not exist"""
+        status, headers, _ = self.request("HEAD", bucket, key, expect=(200, 404))
+        return int(headers.get("Content-Length", 0)) if status == 200 else None
+
+    def get_object(self, bucket, key):
+        return self.request("GET", bucket, key)[2]
+
+    def delete_object(self, bucket, key):
+        self.request("DELETE", bucket, key, expect=(200, 204))
+
+    def create_multipart_upload(self, bucket, key):
+        _, _, data = self.request("POST", bucket, key, {"uploads": ""})
+        upload_id = xml_text(data, "UploadId")
+        if not upload_id:
+            raise S3Error(f"no UploadId for {bucket}/{key}")
+        return upload_id
+
+    def upload_part(self, bucket, key, upload_id, number, data):
+        _, headers, _ = self.request("PUT", bucket, key, {"partNumber": number, "uploadId": upload_id},
+                                     body=bytes(data))
+        return headers.get("ETag")
+
+    def complete_multipart_upload(self, bucket, key, upload_id, etags):
+        body = "<CompleteMultipartUpload>" + "".join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+            for number, etag in sorted(etags.items())) + "</CompleteMultipartUpload>"
+        _, _, data = self.request("POST", bucket, key, {"uploadId": upload_id}, body=body.encode("utf-8"))
+        # S3 may report a failed completion with status 200 and an Error body
+        if xml_text(data, "Code"):
+            raise S3Error(f"completing {bucket}/{key}: {xml_text(data, 'Message') or xml_text(data, 'Code')}")
+
+    def abort_multipart_upload(self, bucket, key, upload_id):
+        self.request("DELETE", bucket, key, {"uploadId": upload_id}, expect=(200, 204))
+
+
+class ObjectStore:
+    """A bucket and key prefix that backups are written to"""
+
+    def __init__(self, client, bucket, prefix="", part_size=PART_SIZE, slots=UPLOAD_SLOTS):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.part_size = part_size
+        self.pool = ThreadPoolExecutor(slots)
+        self.slots = threading.BoundedSemaphore(slots)
+
+    @classmethod
+    def from_config(cls, config):
+        """The store a BackupConfig with storage "s3" points at; raises ValueError if it is incomplete"""
+        access_key = os.environ.get("AWS_ACCESS_KEY_ID")
+        secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY")
+        if not config.s3_endpoint or not config.s3_bucket:
+            raise ValueError("S3 storage needs an endpoint and a bucket")
+        if not access_key or not secret_key:
+            raise ValueError("S3 storage needs AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY in the environment")
+        client = S3Client(config.s3_endpoint, access_key, secret_key, config.s3_region,
+                          os.environ.get("AWS_SESSION_TOKEN"))
+        return cls(client, config.s3_bucket, config.s3_prefix)
+
+    def key(self, name):
+        return posixpath.join(self.prefix, name) if self.prefix else name
+
+    def url(self, name):
+        """History location of the object (or, ending in "/", the objects) at name"""
+        return f"{S3_SCHEME}{self.bucket}/{self.key(name)}"
+
+    def open_upload(self, name):
+        return ObjectUpload(self, self.key(name))
+
+    def upload_file(self, path, name, on_bytes=None):
+        """Copy a local file to name; returns its size"""
+        with open(path, "rb") as f, self.open_upload(name) as upload:
+            for block in iter(lambda: f.read(self.part_size), b""):
+                upload.write(block)
+                if on_bytes:
+                    on_bytes(len(block))
+        return upload.size
+
+    def upload_tree(self, folder, name, on_bytes=None):
+        """Copy every file below folder to name/...; returns (member, size) pairs"""
+        uploaded = []
+        for root, _, names in os.walk(folder):
+            for file_name in names:
+                path = os.path.join(root, file_name)
+                member = os.path.relpath(path, folder).replace(os.sep, "/")
+                uploaded.append((member, self.upload_file(path, f"{name}/{member}", on_bytes)))
+        return uploaded
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class ObjectUpload:
+    """Write-only file object that becomes one object when closed
+
+    Bytes are gathered into parts; the first full part turns the upload into
+    a multipart upload, and every part is sent on the store's pool. write()
+    waits for a free upload slot, which bounds memory. Leaving a with block
+    through an exception aborts the upload, so no partial object remains.
+    """
+
+    def __init__(self, store, key):
+        self.store = store
+        self.key = key
+        self.size = 0
+        self.closed = False
+        self.upload_id = None
+        self.etags = {}
+        self.error = None
+        self._buffer = bytearray()
+        self._futures = []
+        self._number = 0
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def tell(self):
+        return self.size
+
+    def flush(self):
+        pass
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to a closed upload")
+        if self.error:
+            raise self.error
+        self._buffer += data
+        self.size += len(data)
+        while len(self._buffer) >= self.part_size():
+            part_size = self.part_size()
+            part = bytes(self._buffer[:part_size])
+            del self._buffer[:part_size]
+            self._send_part(part)
+        return len(data)
+
+    def part_size(self):
+        """Size of the next part: the store's part size, doubled every PARTS_PER_SIZE parts"""
+        return min(self.store.part_size << (self._number // PARTS_PER_SIZE), MAX_PART_SIZE)
+
+    def _send_part(self, part):
+        store = self.store
+        if self.upload_id is None:
+            self.upload_id = store.client.create_multipart_upload(store.bucket, self.key)
+        self._number += 1
+        if self._number > MAX_PARTS:
+            raise S3Error(f"{self.key} needs more than {MAX_PARTS} parts; raise the part size")
+        store.slots.acquire()
+        try:
+            future = store.pool.submit(self._upload_part, self._number, part)
+        except Exception:
+            store.slots.release()
+            raise
+        self._futures.append(future)
+
+    def _upload_part(self, number, part):
+        try:
+            self.etags[number] = self.store.client.upload_part(self.store.bucket, self.key, self.upload_id, number,
+                                                               part)
+        except Exception as e:
+            self.error = self.error or e
+        finally:
+            self.store.slots.release()
+
+    def close(self):
+        """Finish the object; raises S3Error if any part failed"""
+        if self.closed:
+            return
+        self.closed = True
+        store = self.store
+        try:
+            if self.upload_id is None:
+                store.client.put_object(store.bucket, self.key, self._buffer)
+                return
+            if self._buffer:
+                self._send_part(bytes(self._buffer))
+                self._buffer = bytearray()
+            for future in self._futures:
+                future.result()
+            if self.error:
+                raise self.error
+            store.client.complete_multipart_upload(store.bucket, self.key, self.upload_id, self.etags)
+            self.upload_id = None
+        except Exception:
+            self.abort()
+            raise
+
+    def abort(self):
+        """Drop what was uploaded so far"""
+        self.closed = True
+        self._buffer = bytearray()
+        for future in self._futures:
+            future.result()
+        if self.upload_id is not None:
+            try:
+                self.store.client.abort_multipart_upload(self.store.bucket, self.key, self.upload_id)
+            except S3Error as e:
+                print(f"Could not abort the upload of {self.key}: {e}")
+            self.upload_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class UploadingPuller(ParallelPuller):
+    """ParallelPuller that streams each file from the device into the store instead of to disk
+
+    The planned local paths below root name the objects: root/a/b.jpg is
+    uploaded as a/b.jpg. A sha256 of every file is taken on the way through
+    (hashes, by local path).
+    """
+
+    def __init__(self, client, store, root, serial=None, **options):
+        super().__init__(client, serial, **options)
+        self.store = store
+        self.root = root
+        self.hashes = {}
+
+    def object_name(self, local):
+        return os.path.relpath(local, self.root).replace(os.sep, "/")
+
+    def pull_unit(self, unit, on_bytes=None, is_canceled=None):
+        results = []
+        for entry, local in unit:
+            if is_canceled and is_canceled():
+                break
+            received = [0]
+
+            def count(length):
+                received[0] += length
+                if on_bytes:
+                    on_bytes(length)
+
+            try:
+                size, file_hash = self.upload_file(entry, local, count, is_canceled)
+                ok = size == entry.size
+                error = None if ok else "size changed during backup"
+                if ok:
+                    self.hashes[local] = file_hash
+            except (AdbError, S3Error, OSError) as e:
+                ok = False
+                error = str(e)
+            if on_bytes:
+                # Settle the byte count: the whole file if it made it, nothing if not
+                delta = (entry.size if ok else 0) - received[0]
+                if delta:
+                    on_bytes(delta)
+            results.append(TransferResult(entry.path, local, entry.size, ok, error))
+        return results
+
+    def upload_file(self, entry, local, on_bytes=None, is_canceled=None):
+        """Stream one device file into its object; returns (size, sha256)
+
+        An object cannot be appended to, so after a reconnect the file
+        starts over.
+        """
+        retries = RECONNECT_RETRIES if self.reconnect else 0
+        while True:
+            digest = hashlib.sha256()
+            try:
+                with self.store.open_upload(self.object_name(local)) as upload:
+                    def write(data):
+                        digest.update(data)
+                        upload.write(data)
+
+                    self.client.pull_stream(entry.path, write, self.serial, on_bytes, is_canceled)
+                    if upload.size != entry.size:
+                        # Nothing worth keeping under that name
+                        raise AdbError("size changed during backup")
+                return upload.size, digest.hexdigest()
+            except (AdbError, OSError):
+                canceled = is_canceled and is_canceled()
+                if canceled or not retries or not self.reconnect(is_canceled):
+                    raise
+                retries -= 1
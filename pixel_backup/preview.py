@@ -0,0 +1,188 @@
+"""Data behind the file preview
+
+A device listing can run to a million files, far more than a Treeview can
+hold. PreviewModel keeps the listing in compact columns (names, folder ids,
+sizes and mtimes in arrays) and maintains a view: the indices that pass the
+current filter, in the current sort order. The widget only ever asks for the
+page of rows it is showing, and only those rows are formatted.
+
+Scanner threads append() batches; everything else is meant for the Tk thread.
+"""
+import os
+import threading
+import time
+from array import array
+from datetime import datetime
+
+from pixel_backup.engine import format_size
+from pixel_backup.scan import RemoteFile
+
+SORT_KEYS = ("name", "size", "date")
+
+
+class PreviewModel:
+    """A filterable, sortable listing of RemoteFile entries"""
+
+    def __init__(self):
+        self.names = []
+        self.folder_ids = array("i")
+        self.sizes = array("q")
+        self.mtimes = array("q")
+        self.folders = []
+        self._folder_index = {}
+        self._lock = threading.Lock()
+        self._pending = []
+
+        self.sort_key = None
+        self.reverse = False
+        self.name_filter = ""
+        self.min_size = None
+        self.max_size = None
+        self.date_from = None
+        self.date_to = None
+
+        # view is None while it is simply every entry in arrival order
+        self.view = None
+        self.total_size = 0
+        # While a big listing streams in, a sorted view is re-sorted at most this often
+        self.resort_interval = 1.0
+        self._unsorted = False
+        self._sorted_at = 0
+
+    # -- loading (any thread) --------------------------------------------
+
+    def append(self, entries):
+        """Queue a batch of RemoteFile entries; they appear on the next refresh()"""
+        with self._lock:
+            self._pending.extend(entries)
+
+    # -- Tk thread -------------------------------------------------------
+
+    def refresh(self, force=False):
+        """Take in queued entries and bring the view up to date; returns True if it changed
+
+        New entries are added to a sorted view at its end and put in place by
+        the next re-sort, which happens at most every resort_interval seconds
+        unless force is set.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            if self._unsorted and (force or time.monotonic() - self._sorted_at >= self.resort_interval):
+                self.sort_view()
+                return True
+            return False
+        start = len(self.names)
+        for entry in pending:
+            folder, name = os.path.split(entry.path)
+            folder_id = self._folder_index.get(folder)
+            if folder_id is None:
+                folder_id = self._folder_index[folder] = len(self.folders)
+                self.folders.append(folder)
+            self.names.append(name)
+            self.folder_ids.append(folder_id)
+            self.sizes.append(entry.size)
+            self.mtimes.append(entry.mtime)
+            self.total_size += entry.size
+
+        if self.view is not None:
+            if self.filtering():
+                self.view.extend(i for i in range(start, len(self.names)) if self.matches(i))
+            else:
+                self.view.extend(range(start, len(self.names)))
+            if self.sort_key:
+                self._unsorted = True
+                if force or time.monotonic() - self._sorted_at >= self.resort_interval:
+                    self.sort_view()
+        return True
+
+    def sort_view(self):
+        # Timsort is close to linear on a sorted run followed by a new batch
+        self.view = array("l", sorted(self.view, key=self.key_function(), reverse=self.reverse))
+        self._unsorted = False
+        self._sorted_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.names) if self.view is None else len(self.view)
+
+    @property
+    def loaded(self):
+        return len(self.names)
+
+    def path(self, index):
+        """Device path of the entry at position index of the view"""
+        i = self.entry_index(index)
+        return f"{self.folders[self.folder_ids[i]]}/{self.names[i]}"
+
+    def entry(self, index):
+        """RemoteFile at position index of the view"""
+        i = self.entry_index(index)
+        return RemoteFile(f"{self.folders[self.folder_ids[i]]}/{self.names[i]}", self.sizes[i], self.mtimes[i])
+
+    def entry_index(self, index):
+        return index if self.view is None else self.view[index]
+
+    def page(self, start, count):
+        """Formatted (name, size, date) rows for view positions start .. start + count"""
+        rows = []
+        for index in range(start, min(start + count, len(self))):
+            i = self.entry_index(index)
+            date = datetime.fromtimestamp(self.mtimes[i]).strftime("%Y-%m-%d %H:%M:%S")
+            rows.append((self.names[i], format_size(self.sizes[i]), date))
+        return rows
+
+    def set_sort(self, key, reverse=False):
+        if key not in SORT_KEYS:
+            raise ValueError(f"cannot sort by {key}")
+        self.sort_key = key
+        self.reverse = reverse
+        self.rebuild()
+
+    def set_filter(self, name="", min_size=None, max_size=None, date_from=None, date_to=None):
+        """Only show entries whose name contains name (any case) within the size and date bounds"""
+        self.name_filter = name.lower()
+        self.min_size = min_size
+        self.max_size = max_size
+        self.date_from = date_from.timestamp() if date_from else None
+        self.date_to = date_to.timestamp() if date_to else None
+        self.rebuild()
+
+    def filtering(self):
+        return bool(self.name_filter or self.min_size is not None or self.max_size is not None
+                    or self.date_from is not None or self.date_to is not None)
+
+    def matches(self, i):
+        if self.name_filter and self.name_filter not in self.names[i].lower():
+            return False
+        size = self.sizes[i]
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        mtime = self.mtimes[i]
+        if self.date_from is not None and mtime < self.date_from:
+            return False
+        if self.date_to is not None and mtime > self.date_to:
+            return False
+        return True
+
+    def key_function(self):
+        if self.sort_key == "name":
+            names = self.names
+            return lambda i: names[i].lower()
+        if self.sort_key == "size":
+            return self.sizes.__getitem__
+        return self.mtimes.__getitem__
+
+    def rebuild(self):
+        """Recompute the view from scratch after the filter or sort order changed"""
+        if not self.filtering() and not self.sort_key:
+            self.view = None
+            return
+        if self.filtering():
+            indices = [i for i in range(len(self.names)) if self.matches(i)]
+        else:
+            indices = range(len(self.names))
+        self.view = array("l", indices)
+        if self.sort_key:
+            self.sort_view()
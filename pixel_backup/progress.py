@@ -0,0 +1,125 @@
+"""Transfer progress tracking and thread-safe UI update delivery
+
+Transfer workers report bytes as they move them; the UI thread samples the
+tracker at a fixed rate instead of walking the destination folder. Anything
+else a worker wants to show goes through an UpdateQueue that the UI thread
+drains, so widgets are only ever touched from the thread that owns them.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class ProgressTracker:
+    """Thread-safe byte and file counters with a smoothed throughput and ETA"""
+
+    def __init__(self, total_bytes=0, total_files=0, smoothing=0.3, clock=time.monotonic):
+        self.total_bytes = total_bytes
+        self.total_files = total_files
+        self.smoothing = smoothing
+        self.clock = clock
+        self.done_bytes = 0
+        self.done_files = 0
+        self.failed_files = 0
+        self.rate = None
+        self.started = clock()
+        self._lock = threading.Lock()
+        self._sample_time = self.started
+        self._sample_bytes = 0
+
+    def set_totals(self, total_bytes, total_files):
+        with self._lock:
+            self.total_bytes = total_bytes
+            self.total_files = total_files
+
+    def add_bytes(self, count):
+        """Count bytes moved (negative to take back bytes of a failed file)"""
+        with self._lock:
+            self.done_bytes += count
+
+    def add_result(self, result):
+        """Count a finished file (TransferResult)"""
+        self.add_file(result.ok)
+
+    def add_file(self, ok=True):
+        """Count a finished file"""
+        with self._lock:
+            if ok:
+                self.done_files += 1
+            else:
+                self.failed_files += 1
+
+    def sample(self):
+        """Update the smoothed rate; call at a steady interval from one thread"""
+        with self._lock:
+            now = self.clock()
+            elapsed = now - self._sample_time
+            if elapsed <= 0:
+                return self.rate
+            instant = (self.done_bytes - self._sample_bytes) / elapsed
+            if self.rate is None:
+                self.rate = instant
+            else:
+                self.rate = self.smoothing * instant + (1 - self.smoothing) * self.rate
+            self._sample_time = now
+            self._sample_bytes = self.done_bytes
+            return self.rate
+
+    def fraction(self):
+        with self._lock:
+            if self.total_bytes:
+                return min(1.0, max(0.0, self.done_bytes / self.total_bytes))
+            if self.total_files:
+                return min(1.0, (self.done_files + self.failed_files) / self.total_files)
+            return 0.0
+
+    def eta(self):
+        """Seconds remaining at the smoothed rate, or None while unknown"""
+        with self._lock:
+            if not self.rate or self.rate <= 0:
+                return None
+            return max(0.0, (self.total_bytes - self.done_bytes) / self.rate)
+
+
+def format_duration(seconds):
+    """Format seconds as a short h/m/s string"""
+    if seconds is None:
+        return "calculating..."
+    seconds = int(seconds + 0.5)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds // 60 % 60:02d}m"
+
+
+class UpdateQueue:
+    """Callables posted from worker threads and run by the UI thread"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def post(self, func, *args, **kwargs):
+        """Schedule func on the UI thread; returns a Future with its result"""
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def call(self, func, *args, **kwargs):
+        """Run func on the UI thread and wait for its result"""
+        return self.post(func, *args, **kwargs).result()
+
+    def drain(self, limit=200):
+        """Run up to limit pending callables; call this from the UI thread only"""
+        for _ in range(limit):
+            try:
+                future, func, args, kwargs = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
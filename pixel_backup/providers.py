@@ -0,0 +1,278 @@
+"""Contacts, messages and call logs exported from the device's content providers
+
+`adb backup` of a provider package wrote an opaque .ab archive of everything
+on every run (and the call log step backed up the contacts provider again).
+Instead, rows are read with `content query` and streamed into SQLite, one
+database per kind below the backup location (.providers/<serial>/), so they
+can be searched and compared with ordinary tools.
+
+Each table has a watermark column: `_id` for messages and calls, which only
+ever grow, and the contact's last update time for contacts, whose rows
+change in place. The database remembers the highest watermark it has seen,
+and later runs only ask the device for rows above it, so a daily backup of a
+phone with years of messages fetches the day's messages instead of all of
+them. Rows are upserted by `_id`, and rows whose `_id` the device no longer
+lists are deleted, so the database mirrors the device. Every backup gets a
+copy of the whole database (contacts.db, messages.db, call_logs.db), taken
+with SQLite's backup API.
+
+`content query` prints a row as `Row: <n> col=value, col=value, ...` with
+values unquoted. The columns are asked for in a known order with the free
+text column last, so a value ends where ", <next column>=" starts and the
+last one runs to the end of the row, newlines included. Nothing marks the
+end of the last row, and `content` reports a refused query (a permission
+denial, say) as text, so each query is followed by an end marker with its
+exit status: output without the marker was cut off, and its last row is
+dropped.
+"""
+import os
+import re
+import shlex
+import sqlite3
+from collections import namedtuple
+
+from pixel_backup.adb_client import AdbError
+
+PROVIDER_DIR = ".providers"
+# Rows inserted per transaction
+INSERT_BATCH = 1000
+ROW_START = re.compile(r"Row: \d+ ")
+END_MARKER = "--pixel-backup-query-end--"
+QUERY_ERROR = "Error while accessing provider"
+
+# columns are (name, SQLite type); the free text column goes last
+ProviderTable = namedtuple("ProviderTable", ["name", "uri", "columns", "watermark"])
+
+EXPORTS = {
+    "contacts": [
+        ProviderTable("data", "content://com.android.contacts/data", (
+            ("_id", "INTEGER PRIMARY KEY"), ("raw_contact_id", "INTEGER"), ("contact_id", "INTEGER"),
+            ("contact_last_updated_timestamp", "INTEGER"), ("mimetype", "TEXT"), ("data2", "TEXT"),
+            ("data3", "TEXT"), ("data1", "TEXT"),
+        ), "contact_last_updated_timestamp"),
+    ],
+    "messages": [
+        ProviderTable("sms", "content://sms", (
+            ("_id", "INTEGER PRIMARY KEY"), ("thread_id", "INTEGER"), ("date", "INTEGER"), ("date_sent", "INTEGER"),
+            ("type", "INTEGER"), ("read", "INTEGER"), ("status", "INTEGER"), ("address", "TEXT"), ("body", "TEXT"),
+        ), "_id"),
+    ],
+    "call_logs": [
+        ProviderTable("calls", "content://call_log/calls", (
+            ("_id", "INTEGER PRIMARY KEY"), ("date", "INTEGER"), ("duration", "INTEGER"), ("type", "INTEGER"),
+            ("new", "INTEGER"), ("number", "TEXT"), ("name", "TEXT"),
+        ), "_id"),
+    ],
+}
+
+
+def provider_store_path(backup_root, serial, kind):
+    """Location of one device's database of a kind (contacts, messages, call_logs)"""
+    safe_serial = "".join(c if c.isalnum() or c in "-_." else "_" for c in serial or "unknown")
+    return os.path.join(backup_root, PROVIDER_DIR, safe_serial, f"{kind}.db")
+
+
+def build_query(table, after=None, columns=None):
+    """`content query` of the table's rows above the watermark after, in watermark order
+
+    Errors go to the output too, and the end marker with the exit status
+    follows the last row.
+    """
+    names = columns or [name for name, _ in table.columns]
+    command = f"content query --uri {shlex.quote(table.uri)} --projection {shlex.quote(':'.join(names))}"
+    if after is not None:
+        command += f" --where {shlex.quote(f'{table.watermark}>{int(after)}')}"
+    command += f" --sort {shlex.quote(f'{table.watermark} ASC')}"
+    return f"{command} 2>&1; echo {END_MARKER} $?"
+
+
+def parse_row(text, names):
+    """Values of one `content query` row (text after "Row: <n> "), None for NULL"""
+    values = []
+    position = 0
+    for i, name in enumerate(names):
+        prefix = f"{name}="
+        if not text.startswith(prefix, position):
+            return None
+        start = position + len(prefix)
+        if i + 1 < len(names):
+            end = text.find(f", {names[i + 1]}=", start)
+            if end < 0:
+                return None
+            position = end + 2
+        else:
+            end = len(text)
+        value = text[start:end]
+        values.append(None if value == "NULL" else value)
+    return values
+
+
+def read_lines(stream):
+    """Decoded lines of a binary stream, as they arrive"""
+    pending = b""
+    for block in iter(lambda: stream.read(64 * 1024), b""):
+        lines = (pending + block).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode("utf-8", "replace").rstrip("\r")
+    if pending:
+        yield pending.decode("utf-8", "replace").rstrip("\r")
+
+
+def read_rows(stream):
+    """Yield the text of each `content query` row (after "Row: <n> ") as it arrives
+
+    Raises AdbError once the output is read if the query failed or the
+    output stopped before the end marker; a row is only yielded once the
+    next row or the marker shows that it is complete.
+    """
+    row = None
+    errors = []
+    for line in read_lines(stream):
+        if line.startswith(END_MARKER):
+            if row is not None:
+                yield row
+            status = line[len(END_MARKER):].strip()
+            if status != "0" or errors:
+                raise AdbError(" ".join(errors) or f"content query failed with status {status}")
+            return
+        match = ROW_START.match(line)
+        if match:
+            if row is not None:
+                yield row
+            row = line[match.end():]
+        elif row is not None:
+            # A value with a line break in it, e.g. a multi-line message
+            row += "\n" + line
+        elif line.startswith(QUERY_ERROR) or line.startswith("java."):
+            errors.append(line.strip())
+    raise AdbError("content query output ended early")
+
+
+class ProviderStore:
+    """One device's SQLite database of a kind, and the watermarks of its tables"""
+
+    def __init__(self, path, tables):
+        self.path = path
+        self.tables = tables
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS watermarks (name TEXT PRIMARY KEY, value INTEGER)")
+        for table in tables:
+            columns = ", ".join(f'"{name}" {kind}' for name, kind in table.columns)
+            self.db.execute(f'CREATE TABLE IF NOT EXISTS "{table.name}" ({columns})')
+        self.db.commit()
+
+    def watermark(self, table):
+        row = self.db.execute("SELECT value FROM watermarks WHERE name = ?", (table.name,)).fetchone()
+        return row[0] if row else None
+
+    def export(self, adb, serial, table, is_canceled=None):
+        """Fetch the rows above the table's watermark; returns how many were stored
+
+        The watermark only moves past rows that are committed. Rows come in
+        watermark order and several can share a value (contacts updated
+        together), so until the query has ended the watermark stops below
+        the value of the last row stored: a canceled or broken export is
+        picked up again by the next run without losing the rest of a group.
+        """
+        names = [name for name, _ in table.columns]
+        index = names.index(table.watermark)
+        columns = ", ".join(f'"{name}"' for name in names)
+        insert = (f'INSERT OR REPLACE INTO "{table.name}" ({columns}) '
+                  f'VALUES ({", ".join("?" for _ in names)})')
+        watermark = self.watermark(table)
+        count = 0
+        batch = []
+        stream = adb.open_exec(build_query(table, watermark), serial)
+        try:
+            for text in read_rows(stream):
+                values = parse_row(text, names)
+                if values is None or values[index] is None:
+                    continue
+                batch.append(values)
+                if len(batch) >= INSERT_BATCH:
+                    watermark = self.store_partial(table, insert, batch, index, watermark)
+                    count += len(batch)
+                    batch = []
+                    if is_canceled and is_canceled():
+                        return count
+        except AdbError:
+            # The rows read so far are complete; keep them for the next run to build on
+            if batch:
+                self.store_partial(table, insert, batch, index, watermark)
+            raise
+        finally:
+            stream.close()
+        # The query ended cleanly, so every row up to the highest value is in
+        with self.db:
+            self.db.executemany(insert, batch)
+            self.db.execute(f'INSERT OR REPLACE INTO watermarks (name, value) '
+                            f'SELECT ?, MAX("{table.watermark}") FROM "{table.name}"', (table.name,))
+        return count + len(batch)
+
+    def store_partial(self, table, insert, rows, index, watermark):
+        """Store rows of a query still running; returns the watermark, below the last row's value"""
+        last = int(rows[-1][index])
+        below = [int(row[index]) for row in rows if int(row[index]) < last]
+        if below:
+            watermark = max(below)
+        with self.db:
+            self.db.executemany(insert, rows)
+            if watermark is not None:
+                self.db.execute("INSERT OR REPLACE INTO watermarks (name, value) VALUES (?, ?)",
+                                (table.name, watermark))
+        return watermark
+
+    def remove_deleted(self, adb, serial, table):
+        """Delete the rows whose _id the device no longer lists; returns how many"""
+        stream = adb.open_exec(build_query(table, columns=["_id"]), serial)
+        try:
+            ids = [(int(values[0]),) for values in (parse_row(text, ["_id"]) for text in read_rows(stream))
+                   if values and values[0] is not None]
+        finally:
+            stream.close()
+        # Only a complete listing gets here: read_rows raises on a cut-off one
+        with self.db:
+            self.db.execute("CREATE TEMP TABLE IF NOT EXISTS present (_id INTEGER PRIMARY KEY)")
+            self.db.execute("DELETE FROM present")
+            self.db.executemany("INSERT OR IGNORE INTO present (_id) VALUES (?)", ids)
+            return self.db.execute(f'DELETE FROM "{table.name}" WHERE _id NOT IN (SELECT _id FROM present)').rowcount
+
+    def rows(self, table):
+        return self.db.execute(f'SELECT COUNT(*) FROM "{table.name}"').fetchone()[0]
+
+    def snapshot(self, path):
+        """Copy the whole database to path"""
+        if os.path.exists(path):
+            os.remove(path)
+        target = sqlite3.connect(path)
+        try:
+            self.db.backup(target)
+        finally:
+            target.close()
+
+    def close(self):
+        self.db.close()
+
+
+def export_provider(adb, serial, backup_root, kind, backup_folder, is_canceled=None):
+    """Bring a device's database of kind up to date and copy it into backup_folder
+
+    Returns (new rows, removed rows, total rows). Raises AdbError if a
+    query failed or its output was cut off.
+    """
+    tables = EXPORTS[kind]
+    store = ProviderStore(provider_store_path(backup_root, serial, kind), tables)
+    try:
+        added = 0
+        removed = 0
+        for table in tables:
+            added += store.export(adb, serial, table, is_canceled)
+            if not (is_canceled and is_canceled()):
+                removed += store.remove_deleted(adb, serial, table)
+        total = sum(store.rows(table) for table in tables)
+        store.snapshot(os.path.join(backup_folder, f"{kind}.db"))
+    finally:
+        store.close()
+    return added, removed, total
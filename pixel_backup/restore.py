@@ -0,0 +1,193 @@
+"""Restoring backups to the device
+
+A backup folder or archive (ZIP or indexed) is put back file by file. Before
+anything is sent, one batched `stat` of every destination lists what the
+device already has; files with the same size and modification time are left
+alone, so restoring onto a phone that still holds most of its media only
+pushes what is missing or different.
+
+Pushes run on several workers, each over a pooled sync connection (SEND),
+largest files first. Archive members are streamed straight out of the archive,
+one archive handle per worker, without extracting them anywhere first.
+
+Files go back to the device path they were backed up from, as recorded in
+the catalog. Files the catalog does not know go below a target folder on the
+device; `adb backup` archives (*.ab) are never pushed, they are restored with
+`adb restore`.
+"""
+import os
+import queue
+import shutil
+import threading
+import time
+import zipfile
+import zlib
+from collections import namedtuple
+
+from pixel_backup.adb_client import AdbError
+from pixel_backup.archive import IndexedArchive, is_indexed_archive, read_index
+from pixel_backup.journal import JOURNAL_FILE, PARTIAL_SUFFIX
+from pixel_backup.transfer import TransferResult
+from pixel_backup.verify import stat_device_files
+
+RESTORE_ROOT = "/sdcard/Restored"
+ANDROID_BACKUP_SUFFIX = ".ab"
+# ZIP archives keep modification times to two seconds
+MTIME_SLACK = 2
+
+RestoreItem = namedtuple("RestoreItem", ["member", "remote", "size", "mtime"])
+
+
+class BackupReader:
+    """The files of a backup folder, ZIP archive or indexed archive, readable from several threads"""
+
+    def __init__(self, location):
+        self.location = location
+        self.is_indexed = is_indexed_archive(location)
+        self.is_zip = not self.is_indexed and os.path.isfile(location) and zipfile.is_zipfile(location)
+        if not self.is_zip and not self.is_indexed and not os.path.isdir(location):
+            raise ValueError(f"{location} is not a backup folder or archive")
+        self._local = threading.local()
+
+    def members(self):
+        """member -> (size, mtime)"""
+        if self.is_indexed:
+            return {name: (entry.size, entry.mtime) for name, entry in read_index(self.location)[0].items()}
+        members = {}
+        if self.is_zip:
+            with zipfile.ZipFile(self.location) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        members[info.filename] = (info.file_size, int(time.mktime(info.date_time + (0, 0, -1))))
+            return members
+        for root, _, names in os.walk(self.location):
+            for name in names:
+                if name == JOURNAL_FILE or name.endswith(PARTIAL_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                members[os.path.relpath(path, self.location).replace(os.sep, "/")] = (stat.st_size,
+                                                                                      int(stat.st_mtime))
+        return members
+
+    def open(self, member):
+        if not self.is_zip and not self.is_indexed:
+            return open(os.path.join(self.location, member), "rb")
+        archive = getattr(self._local, "archive", None)
+        if archive is None:
+            archive = self._local.archive = (IndexedArchive if self.is_indexed else zipfile.ZipFile)(self.location)
+        return archive.open(member)
+
+    def extract(self, member, folder, mtime):
+        """Copy one member below folder under its own path, dated mtime; returns the copy's path"""
+        target = os.path.join(folder, *member.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with self.open(member) as source, open(target, "wb") as f:
+            shutil.copyfileobj(source, f, 1024 * 1024)
+        os.utime(target, (mtime, mtime))
+        return target
+
+
+def restore_target(location):
+    """Default device folder for files without a known device path"""
+    name = os.path.splitext(os.path.basename(location.rstrip("/\\")))[0]
+    return f"{RESTORE_ROOT}/{name}"
+
+
+def is_present(existing, item):
+    """True if the device file (size, mtime) already matches item"""
+    return existing is not None and existing[0] == item.size and abs(existing[1] - item.mtime) <= MTIME_SLACK
+
+
+class BackupRestorer:
+    """Push the files of one backup to a device"""
+
+    def __init__(self, location, adb, serial=None, workers=4, slots=None):
+        self.reader = BackupReader(location)
+        self.location = location
+        self.adb = adb
+        self.serial = serial
+        self.workers = max(1, workers)
+        # Shared with other transfers on this host (see scheduler.HostLimits)
+        self.slots = slots
+
+    def plan(self, device_files=None, target=None):
+        """Split the backup into (to_push, present, skipped) lists of RestoreItems
+
+        device_files maps members to the RemoteFile they were backed up
+        from; other members go below target (default: restore_target).
+        skipped holds the *.ab archives.
+        """
+        device_files = device_files or {}
+        target = (target or restore_target(self.location)).rstrip("/")
+        items = []
+        skipped = []
+        for member, (size, mtime) in self.reader.members().items():
+            entry = device_files.get(member)
+            if entry is not None:
+                # The catalog's mtime is exact, the archive's is not
+                items.append(RestoreItem(member, entry.path, size, entry.mtime))
+            elif member.endswith(ANDROID_BACKUP_SUFFIX):
+                skipped.append(RestoreItem(member, None, size, mtime))
+            else:
+                items.append(RestoreItem(member, f"{target}/{member}", size, mtime))
+
+        existing = stat_device_files(self.adb, self.serial, [item.remote for item in items])
+        to_push = []
+        present = []
+        for item in items:
+            (present if is_present(existing.get(item.remote), item) else to_push).append(item)
+        return to_push, present, skipped
+
+    def push_one(self, item, on_bytes=None, is_canceled=None):
+        sent = [0]
+
+        def count(length):
+            sent[0] += length
+            if on_bytes:
+                on_bytes(length)
+
+        try:
+            with self.reader.open(item.member) as source:
+                self.adb.push(source, item.remote, self.serial, item.mtime, count, is_canceled)
+            ok, error = True, None
+        except (AdbError, OSError, ValueError, zlib.error, zipfile.BadZipFile) as e:
+            ok, error = False, str(e)
+        if on_bytes:
+            # Settle the byte count: the whole file if it made it, nothing if not
+            delta = (item.size if ok else 0) - sent[0]
+            if delta:
+                on_bytes(delta)
+        return TransferResult(item.remote, item.member, item.size, ok, error)
+
+    def push(self, items, on_result=None, on_bytes=None, is_canceled=None):
+        """Push RestoreItems with parallel workers; returns a TransferResult per file started"""
+        work = queue.Queue()
+        for item in sorted(items, key=lambda item: item.size, reverse=True):
+            work.put(item)
+        results = []
+        lock = threading.Lock()
+
+        def worker():
+            while not (is_canceled and is_canceled()):
+                try:
+                    item = work.get_nowait()
+                except queue.Empty:
+                    return
+                if self.slots:
+                    with self.slots:
+                        result = self.push_one(item, on_bytes, is_canceled)
+                else:
+                    result = self.push_one(item, on_bytes, is_canceled)
+                with lock:
+                    results.append(result)
+                    if on_result:
+                        on_result(result)
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(min(self.workers, work.qsize()))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
@@ -0,0 +1,61 @@
+"""Batched device metadata scans
+
+Instead of running one `adb shell stat` per file, the whole tree is listed by a
+single `find ... -exec stat {} +` on the device and parsed line by line while
+the output is still streaming.
+"""
+import shlex
+from collections import namedtuple
+
+RemoteFile = namedtuple("RemoteFile", ["path", "size", "mtime"])
+
+# size, mtime (epoch seconds) and name; the name goes last so spaces survive
+STAT_FORMAT = "%s %Y %n"
+
+
+def build_scan_command(paths, find_args=None):
+    """Build one device shell command that lists size, mtime and path for every file"""
+    roots = " ".join(shlex.quote(path) for path in paths)
+    extra = " ".join(shlex.quote(arg) for arg in (find_args or []))
+    command = f"find {roots} -type f"
+    if extra:
+        command += f" {extra}"
+    return f"{command} -exec stat -c {shlex.quote(STAT_FORMAT)} {{}} + 2>/dev/null"
+
+
+def parse_scan_line(line):
+    """Parse one `stat` output line into a RemoteFile (None if malformed)"""
+    line = line.rstrip("\r\n")
+    parts = line.split(" ", 2)
+    if len(parts) != 3:
+        return None
+    try:
+        return RemoteFile(parts[2], int(parts[0]), int(parts[1]))
+    except ValueError:
+        return None
+
+
+class DeviceScanner:
+    """Stream file metadata for whole directory trees in one device command"""
+
+    def __init__(self, client, serial=None):
+        self.client = client
+        self.serial = serial
+
+    def scan(self, paths, find_args=None):
+        """Yield a RemoteFile for every regular file below paths as the device reports it"""
+        if not paths:
+            return
+        stream = self.client.open_exec(build_scan_command(paths, find_args), self.serial)
+        try:
+            for line in stream:
+                entry = parse_scan_line(line.decode("utf-8", "replace"))
+                if entry is not None:
+                    yield entry
+        finally:
+            # Stops the device command if the consumer gave up early
+            stream.close()
+
+    def scan_all(self, paths, find_args=None):
+        """Return the complete listing for paths as a list"""
+        return list(self.scan(paths, find_args))
@@ -0,0 +1,207 @@
+"""Backing up several devices at once
+
+Each connected device gets one job, run by its own BackupEngine on its own
+thread. What the devices share is the host: HostLimits caps how many transfer
+work units (across all devices) are in flight and how many finished backups
+are being archived or stored in the repository at the same time, so a shelf
+of phones does not saturate the USB hubs or thrash one disk.
+"""
+import os
+import threading
+from datetime import datetime
+
+from pixel_backup.engine import BackupEngine, BackupListener
+from pixel_backup.throttle import RateLimiter
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELED = "canceled"
+
+
+class HostLimits:
+    """Semaphores shared by every backup running on this host
+
+    bandwidth (MB/s) caps the transfers of all devices together.
+    """
+
+    def __init__(self, transfers=8, disk_writes=2, bandwidth=None):
+        self.transfers = threading.BoundedSemaphore(max(1, transfers))
+        self.disk_writes = threading.BoundedSemaphore(max(1, disk_writes))
+        self.bandwidth = RateLimiter(bandwidth * 1024 * 1024) if bandwidth else None
+
+
+class DeviceJob:
+    """One device's backup: what it is doing now and how it ended"""
+
+    def __init__(self, serial, model, kind, media_type, backup_folder):
+        self.serial = serial
+        self.model = model
+        self.kind = kind
+        self.media_type = media_type
+        self.backup_folder = backup_folder
+        self.state = QUEUED
+        self.status = "Waiting..."
+        self.details = ""
+        self.percent = 0
+        self.tracker = None
+        self.base = 0
+        self.span = 100
+        self.record = None
+        self.error = None
+        self.engine = None
+
+    def progress(self):
+        """Overall percentage, following the transfer tracker while there is one"""
+        tracker = self.tracker
+        if tracker is not None and tracker.total_files:
+            return self.base + self.span * tracker.fraction()
+        return self.percent
+
+    @property
+    def active(self):
+        return self.state in (QUEUED, RUNNING)
+
+
+class JobListener(BackupListener):
+    """Records engine progress on the job and tells the scheduler"""
+
+    def __init__(self, scheduler, job):
+        self.scheduler = scheduler
+        self.job = job
+
+    def status(self, text):
+        self.job.status = text
+        self.scheduler.notify(self.job)
+
+    def details(self, text, level=None):
+        self.job.details = text
+        if level == "error":
+            print(f"[{self.job.serial}] {text}")
+        self.scheduler.notify(self.job)
+
+    def progress(self, percent):
+        self.job.percent = percent
+        self.scheduler.notify(self.job)
+
+    def track(self, tracker, base=0, span=100):
+        self.job.tracker = tracker
+        self.job.base = base
+        self.job.span = span
+
+    def stop_tracking(self):
+        job = self.job
+        if job.tracker is not None and job.tracker.total_files:
+            job.percent = job.base + job.span * job.tracker.fraction()
+        job.tracker = None
+
+    def confirm(self, question):
+        # Nobody is watching each device; keep going with the other steps
+        return self.scheduler.confirm(self.job, question) if self.scheduler.confirm else True
+
+
+class BackupScheduler:
+    """Run one backup job per device serial, all at the same time
+
+    on_update(job) is called from worker threads whenever a job's status
+    changes; confirm(job, question), if given, decides whether a job goes on
+    after a failed step. Finished history records collect in history, and in
+    catalog (a BackupCatalog) if one is given.
+    """
+
+    def __init__(self, adb, config, limits=None, on_update=None, confirm=None, catalog=None):
+        self.adb = adb
+        self.config = config
+        self.limits = limits or HostLimits()
+        self.catalog = catalog
+        self.on_update = on_update
+        self.confirm = confirm
+        self.history = []
+        self._jobs = {}
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def get(self, serial):
+        with self._lock:
+            return self._jobs.get(serial)
+
+    def submit(self, serial, model="", kind="full", media_type="custom"):
+        """Start a backup of serial; a device already being backed up keeps its running job"""
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        with self._lock:
+            current = self._jobs.get(serial)
+            if current is not None and current.active:
+                return current
+            if kind == "full":
+                # The serial keeps simultaneous backups (and repository snapshot ids) apart
+                folder = os.path.join(self.config.backup_location, f"{stamp}_{serial}")
+            else:
+                folder = os.path.join(self.config.media_backup_location, f"{stamp}_{media_type}_{serial}")
+            job = DeviceJob(serial, model, kind, media_type, folder)
+            job.engine = BackupEngine(self.config, self.adb, serial, JobListener(self, job), self.limits,
+                                      self.catalog)
+            self._jobs[serial] = job
+            thread = threading.Thread(target=self.run, args=(job,), daemon=True)
+            self._threads.append(thread)
+        thread.start()
+        return job
+
+    def submit_all(self, devices, kind="full", media_type="custom"):
+        """Start a job for every (serial, model) pair"""
+        return [self.submit(serial, model, kind, media_type) for serial, model in devices]
+
+    def run(self, job):
+        job.state = RUNNING
+        job.status = "Starting backup..."
+        self.notify(job)
+        try:
+            if job.kind == "full":
+                job.record = job.engine.run_full_backup(job.backup_folder)
+            else:
+                job.record = job.engine.run_media_backup(job.backup_folder, job.media_type)
+        except Exception as e:
+            job.error = str(e)
+            job.state = FAILED
+            job.status = f"Error: {e}"
+        else:
+            if job.engine.canceled:
+                job.state = CANCELED
+                job.status = "Canceled"
+            else:
+                job.state = DONE
+                job.percent = 100
+                job.status = "Backup completed" if job.record else "Nothing to back up"
+                if job.record:
+                    with self._lock:
+                        self.history.append(job.record)
+        job.tracker = None
+        self.notify(job)
+
+    def notify(self, job):
+        if self.on_update:
+            self.on_update(job)
+
+    def cancel(self, serial):
+        job = self.get(serial)
+        if job and job.active:
+            job.engine.cancel()
+
+    def cancel_all(self):
+        for job in self.jobs():
+            if job.active:
+                job.engine.cancel()
+
+    def wait(self, timeout=None):
+        """Block until every submitted job has finished; returns False on timeout"""
+        with self._lock:
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join(timeout)
+            if thread.is_alive():
+                return False
+        return True
@@ -0,0 +1,126 @@
+"""Streaming tar transport from device to host
+
+`adb pull` pays a sync-protocol round trip for every file, which dominates
+when a folder holds thousands of screenshots or documents. This transport
+asks the device for one tar archive of the selected files over
+`adb exec-out` and unpacks it on the host while the bytes are arriving.
+"""
+import os
+import shlex
+import tarfile
+
+from pixel_backup.adb_client import AdbError
+from pixel_backup.manifest import DEVICE_ROOT, device_relpath
+from pixel_backup.transfer import TransferResult
+
+# Keep each device command well below the shell's argument length limit
+MAX_COMMAND_LENGTH = 64 * 1024
+
+
+def build_tar_commands(relative_paths, max_length=MAX_COMMAND_LENGTH):
+    """Split relative paths into as few `tar -c` commands as the length limit allows"""
+    prefix = f"tar -cf - -C {shlex.quote(DEVICE_ROOT.rstrip('/'))}"
+    commands = []
+    current = prefix
+    for path in relative_paths:
+        argument = " " + shlex.quote(path)
+        if len(current) + len(argument) > max_length and current != prefix:
+            commands.append(current)
+            current = prefix
+        current += argument
+    if current != prefix:
+        commands.append(current)
+    return commands
+
+
+class TarStreamPuller:
+    """Pull files as a tar stream instead of one `adb pull` per file"""
+
+    def __init__(self, client, serial=None, max_command_length=MAX_COMMAND_LENGTH, slots=None):
+        self.client = client
+        self.serial = serial
+        self.max_command_length = max_command_length
+        # Shared with other devices' transfers; one stream holds one slot
+        self.slots = slots
+
+    def extract_stream(self, stream, wanted, on_result=None, is_canceled=None, on_bytes=None, results=None):
+        """Unpack members of a streamed tar archive into their planned local paths
+
+        Results are appended to results as members arrive, so a stream that
+        breaks keeps what it delivered. A member cut off half way is deleted
+        and goes back into wanted.
+        """
+        results = [] if results is None else results
+        with tarfile.open(fileobj=stream, mode="r|") as archive:
+            for member in archive:
+                if is_canceled and is_canceled():
+                    break
+                target = wanted.pop(member.name, None)
+                if target is None or not member.isfile():
+                    continue
+                entry, local = target
+                os.makedirs(os.path.dirname(local), exist_ok=True)
+                source = archive.extractfile(member)
+                written = 0
+                try:
+                    with open(local, "wb") as f:
+                        for block in iter(lambda: source.read(1024 * 1024), b""):
+                            f.write(block)
+                            written += len(block)
+                            if on_bytes:
+                                on_bytes(len(block))
+                except BaseException:
+                    if on_bytes and written:
+                        on_bytes(-written)
+                    if os.path.exists(local):
+                        os.remove(local)
+                    wanted[member.name] = target
+                    raise
+                os.utime(local, (member.mtime, member.mtime))
+                ok = member.size == entry.size
+                if on_bytes and not ok:
+                    on_bytes(-member.size)
+                result = TransferResult(entry.path, local, entry.size, ok, None if ok else "size changed during backup")
+                results.append(result)
+                if on_result:
+                    on_result(result)
+        return results
+
+    def pull_stream(self, command, wanted, on_result=None, is_canceled=None, on_bytes=None):
+        """Run one tar command and unpack what it sends; returns the results of the members received"""
+        results = []
+        try:
+            stream = self.client.open_exec(command, self.serial)
+        except (AdbError, OSError) as e:
+            print(f"Tar stream error: {e}")
+            return results
+        try:
+            self.extract_stream(stream, wanted, on_result, is_canceled, on_bytes, results)
+        except (tarfile.TarError, AdbError, OSError) as e:
+            # What did not arrive stays in wanted and is reported by transfer()
+            print(f"Tar stream broken: {e}")
+        finally:
+            stream.close()
+        return results
+
+    def transfer(self, files, on_result=None, is_canceled=None, on_bytes=None):
+        """Pull (RemoteFile, local_path) pairs and return one TransferResult per file"""
+        results = []
+        wanted = {device_relpath(entry.path): (entry, local) for entry, local in files}
+        for command in build_tar_commands(list(wanted), self.max_command_length):
+            if is_canceled and is_canceled():
+                return results
+            if self.slots:
+                with self.slots:
+                    results.extend(self.pull_stream(command, wanted, on_result, is_canceled, on_bytes))
+            else:
+                results.extend(self.pull_stream(command, wanted, on_result, is_canceled, on_bytes))
+
+        # Whatever was requested but never arrived failed
+        if not (is_canceled and is_canceled()):
+            for entry, local in wanted.values():
+                result = TransferResult(entry.path, local, entry.size, False, "not received from device")
+                results.append(result)
+                if on_result:
+                    on_result(result)
+        return results
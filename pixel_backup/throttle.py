@@ -0,0 +1,172 @@
+"""Adaptive transfer concurrency and bandwidth caps
+
+No fixed number of parallel transfers suits every link: a USB 2 cable is
+saturated by two streams, USB 3 with fast storage keeps gaining up to eight
+or more, and slow flash on an older phone gets slower with every extra
+reader. ConcurrencyController measures the throughput the transfer actually
+achieves and moves the number of transfers in flight towards the best
+value while it runs:
+
+* every interval the bytes moved are compared with the previous interval
+* at first the limit doubles while that clearly pays off, so a fast link
+  is found within a few seconds; from then on it moves one at a time
+* after a step up, a clear gain is followed by another step up; anything
+  less is undone, since the extra transfers only added latency
+* after a step down, a clear loss is undone; no loss means the transfer
+  is not needed and the limit keeps going down
+* while holding, a clear loss (the host got busier) triggers a step down,
+  and every few intervals one step up probes whether the link got faster
+
+RateLimiter is a token bucket for an optional cap in bytes per second, so a
+backup during working hours leaves bandwidth and disk for everything else.
+"""
+import threading
+import time
+
+# Relative throughput change that counts as a real difference, not noise
+THROUGHPUT_GAIN = 0.05
+# Seconds per measurement interval
+CONTROL_INTERVAL = 1.0
+# Intervals spent holding before probing for a higher limit again
+PROBE_INTERVALS = 5
+
+
+class RateLimiter:
+    """Token bucket: consume() blocks until the bytes moved fit under rate bytes per second
+
+    Callers report bytes after moving them; the bucket may go into debt,
+    and each caller sleeps off its share, so the long-run rate never exceeds
+    the cap even with many threads. Safe to share between threads and
+    between devices.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        # One second of data may go out at full speed
+        self.burst = burst or rate
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.burst
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def consume(self, count):
+        if count <= 0 or not self.rate:
+            return
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= count
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            self.sleep(wait)
+
+
+class ConcurrencyController:
+    """A limit on transfers in flight that follows the measured throughput
+
+    Workers call acquire() before each work unit and release() after it,
+    and report bytes with add_bytes() as they arrive. The limit stays
+    between minimum and maximum.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=16, interval=CONTROL_INTERVAL, clock=time.monotonic):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.interval = interval
+        self.clock = clock
+        self.active = 0
+        # Every limit the controller chose, with the throughput it measured (bytes/s)
+        self.history = []
+        self._changed = threading.Condition()
+        self._window_start = clock()
+        self._window_bytes = 0
+        self._window_units = 0
+        self._window_latency = 0.0
+        self._previous_rate = None
+        self._last_step = 0
+        self._held = 0
+        self._rebase = False
+        self._slow_start = True
+
+    def acquire(self, is_canceled=None):
+        """Wait for room under the limit; returns False if canceled while waiting"""
+        with self._changed:
+            while self.active >= self.limit:
+                if is_canceled and is_canceled():
+                    return False
+                self._changed.wait(0.25)
+            self.active += 1
+            return True
+
+    def release(self, latency=None):
+        """A work unit finished after latency seconds"""
+        with self._changed:
+            self.active -= 1
+            if latency is not None:
+                self._window_units += 1
+                self._window_latency += latency
+            self._update()
+            self._changed.notify_all()
+
+    def add_bytes(self, count):
+        with self._changed:
+            self._window_bytes += count
+            self._update()
+
+    def _update(self):
+        """Close the measurement window once it is long enough; caller holds the lock"""
+        now = self.clock()
+        elapsed = now - self._window_start
+        if elapsed < self.interval:
+            return
+        rate = self._window_bytes / elapsed
+        latency = self._window_latency / self._window_units if self._window_units else None
+        self.history.append((self.limit, rate, latency))
+        self._window_start = now
+        self._window_bytes = 0
+        self._window_units = 0
+        self._window_latency = 0.0
+        if rate <= 0:
+            # Nothing arrived (failures, or a cancel): no evidence either way
+            return
+
+        previous = self._previous_rate
+        self._previous_rate = rate
+        if self._rebase:
+            # The limit just went back to one measured before; start comparing from here
+            self._rebase = False
+            return
+        if previous is None:
+            self._step(self.increase())
+            return
+        change = (rate - previous) / previous
+        if self._last_step > 0:
+            if change > THROUGHPUT_GAIN:
+                self._step(self.increase())
+            else:
+                self._slow_start = False
+                self._step(-self._last_step, hold=True)
+        elif self._last_step < 0:
+            if change < -THROUGHPUT_GAIN:
+                self._step(1, hold=True)
+            else:
+                self._step(-1)
+        elif change < -THROUGHPUT_GAIN:
+            self._step(-1)
+        else:
+            self._held += 1
+            if self._held >= PROBE_INTERVALS:
+                self._step(1)
+
+    def increase(self):
+        return self.limit if self._slow_start else 1
+
+    def _step(self, amount, hold=False):
+        limit = min(max(self.limit + amount, self.minimum), self.maximum)
+        self._last_step = 0 if hold else limit - self.limit
+        self._rebase = hold
+        self._held = 0
+        self.limit = limit
@@ -0,0 +1,352 @@
+"""Thumbnails for the file preview
+
+Camera JPEGs carry a small thumbnail in their EXIF block, within the first
+64 KB of the file, so a thumbnail costs a `head -c` over exec-out instead of a
+pull of the whole photo. Other images are read whole only when they are small
+(screenshots); videos and large files without one get no thumbnail.
+
+Decoding and scaling runs in a process pool, off the Tk thread and out of the
+GIL. Finished thumbnails go to ThumbnailCache, an on-disk LRU keyed by device
+path, size and mtime, so reopening a preview draws straight from disk.
+"""
+import hashlib
+import importlib.util
+import io
+import multiprocessing
+import os
+import queue
+import shlex
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+THUMBNAIL_SIZE = 64
+# Bytes read from the start of a JPEG; an EXIF block is at most 64 KB
+HEAD_BYTES = 72 * 1024
+# Images without an embedded thumbnail are read whole up to this size
+FULL_READ_LIMIT = 4 * 1024 * 1024
+CACHE_LIMIT = 256 * 1024 * 1024
+
+JPEG_EXTENSIONS = (".jpg", ".jpeg")
+IMAGE_EXTENSIONS = JPEG_EXTENSIONS + (".png", ".webp", ".gif", ".bmp")
+
+# EXIF orientation -> PIL transpose method (FLIP_LEFT_RIGHT=0 ... TRANSVERSE=6)
+ORIENTATION_TRANSPOSE = {2: 0, 3: 3, 4: 1, 5: 5, 6: 4, 7: 6, 8: 2}
+
+
+def thumbnails_available():
+    """Whether thumbnails can be rendered here (they need Pillow)"""
+    return importlib.util.find_spec("PIL") is not None
+
+
+def default_cache_dir():
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "pixel_backup", "thumbnails")
+
+
+def exif_thumbnail(data):
+    """(thumbnail JPEG bytes, orientation) from the start of a JPEG, or (None, 1)"""
+    if data[:2] != b"\xff\xd8":
+        return None, 1
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            break
+        marker = data[pos + 1]
+        if marker in (0xD9, 0xDA):
+            # End of image or start of the compressed data: no EXIF block
+            break
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        if marker == 0xE1 and data[pos + 4:pos + 10] == b"Exif\0\0":
+            return tiff_thumbnail(data[pos + 10:pos + 2 + length])
+        pos += 2 + length
+    return None, 1
+
+
+def tiff_thumbnail(tiff):
+    """Thumbnail and orientation from the TIFF structure inside an EXIF block"""
+    order = {b"II": "little", b"MM": "big"}.get(tiff[:2])
+    if order is None:
+        return None, 1
+
+    def number(offset, size):
+        if offset + size > len(tiff):
+            raise ValueError("truncated EXIF block")
+        return int.from_bytes(tiff[offset:offset + size], order)
+
+    orientation = 1
+    try:
+        ifd0 = number(4, 4)
+        count = number(ifd0, 2)
+        for i in range(count):
+            entry = ifd0 + 2 + 12 * i
+            if number(entry, 2) == 0x0112:
+                orientation = number(entry + 8, 2)
+        # IFD1 describes the thumbnail image
+        ifd1 = number(ifd0 + 2 + 12 * count, 4)
+        if not ifd1:
+            return None, orientation
+        offset = length = None
+        for i in range(number(ifd1, 2)):
+            entry = ifd1 + 2 + 12 * i
+            tag = number(entry, 2)
+            if tag == 0x0201:
+                offset = number(entry + 8, 4)
+            elif tag == 0x0202:
+                length = number(entry + 8, 4)
+    except ValueError:
+        return None, orientation
+    if not offset or not length:
+        return None, orientation
+    thumbnail = tiff[offset:offset + length]
+    if len(thumbnail) != length or thumbnail[:2] != b"\xff\xd8":
+        return None, orientation
+    return thumbnail, orientation
+
+
+def render_thumbnail(data, size=THUMBNAIL_SIZE, orientation=1):
+    """Process pool worker: scale image bytes to a PNG thumbnail, b"" if they cannot be decoded"""
+    from PIL import Image, ImageOps
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # JPEGs are decoded straight at a fraction of their size
+            image.draft("RGB", (size * 2, size * 2))
+            if orientation in ORIENTATION_TRANSPOSE:
+                image = image.transpose(ORIENTATION_TRANSPOSE[orientation])
+            else:
+                image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size))
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            output = io.BytesIO()
+            image.save(output, "PNG")
+            return output.getvalue()
+    except Exception:
+        return b""
+
+
+class ThumbnailCache:
+    """Size-bounded on-disk store of rendered thumbnails, least recently used evicted first
+
+    An empty entry records that a file has no thumbnail, so it is not read
+    from the device again. Recency survives restarts in the files' mtimes.
+    """
+
+    def __init__(self, root=None, max_bytes=CACHE_LIMIT):
+        self.root = root or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(path, size, mtime):
+        return hashlib.sha1(f"{path}\0{size}\0{mtime}".encode("utf-8")).hexdigest()
+
+    def file_path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.png")
+
+    def _index(self):
+        # Built on first use: key -> size, oldest first
+        if self._entries is None:
+            found = []
+            if os.path.isdir(self.root):
+                for folder in os.scandir(self.root):
+                    if not folder.is_dir():
+                        continue
+                    for entry in os.scandir(folder.path):
+                        if entry.name.endswith(".png"):
+                            stat = entry.stat()
+                            found.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+            found.sort()
+            self._entries = OrderedDict((key, size) for _, key, size in found)
+            self.total_bytes = sum(self._entries.values())
+        return self._entries
+
+    def load(self):
+        """Read the index of a large cache ahead of the first lookup"""
+        with self._lock:
+            self._index()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._index())
+
+    def get(self, key):
+        """Thumbnail PNG bytes, b"" for a file without one, None when not cached"""
+        with self._lock:
+            entries = self._index()
+            if key not in entries:
+                return None
+            entries.move_to_end(key)
+        path = self.file_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self.total_bytes -= size
+            return None
+        return data
+
+    def put(self, key, data):
+        path = self.file_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            entries = self._index()
+            self.total_bytes += len(data) - entries.pop(key, 0)
+            entries[key] = len(data)
+            evicted = []
+            while self.total_bytes > self.max_bytes and len(entries) > 1:
+                old_key, size = entries.popitem(last=False)
+                self.total_bytes -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self.file_path(old_key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            for key in self._index():
+                try:
+                    os.remove(self.file_path(key))
+                except OSError:
+                    pass
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+class ThumbnailLoader:
+    """Fetch thumbnails of device files in the background
+
+    show(entries) is called from the Tk thread with the RemoteFile entries on
+    screen. It returns the cached thumbnails at once and queues the others,
+    dropping earlier requests for rows that have scrolled away. Reader
+    threads fetch the bytes from the device, the process pool renders them,
+    and on_ready(key, data) is called from a worker thread with the PNG
+    bytes (b"" when a file has no thumbnail).
+    """
+
+    def __init__(self, adb, serial, cache=None, on_ready=None, size=THUMBNAIL_SIZE, readers=4, processes=None):
+        self.adb = adb
+        self.serial = serial
+        self.cache = cache if cache is not None else ThumbnailCache()
+        self.on_ready = on_ready
+        self.size = size
+        self.closed = threading.Event()
+        self._wanted = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._queue = queue.LifoQueue()
+        self.readers = readers
+        # spawn: forking a process that runs Tk is not safe
+        self.pool = ProcessPoolExecutor(processes or min(4, os.cpu_count() or 1),
+                                        mp_context=multiprocessing.get_context("spawn"))
+        for _ in range(readers):
+            threading.Thread(target=self.read_loop, daemon=True).start()
+
+    def show(self, entries):
+        """Cached thumbnails for entries as {key: data}; the rest are fetched in the background"""
+        found = {}
+        wanted = {}
+        for entry in entries:
+            key = ThumbnailCache.key(entry.path, entry.size, entry.mtime)
+            data = self.cache.get(key)
+            if data is not None:
+                found[key] = data
+            elif entry.path.lower().endswith(IMAGE_EXTENSIONS):
+                wanted[key] = entry
+            else:
+                found[key] = b""
+        with self._lock:
+            self._wanted = wanted
+            new = [key for key in wanted if key not in self._pending]
+            self._pending.update(new)
+        # The queue is last in, first out: the top row on screen is read first
+        for key in reversed(new):
+            self._queue.put(key)
+        return found
+
+    def read_loop(self):
+        while True:
+            key = self._queue.get()
+            if key is None or self.closed.is_set():
+                return
+            with self._lock:
+                entry = self._wanted.get(key)
+                if entry is None:
+                    # Scrolled away before its turn; show() queues it again if it comes back
+                    self._pending.discard(key)
+                    continue
+            try:
+                data, orientation = self.read_source(entry)
+            except Exception as e:
+                # Not cached: the device may simply have gone away
+                print(f"Error reading thumbnail of {entry.path}: {e}")
+                with self._lock:
+                    self._pending.discard(key)
+                continue
+            if self.closed.is_set():
+                return
+            if not data:
+                self.finish(key, b"")
+                continue
+            try:
+                future = self.pool.submit(render_thumbnail, data, self.size, orientation)
+            except RuntimeError:
+                # The pool was shut down by close()
+                return
+            future.add_done_callback(lambda future, key=key: self.rendered(key, future))
+
+    def read_source(self, entry):
+        """Image bytes to render a thumbnail from and their EXIF orientation; (None, 1) if there are none"""
+        if entry.path.lower().endswith(JPEG_EXTENSIONS):
+            thumbnail, orientation = exif_thumbnail(self.read(entry.path, HEAD_BYTES))
+            if thumbnail:
+                return thumbnail, orientation
+        if entry.size <= FULL_READ_LIMIT:
+            return self.read(entry.path), 1
+        return None, 1
+
+    def read(self, path, count=None):
+        command = f"head -c {count} {shlex.quote(path)}" if count else f"cat {shlex.quote(path)}"
+        stream = self.adb.open_exec(command, self.serial)
+        try:
+            return stream.read()
+        finally:
+            stream.close()
+
+    def rendered(self, key, future):
+        if future.cancelled() or self.closed.is_set():
+            return
+        try:
+            data = future.result()
+        except Exception as e:
+            print(f"Error rendering thumbnail: {e}")
+            data = b""
+        self.finish(key, data)
+
+    def finish(self, key, data):
+        try:
+            self.cache.put(key, data)
+        except OSError as e:
+            print(f"Error caching thumbnail: {e}")
+        with self._lock:
+            self._pending.discard(key)
+        if self.on_ready and not self.closed.is_set():
+            self.on_ready(key, data)
+
+    def close(self):
+        self.closed.set()
+        for _ in range(self.readers):
+            self._queue.put(None)
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,302 @@
+"""Pulling individual files from the device
+
+The file list is split into work units that a pool of worker threads pulls
+concurrently. Large files become one unit each, while small files sharing a
+destination folder are grouped together. Units are queued largest first, so a
+few huge videos start early instead of holding up the tail of the transfer.
+
+With an adb server available, each worker pulls its files over a pooled
+sync connection; otherwise a unit is one (multi-source) `adb pull` process.
+When several devices are backed up at once, a shared semaphore (slots) caps
+how many units are being pulled on this host at any time. With keep_partial,
+files cut off by a cancel or a lost connection stay on disk for a resume.
+With a controller (throttle.ConcurrencyController) the number of units in
+flight follows the measured throughput instead of staying at workers.
+
+Over Wi-Fi (see wireless.py), a reconnect callback brings a dropped device
+back and the interrupted file is continued from where it stopped, and with
+compress, files that compress well cross the link gzipped.
+"""
+import os
+import queue
+import shlex
+import subprocess
+import threading
+import time
+import zlib
+from collections import defaultdict, namedtuple
+
+from pixel_backup.adb_client import AdbError
+from pixel_backup.wireless import is_wire_compressible
+
+TransferResult = namedtuple("TransferResult", ["remote", "local", "size", "ok", "error"])
+
+# Retries of one file after its device was reconnected
+RECONNECT_RETRIES = 3
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+
+def continue_pull(client, serial, remote, path, length=0, on_bytes=None, is_canceled=None, compressed=False):
+    """Append the device file remote, from byte length on, to the local file path
+
+    The bytes come over `exec-out tail`; with compressed the device gzips
+    them and they are unpacked here as they arrive. on_bytes counts the
+    unpacked bytes. Raises AdbError if the stream is cut off.
+    """
+    command = f"tail -c +{length + 1} {shlex.quote(remote)}"
+    if compressed:
+        command += " | gzip -c -1"
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if compressed else None
+    stream = client.open_exec(command, serial)
+    try:
+        with open(path, "ab" if length else "wb") as f:
+            for block in iter(lambda: stream.read(STREAM_BLOCK_SIZE), b""):
+                if decompressor is not None:
+                    # Bounded output per call: a file of zeros unpacks a thousandfold
+                    data = decompressor.decompress(block, STREAM_BLOCK_SIZE)
+                    while data:
+                        f.write(data)
+                        if on_bytes:
+                            on_bytes(len(data))
+                        data = decompressor.decompress(decompressor.unconsumed_tail, STREAM_BLOCK_SIZE)
+                else:
+                    f.write(block)
+                    if on_bytes:
+                        on_bytes(len(block))
+                if is_canceled and is_canceled():
+                    raise AdbError("canceled")
+            if decompressor is not None:
+                data = decompressor.flush()
+                f.write(data)
+                if on_bytes and data:
+                    on_bytes(len(data))
+                if not decompressor.eof:
+                    raise AdbError(f"compressed stream of {remote} ended early")
+    finally:
+        stream.close()
+
+
+def plan_work_units(files, batch_size=64, small_file_limit=4 * 1024 * 1024):
+    """Group (RemoteFile, local_path) pairs into work units ordered largest first"""
+    units = []
+    small = defaultdict(list)
+    for entry, local in files:
+        if entry.size >= small_file_limit:
+            units.append([(entry, local)])
+        else:
+            small[os.path.dirname(local)].append((entry, local))
+
+    for group in small.values():
+        batch = []
+        batch_bytes = 0
+        for item in group:
+            batch.append(item)
+            batch_bytes += item[0].size
+            if len(batch) >= batch_size or batch_bytes >= small_file_limit:
+                units.append(batch)
+                batch = []
+                batch_bytes = 0
+        if batch:
+            units.append(batch)
+
+    units.sort(key=lambda unit: sum(entry.size for entry, _ in unit), reverse=True)
+    return units
+
+
+class ParallelPuller:
+    """Pull files with several concurrent workers"""
+
+    def __init__(self, client, serial=None, workers=4, batch_size=64, small_file_limit=4 * 1024 * 1024,
+                 slots=None, keep_partial=False, controller=None, reconnect=None, compress=False):
+        self.client = client
+        self.serial = serial
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.small_file_limit = small_file_limit
+        self.slots = slots
+        self.keep_partial = keep_partial
+        self.controller = controller
+        # Called after a failed file; True once the device is reachable again
+        self.reconnect = reconnect
+        self.compress = compress
+
+    def pull_unit(self, unit, on_bytes=None, is_canceled=None):
+        """Pull one work unit and return a TransferResult per file"""
+        if self.client.server_available():
+            return self.pull_unit_sync(unit, on_bytes, is_canceled)
+        return self.pull_unit_process(unit, on_bytes, is_canceled)
+
+    def pull_unit_sync(self, unit, on_bytes=None, is_canceled=None):
+        """Pull a unit file by file over a pooled sync connection"""
+        results = []
+        for entry, local in unit:
+            if is_canceled and is_canceled():
+                break
+            os.makedirs(os.path.dirname(local), exist_ok=True)
+            received = [0]
+
+            def count(length):
+                received[0] += length
+                if on_bytes:
+                    on_bytes(length)
+
+            try:
+                self.pull_file(entry, local, count, is_canceled)
+                ok = os.path.getsize(local) == entry.size
+                error = None if ok else "size changed during backup"
+            except (AdbError, OSError) as e:
+                ok = False
+                error = str(e)
+            if on_bytes:
+                # Settle the byte count: the whole file if it made it, nothing if not
+                delta = (entry.size if ok else 0) - received[0]
+                if delta:
+                    on_bytes(delta)
+            results.append(TransferResult(entry.path, local, entry.size, ok, error))
+        return results
+
+    def pull_file(self, entry, local, on_bytes=None, is_canceled=None):
+        """Pull one file to local, raising AdbError or OSError on failure
+
+        With reconnect, a lost connection is re-established and the file
+        continued after the bytes that already arrived.
+        """
+        compressed = self.compress and is_wire_compressible(entry.path, entry.size)
+        tmp_path = local + ".part"
+        keep_partial = self.keep_partial or self.reconnect is not None
+        retries = RECONNECT_RETRIES if self.reconnect else 0
+        length = 0
+        while True:
+            try:
+                if compressed or length:
+                    continue_pull(self.client, self.serial, entry.path, tmp_path, length, on_bytes, is_canceled,
+                                  compressed)
+                    if os.path.getsize(tmp_path) < entry.size:
+                        # An exec stream just ends when the connection drops
+                        raise AdbError(f"transfer of {entry.path} was cut off")
+                    os.replace(tmp_path, local)
+                    os.utime(local, (entry.mtime, entry.mtime))
+                else:
+                    self.client.pull(entry.path, local, self.serial, on_bytes, is_canceled, entry.mtime,
+                                     keep_partial)
+                return
+            except (AdbError, OSError):
+                canceled = is_canceled and is_canceled()
+                if canceled or not retries or not self.reconnect(is_canceled):
+                    if not self.keep_partial and os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+                retries -= 1
+                length = os.path.getsize(tmp_path) if os.path.exists(tmp_path) else 0
+
+    def pull_unit_process(self, unit, on_bytes=None, is_canceled=None, poll_interval=0.25):
+        """Pull a unit with one `adb pull` process and check every file in it
+
+        While adb runs, the sizes of the unit's local files are polled so
+        on_bytes sees progress inside large files, not just at the end.
+        """
+        folder = os.path.dirname(unit[0][1])
+        os.makedirs(folder, exist_ok=True)
+        if len(unit) == 1:
+            # Single files go straight to their final name
+            command = self.client.command(self.serial, 'pull', '-a', unit[0][0].path, unit[0][1])
+        else:
+            command = self.client.command(self.serial, 'pull', '-a', *[entry.path for entry, _ in unit], folder)
+
+        reported = [0] * len(unit)
+
+        def report_sizes():
+            for i, (entry, local) in enumerate(unit):
+                try:
+                    size = min(os.path.getsize(local), entry.size)
+                except OSError:
+                    continue
+                if size != reported[i]:
+                    on_bytes(size - reported[i])
+                    reported[i] = size
+
+        error = ""
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            while True:
+                try:
+                    error = process.communicate(timeout=poll_interval)[1].strip()
+                    break
+                except subprocess.TimeoutExpired:
+                    if is_canceled and is_canceled():
+                        process.kill()
+                        process.wait()
+                        error = "canceled"
+                        break
+                    if on_bytes:
+                        report_sizes()
+        except OSError as e:
+            error = str(e)
+
+        results = []
+        for i, (entry, local) in enumerate(unit):
+            ok = os.path.isfile(local) and os.path.getsize(local) == entry.size
+            if on_bytes:
+                # Settle the byte count: the whole file if it made it, nothing if not
+                delta = (entry.size if ok else 0) - reported[i]
+                if delta:
+                    on_bytes(delta)
+            results.append(TransferResult(entry.path, local, entry.size, ok, None if ok else error or "missing after pull"))
+        return results
+
+    def transfer(self, files, on_result=None, is_canceled=None, on_bytes=None):
+        """Pull (RemoteFile, local_path) pairs and return one TransferResult per file
+
+        A failing file never stops the rest of the transfer. Files not started
+        because the transfer was canceled are left out of the results.
+        on_bytes is called with the number of bytes moved as they arrive.
+        """
+        work = queue.Queue()
+        for unit in plan_work_units(files, self.batch_size, self.small_file_limit):
+            work.put(unit)
+
+        results = []
+        lock = threading.Lock()
+        controller = self.controller
+        if controller:
+            report = on_bytes
+
+            def on_bytes(count):
+                controller.add_bytes(count)
+                if report:
+                    report(count)
+
+        def worker():
+            while not (is_canceled and is_canceled()):
+                if controller and not controller.acquire(is_canceled):
+                    return
+                try:
+                    unit = work.get_nowait()
+                except queue.Empty:
+                    if controller:
+                        controller.release()
+                    return
+                started = time.monotonic()
+                try:
+                    if self.slots:
+                        with self.slots:
+                            unit_results = self.pull_unit(unit, on_bytes, is_canceled)
+                    else:
+                        unit_results = self.pull_unit(unit, on_bytes, is_canceled)
+                finally:
+                    if controller:
+                        controller.release(time.monotonic() - started)
+                for result in unit_results:
+                    with lock:
+                        results.append(result)
+                        if on_result:
+                            on_result(result)
+
+        # With a controller every worker it may allow is started; the rest wait for their turn
+        workers = controller.maximum if controller else self.workers
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(min(workers, work.qsize()))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
@@ -0,0 +1,386 @@
+"""Backup integrity verification
+
+Every file of a backup (a folder, a ZIP or an indexed archive) is hashed on the host and
+compared with the same file hashed on the device. Both sides run at once:
+
+* the device hashes in batched commands, thousands of paths per
+  `sha256sum` call, several calls in parallel; a batched `stat` first picks
+  out device files that changed since the backup, which cannot be compared
+* the host hashes with a pool of threads, files through mmap and archive
+  members through large reads, so a big backup is read at close to disk
+  speed (hashlib and zlib release the GIL)
+
+Files without a device copy (e.g. system_data.ab) are compared with a hash
+known from earlier; the first verification records the one they have. Results are kept next to the backup in
+`<location>.verify.json`. Re-verifying only hashes local files whose size
+and mtime (archive members: size and CRC) changed, and device files whose size
+and mtime changed; a full check hashes everything again.
+"""
+import hashlib
+import json
+import mmap
+import os
+import shlex
+import threading
+import zipfile
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pixel_backup.archive import IndexedArchive, is_indexed_archive, read_index
+from pixel_backup.journal import JOURNAL_FILE, PARTIAL_SUFFIX
+from pixel_backup.object_store import is_remote_location
+from pixel_backup.scan import STAT_FORMAT, RemoteFile, parse_scan_line
+from pixel_backup.tar_stream import MAX_COMMAND_LENGTH
+
+HASH_ALGORITHM = "sha256"
+VERIFY_SUFFIX = ".verify.json"
+BLOCK_SIZE = 16 * 1024 * 1024
+
+OK = "ok"
+MISMATCH = "mismatch"
+UNREADABLE = "unreadable"
+# Nothing to compare with yet: no device copy, and no hash known from earlier
+UNCHECKED = "unchecked"
+
+VerifyResult = namedtuple("VerifyResult", ["member", "device_path", "status", "local_hash", "reference_hash",
+                                           "detail"])
+
+
+def verification_path(location):
+    """Where the results for the backup at location are stored"""
+    return location.rstrip("/\\") + VERIFY_SUFFIX
+
+
+def hash_local_file(path, algorithm=HASH_ALGORITHM, on_bytes=None):
+    """Hash a file through a read-only memory map, block by block"""
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if hasattr(mapped, "madvise"):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                view = memoryview(mapped)
+                try:
+                    for offset in range(0, size, BLOCK_SIZE):
+                        block = view[offset:offset + BLOCK_SIZE]
+                        digest.update(block)
+                        block.release()
+                        if on_bytes:
+                            on_bytes(min(BLOCK_SIZE, size - offset))
+                finally:
+                    view.release()
+    return digest.hexdigest()
+
+
+def hash_stream(stream, algorithm=HASH_ALGORITHM, on_bytes=None):
+    digest = hashlib.new(algorithm)
+    for block in iter(lambda: stream.read(BLOCK_SIZE), b""):
+        digest.update(block)
+        if on_bytes:
+            on_bytes(len(block))
+    return digest.hexdigest()
+
+
+def build_device_commands(program, paths, max_length=MAX_COMMAND_LENGTH):
+    """Split device paths into as few `program path...` commands as the length limit allows"""
+    commands = []
+    current = program
+    for path in paths:
+        argument = " " + shlex.quote(path)
+        if len(current) + len(argument) > max_length and current != program:
+            commands.append(current + " 2>/dev/null")
+            current = program
+        current += argument
+    if current != program:
+        commands.append(current + " 2>/dev/null")
+    return commands
+
+
+def run_device_commands(adb, serial, commands, workers=4):
+    """Run device shell commands in parallel; yields their output lines in order"""
+    def run(command):
+        _, output, _ = adb.shell(command, serial, timeout=None)
+        return output.decode("utf-8", "replace").splitlines()
+
+    with ThreadPoolExecutor(workers) as pool:
+        for lines in pool.map(run, commands):
+            yield from lines
+
+
+def stat_device_files(adb, serial, paths, workers=4):
+    """device path -> (size, mtime) for the paths that exist, in batched `stat` commands"""
+    stats = {}
+    commands = build_device_commands(f"stat -c {shlex.quote(STAT_FORMAT)}", paths)
+    for line in run_device_commands(adb, serial, commands, workers):
+        entry = parse_scan_line(line)
+        if entry is not None:
+            stats[entry.path] = (entry.size, entry.mtime)
+    return stats
+
+
+def device_hashes(adb, serial, paths, algorithm=HASH_ALGORITHM, workers=4):
+    """device path -> hash, in batched `sha256sum` commands"""
+    hashes = {}
+    commands = build_device_commands(f"{algorithm}sum", paths)
+    for line in run_device_commands(adb, serial, commands, workers):
+        digest, _, path = line.partition("  ")
+        if path:
+            hashes[path] = digest.strip().lower()
+    return hashes
+
+
+def verify_streamed(adb, serial, device_files, hashes, is_canceled=None, workers=4, algorithm=HASH_ALGORITHM):
+    """Compare files that were hashed while they streamed to their destination with the device
+
+    For backups that never land on this host (see object_store.py).
+    device_files and hashes map members to the RemoteFile they came from and
+    the hash of the bytes sent. Returns a VerifyResult per member.
+    """
+    stats = stat_device_files(adb, serial, [entry.path for entry in device_files.values()], workers)
+    unchanged = [entry.path for entry in device_files.values() if stats.get(entry.path) == (entry.size, entry.mtime)]
+    references = {} if is_canceled and is_canceled() else device_hashes(adb, serial, unchanged, algorithm, workers)
+    results = []
+    for member in sorted(device_files):
+        entry = device_files[member]
+        local_hash = hashes.get(member)
+        reference = references.get(entry.path)
+        detail = None
+        if local_hash is None:
+            status, detail = UNREADABLE, "not hashed during the transfer"
+        elif reference is None:
+            status = UNCHECKED
+            if entry.path not in stats:
+                detail = "gone from device"
+            elif entry.path in unchanged:
+                detail = "not hashed on the device"
+            else:
+                detail = "changed on device since the backup"
+        else:
+            status = OK if reference == local_hash else MISMATCH
+        results.append(VerifyResult(member, entry.path, status, local_hash, reference, detail))
+    return results
+
+
+def catalog_references(catalog, location):
+    """(device serial, device_files, known_hashes) of the backup at location, from a BackupCatalog"""
+    backups = catalog.backups_at(location)
+    if not backups:
+        return None, {}, {}
+    backup = max(backups, key=lambda b: b["id"])
+    device_files = {}
+    known_hashes = {}
+    for catalog_file in catalog.files(backup["id"]):
+        if catalog_file["path"]:
+            device_files[catalog_file["member"]] = RemoteFile(catalog_file["path"], catalog_file["size"],
+                                                              catalog_file["mtime"])
+        if catalog_file["hash"]:
+            known_hashes[catalog_file["member"]] = catalog_file["hash"]
+    return backup["device"] or None, device_files, known_hashes
+
+
+class BackupVerifier:
+    """Verify the backup at location (a folder, a ZIP archive or an indexed archive)
+
+    With adb and serial the files are compared with the device, otherwise
+    only with hashes known from earlier verifications or the caller.
+    """
+
+    def __init__(self, location, adb=None, serial=None, workers=None, device_workers=4,
+                 algorithm=HASH_ALGORITHM):
+        self.location = location
+        self.adb = adb
+        self.serial = serial
+        self.workers = workers or min(8, (os.cpu_count() or 2))
+        self.device_workers = device_workers
+        self.algorithm = algorithm
+        if is_remote_location(location):
+            raise ValueError(f"{location} is in object storage; it was verified while it was uploaded")
+        self.is_indexed = is_indexed_archive(location)
+        self.is_zip = not self.is_indexed and os.path.isfile(location) and zipfile.is_zipfile(location)
+        if not self.is_zip and not self.is_indexed and not os.path.isdir(location):
+            raise ValueError(f"{location} is not a backup folder or archive")
+        self._local = threading.local()
+
+    # -- local side ------------------------------------------------------
+
+    def local_files(self):
+        """member -> (size, stamp); the stamp changes when the stored bytes do"""
+        if self.is_indexed:
+            return {name: (entry.size, entry.crc) for name, entry in read_index(self.location)[0].items()}
+        files = {}
+        if self.is_zip:
+            with zipfile.ZipFile(self.location) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        files[info.filename] = (info.file_size, info.CRC)
+            return files
+        for root, _, names in os.walk(self.location):
+            for name in names:
+                if name == JOURNAL_FILE or name.endswith(PARTIAL_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                files[os.path.relpath(path, self.location).replace(os.sep, "/")] = (stat.st_size, int(stat.st_mtime))
+        return files
+
+    def hash_member(self, member, on_bytes=None):
+        if not self.is_zip and not self.is_indexed:
+            return hash_local_file(os.path.join(self.location, member), self.algorithm, on_bytes)
+        # One archive handle per thread, so members decompress in parallel
+        archive = getattr(self._local, "archive", None)
+        if archive is None:
+            archive = self._local.archive = (IndexedArchive if self.is_indexed else zipfile.ZipFile)(self.location)
+        with archive.open(member) as stream:
+            return hash_stream(stream, self.algorithm, on_bytes)
+
+    # -- device side -----------------------------------------------------
+
+    def device_hashes(self, paths):
+        """device path -> hash"""
+        return device_hashes(self.adb, self.serial, paths, self.algorithm, self.device_workers)
+
+    # -- verification ----------------------------------------------------
+
+    def load_results(self):
+        try:
+            with open(verification_path(self.location), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data.get("files", {}) if data.get("algorithm") == self.algorithm else {}
+
+    def save_results(self, stored):
+        path = verification_path(self.location)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"algorithm": self.algorithm, "verified": datetime.now().strftime("%Y-%m-%d %H:%M"),
+                       "files": stored}, f)
+        os.replace(tmp_path, path)
+
+    def verify(self, device_files=None, known_hashes=None, full=False, on_bytes=None, on_total=None,
+               is_canceled=None, store=True, on_file=None):
+        """Hash and compare every file of the backup; returns a VerifyResult per file
+
+        device_files maps members to the RemoteFile they were backed up from;
+        known_hashes maps members to hashes recorded earlier. on_total is
+        called once with the number of bytes and files that will be hashed on
+        the host, on_file with True or False as each of them is hashed or
+        fails to read.
+        """
+        device_files = device_files or {}
+        known_hashes = known_hashes or {}
+        previous = self.load_results()
+        files = self.local_files()
+
+        # Local files unchanged since the last verification keep their hash
+        local_hashes = {}
+        to_hash = []
+        for member, (size, stamp) in files.items():
+            earlier = previous.get(member)
+            if (not full and earlier and earlier.get("size") == size and earlier.get("stamp") == stamp
+                    and earlier.get("hash")):
+                local_hashes[member] = earlier["hash"]
+            else:
+                to_hash.append(member)
+        # Largest first, so one huge video does not finish last on its own
+        to_hash.sort(key=lambda member: files[member][0], reverse=True)
+        if on_total:
+            on_total(sum(files[member][0] for member in to_hash), len(to_hash))
+
+        errors = {}
+
+        def hash_one(member):
+            if is_canceled and is_canceled():
+                return
+            try:
+                local_hashes[member] = self.hash_member(member, on_bytes)
+            except (OSError, ValueError, zlib.error, zipfile.BadZipFile, RuntimeError, EOFError) as e:
+                errors[member] = str(e)
+            if on_file:
+                on_file(member not in errors)
+
+        pool = ThreadPoolExecutor(self.workers)
+        local_done = [pool.submit(hash_one, member) for member in to_hash]
+
+        # Meanwhile the device checks which originals are unchanged and hashes those
+        device_hashes = {}
+        changed = {}
+        if self.adb is not None and device_files:
+            by_path = {entry.path: member for member, entry in device_files.items() if member in files}
+            stats = stat_device_files(self.adb, self.serial, list(by_path), self.device_workers)
+            to_hash_device = []
+            for path, member in by_path.items():
+                entry = device_files[member]
+                if stats.get(path) != (entry.size, entry.mtime):
+                    changed[member] = "gone from device" if path not in stats else "changed on device since the backup"
+                    continue
+                earlier = (previous.get(member) or {}).get("device")
+                if not full and earlier and earlier.get("size") == entry.size and earlier.get("mtime") == entry.mtime:
+                    device_hashes[member] = earlier["hash"]
+                else:
+                    to_hash_device.append(path)
+            if is_canceled and is_canceled():
+                to_hash_device = []
+            for path, digest in self.device_hashes(to_hash_device).items():
+                if path in by_path:
+                    device_hashes[by_path[path]] = digest
+        for future in local_done:
+            future.result()
+        pool.shutdown()
+
+        results = []
+        stored = {}
+        for member in sorted(files):
+            size, stamp = files[member]
+            entry = device_files.get(member)
+            local_hash = local_hashes.get(member)
+            reference = device_hashes.get(member)
+            detail = None
+            if reference is None:
+                reference = known_hashes.get(member) or (previous.get(member) or {}).get("reference")
+                if entry is not None:
+                    detail = changed.get(member) or "not hashed on the device"
+            if member in errors:
+                status, detail = UNREADABLE, errors[member]
+            elif local_hash is None:
+                # Canceled before it was hashed
+                continue
+            elif reference is None:
+                status = UNCHECKED
+            else:
+                status = OK if reference == local_hash else MISMATCH
+            results.append(VerifyResult(member, entry.path if entry else None, status, local_hash, reference, detail))
+            if local_hash is not None:
+                # What later verifications compare with when the device cannot be asked
+                if status in (OK, UNCHECKED):
+                    kept = local_hash
+                else:
+                    kept = (previous.get(member) or {}).get("reference")
+                record = {"size": size, "stamp": stamp, "hash": local_hash, "status": status, "reference": kept}
+                if member in device_hashes:
+                    record["device"] = {"size": entry.size, "mtime": entry.mtime, "hash": device_hashes[member]}
+                stored[member] = record
+        if store and not (is_canceled and is_canceled()):
+            try:
+                self.save_results(stored)
+            except OSError as e:
+                print(f"Could not store verification results: {e}")
+        return results
+
+
+def summarize(results):
+    """One line describing a verification"""
+    counts = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    text = f"Verified {counts.get(OK, 0)} of {len(results)} files"
+    if counts.get(MISMATCH):
+        text += f", {counts[MISMATCH]} mismatched"
+    if counts.get(UNREADABLE):
+        text += f", {counts[UNREADABLE]} unreadable"
+    if counts.get(UNCHECKED):
+        text += f", {counts[UNCHECKED]} without a reference"
+    return text
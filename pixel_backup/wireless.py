@@ -0,0 +1,136 @@
+"""Backups over wireless debugging (ADB over Wi-Fi)
+
+A phone with wireless debugging turned on is attached with `adb connect
+host:port` (after a one-time `adb pair` with the code the phone shows) and
+then appears in the device list with its address as serial. Everything else
+works as over USB, with two differences this module takes care of:
+
+* Wi-Fi drops. WirelessLink re-attaches the device when a transfer loses
+  it, so the transfer continues the file it was pulling instead of failing
+  the rest of the backup.
+* The link is slow next to USB. Files that compress well (documents,
+  downloads, text) are gzipped on the device and unpacked on the host while
+  they arrive; photos, videos and archives are compressed already and go
+  over raw, as gzip would only cost device CPU.
+"""
+import threading
+import time
+
+from pixel_backup.adb_client import AdbError
+from pixel_backup.compression import is_compressible
+
+DEFAULT_PORT = 5555
+RECONNECT_ATTEMPTS = 5
+RECONNECT_DELAY = 2.0
+# Files below this size gain too little to be worth a separate compressed stream
+WIRE_COMPRESSION_MIN_SIZE = 64 * 1024
+# Serials of devices adb found through mDNS; adb attaches them again by itself
+MDNS_SERVICE = "._adb-tls-connect."
+
+
+def normalize_address(address):
+    """host:port, with the default wireless debugging port if none is given"""
+    address = address.strip()
+    if ":" not in address:
+        return f"{address}:{DEFAULT_PORT}"
+    return address
+
+
+def is_wireless_serial(serial):
+    """True for devices attached over Wi-Fi: `host:port` or an mDNS service name"""
+    if not serial:
+        return False
+    return MDNS_SERVICE in serial or ":" in serial
+
+
+def connect_wireless(adb, address):
+    """Attach the device at address; returns its serial or raises AdbError with adb's message"""
+    address = normalize_address(address)
+    message = adb.connect_device(address)
+    if not message.startswith(("connected to", "already connected to")):
+        raise AdbError(message or f"cannot connect to {address}")
+    return address
+
+
+def pair_wireless(adb, address, code):
+    """Pair with the device showing code at its pairing address; raises AdbError on failure"""
+    message = adb.pair_device(address.strip(), code.strip())
+    if not message.startswith("Successfully paired"):
+        raise AdbError(message or f"cannot pair with {address}")
+    return message
+
+
+def is_wire_compressible(path, size):
+    """True if a file is worth compressing on its way over the link"""
+    return size >= WIRE_COMPRESSION_MIN_SIZE and is_compressible(path)
+
+
+def device_has_gzip(adb, serial):
+    """True if the device shell can gzip (toybox has it since Android 10)"""
+    try:
+        status, output, _ = adb.shell("echo ok | gzip -c -1 | gzip -dc", serial, timeout=10)
+    except (AdbError, OSError):
+        return False
+    return status == 0 and output.strip() == b"ok"
+
+
+class WirelessLink:
+    """A device attached over Wi-Fi, attached again when the link drops
+
+    reconnect() is called by transfer workers after an error. Only one of
+    them talks to adb at a time; the others find the device back online and
+    carry on.
+    """
+
+    def __init__(self, adb, serial, attempts=RECONNECT_ATTEMPTS, delay=RECONNECT_DELAY):
+        self.adb = adb
+        self.serial = serial
+        self.attempts = attempts
+        self.delay = delay
+        self.reconnects = 0
+        self._lock = threading.Lock()
+
+    def is_online(self):
+        try:
+            return any(info.serial == self.serial and info.state == "device" for info in self.adb.devices())
+        except (AdbError, OSError):
+            return False
+
+    def reconnect(self, is_canceled=None):
+        """Make sure the device is attached; returns False if it could not be reached"""
+        with self._lock:
+            if self.is_online():
+                return True
+            # Connections to the old transport are dead
+            self.adb.close(self.serial)
+            for attempt in range(self.attempts):
+                if is_canceled and is_canceled():
+                    return False
+                if attempt:
+                    time.sleep(self.delay)
+                # An mDNS serial is no address to connect to; adb attaches it again once it is seen
+                if MDNS_SERVICE not in self.serial:
+                    try:
+                        self.adb.disconnect_device(self.serial)
+                        connect_wireless(self.adb, self.serial)
+                    except (AdbError, OSError) as e:
+                        print(f"Reconnecting to {self.serial} failed: {e}")
+                        continue
+                # The device comes back as "offline" until adbd has answered
+                deadline = time.monotonic() + self.delay * 2
+                while time.monotonic() < deadline:
+                    if self.is_online():
+                        self.reconnects += 1
+                        return True
+                    time.sleep(0.1)
+            return False
+
+
+def wire_compression_enabled(config, adb, serial):
+    """Whether a backup with config should gzip compressible files on the wire"""
+    if config.wire_compression == "never":
+        return False
+    if config.wire_compression == "auto" and not is_wireless_serial(serial):
+        return False
+    return device_has_gzip(adb, serial)
+
@@ -1,42 +1,593 @@
 import os
+import platform
+import shutil
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, simpledialog
 from datetime import datetime
 import subprocess
 import threading
 from PIL import Image, ImageTk
 import zipfile
-import time
+import base64
 from collections import defaultdict
 
+from pixel_backup.adb_client import AdbClient, AdbError
+from pixel_backup.archive import IndexedArchive, is_indexed_archive, remove_archive
+from pixel_backup.catalog import BackupCatalog
+from pixel_backup.dedup_store import ContentStore
+from pixel_backup.device_watcher import DeviceWatcher
+from pixel_backup.engine import (BackupConfig, BackupEngine, BackupListener, find_adb, format_restore_stats,
+                                 format_size)
+from pixel_backup.journal import find_interrupted
+from pixel_backup.manifest import forget_backup
+from pixel_backup.object_store import is_remote_location
+from pixel_backup.preview import PreviewModel
+from pixel_backup.progress import UpdateQueue, format_duration
+from pixel_backup.restore import BackupReader
+from pixel_backup.scheduler import BackupScheduler, HostLimits
+from pixel_backup.thumbnails import ThumbnailCache, ThumbnailLoader, thumbnails_available
+from pixel_backup.verify import MISMATCH, UNREADABLE, BackupVerifier, catalog_references, summarize, verification_path
+from pixel_backup.wireless import connect_wireless, is_wireless_serial, pair_wireless
+
+# How often worker-thread UI updates are applied, and progress is redrawn
+UI_QUEUE_INTERVAL_MS = 50
+PROGRESS_REFRESH_MS = 250
+
+# How often the preview takes in newly scanned files, and how many it hands over at once
+PREVIEW_POLL_MS = 100
+PREVIEW_BATCH = 2000
+# Thumbnail images kept in memory by a preview list
+PREVIEW_IMAGE_LIMIT = 500
+
+# History rows taken from the catalog per Tk event
+HISTORY_PAGE = 200
+
+# Colors for the engine's detail levels
+LEVEL_COLORS = {"ok": 'green', "warning": 'orange', "error": 'red'}
+
+
+class ProgressWindow:
+    """Backup progress dialog; all methods must be called on the Tk thread"""
+    
+    def __init__(self, app, status):
+        self.app = app
+        self.tracker = None
+        self.base = 0
+        self.span = 100
+        
+        self.window = tk.Toplevel(app.root)
+        self.window.title("Backup in Progress")
+        self.window.geometry("400x200")
+        self.window.protocol("WM_DELETE_WINDOW", lambda: None)  # Disable close button
+        
+        self.progress_label = ttk.Label(self.window, text=status)
+        self.progress_label.pack(pady=10)
+        
+        self.progress_var = tk.DoubleVar()
+        progress_bar = ttk.Progressbar(self.window, variable=self.progress_var, maximum=100)
+        progress_bar.pack(fill=tk.X, padx=20, pady=5)
+        
+        self.time_label = ttk.Label(self.window, text="Estimated time remaining: calculating...")
+        self.time_label.pack(pady=5)
+        
+        self.details_label = ttk.Label(self.window, text="")
+        self.details_label.pack(pady=5)
+        
+        button_frame = ttk.Frame(self.window)
+        button_frame.pack(pady=10)
+        
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", command=lambda: app.cancel_backup(self.window))
+        self.cancel_button.pack(side=tk.RIGHT, padx=10)
+        
+        self.refresh()
+    
+    def set_status(self, text):
+        self.progress_label.config(text=text)
+    
+    def set_details(self, text, color=None):
+        if color:
+            self.details_label.config(text=text, foreground=color)
+        else:
+            self.details_label.config(text=text)
+    
+    def set_progress(self, percent):
+        self.progress_var.set(percent)
+    
+    def track(self, tracker, base=0, span=100):
+        """Show tracker progress as the part of the bar from base to base + span"""
+        self.tracker = tracker
+        self.base = base
+        self.span = span
+    
+    def stop_tracking(self):
+        self.tracker = None
+        self.time_label.config(text="")
+    
+    def refresh(self):
+        """Redraw tracked progress at a fixed rate, however fast workers report"""
+        if not self.window.winfo_exists():
+            return
+        tracker = self.tracker
+        if tracker is not None and tracker.total_files:
+            rate = tracker.sample()
+            self.progress_var.set(self.base + self.span * tracker.fraction())
+            speed = f" ({format_size(rate)}/s)" if rate else ""
+            self.time_label.config(text=f"Estimated time remaining: {format_duration(tracker.eta())}{speed}")
+            self.details_label.config(text=f"Copied {tracker.done_files} of {tracker.total_files} files "
+                                           f"({format_size(tracker.done_bytes)} of "
+                                           f"{format_size(tracker.total_bytes)})")
+        self.window.after(PROGRESS_REFRESH_MS, self.refresh)
+    
+    def finish(self, status, details):
+        self.stop_tracking()
+        self.progress_var.set(100)
+        self.progress_label.config(text=status)
+        self.details_label.config(text=details)
+        self.cancel_button.config(text="Close", command=self.window.destroy)
+        self.window.protocol("WM_DELETE_WINDOW", self.window.destroy)  # Re-enable close button
+    
+    def close_later(self, delay_ms=2000):
+        self.window.after(delay_ms, self.window.destroy)
+
+
+class GuiListener(BackupListener):
+    """Forwards engine progress from the worker thread to a ProgressWindow"""
+    
+    def __init__(self, app, progress):
+        self.app = app
+        self.window = progress
+    
+    def status(self, text):
+        self.app.ui(self.window.set_status, text)
+    
+    def details(self, text, level=None):
+        self.app.ui(self.window.set_details, text, LEVEL_COLORS.get(level))
+    
+    def progress(self, percent):
+        self.app.ui(self.window.set_progress, percent)
+    
+    def track(self, tracker, base=0, span=100):
+        self.app.ui(self.window.track, tracker, base, span)
+    
+    def stop_tracking(self):
+        self.app.ui(self.window.stop_tracking)
+    
+    def confirm(self, question):
+        return self.app.ui_queue.call(messagebox.askyesno, "Error", question)
+
+
+class DeviceJobsWindow:
+    """Progress of a multi-device backup, one row per device; Tk thread only"""
+    
+    def __init__(self, app, scheduler):
+        self.app = app
+        self.scheduler = scheduler
+        
+        self.window = tk.Toplevel(app.root)
+        self.window.title("Backing Up All Devices")
+        self.window.geometry("650x300")
+        
+        columns = ("device", "model", "progress", "status")
+        self.tree = ttk.Treeview(self.window, columns=columns, show="headings")
+        self.tree.heading("device", text="Device")
+        self.tree.heading("model", text="Model")
+        self.tree.heading("progress", text="Progress")
+        self.tree.heading("status", text="Status")
+        self.tree.column("device", width=120)
+        self.tree.column("model", width=100)
+        self.tree.column("progress", width=70)
+        self.tree.column("status", width=340)
+        self.tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        button_frame = ttk.Frame(self.window)
+        button_frame.pack(fill=tk.X, pady=5)
+        self.cancel_button = ttk.Button(button_frame, text="Cancel All", command=scheduler.cancel_all)
+        self.cancel_button.pack(side=tk.RIGHT, padx=10)
+        
+        self.refresh()
+    
+    def refresh(self):
+        """Redraw every device's row at a fixed rate"""
+        if not self.window.winfo_exists():
+            return
+        jobs = self.scheduler.jobs()
+        for job in jobs:
+            status = job.details if job.state == "running" and job.details else job.status
+            values = (job.serial, job.model, f"{job.progress():.0f}%", status)
+            if self.tree.exists(job.serial):
+                self.tree.item(job.serial, values=values)
+            else:
+                self.tree.insert("", tk.END, iid=job.serial, values=values)
+        if jobs and not any(job.active for job in jobs):
+            self.cancel_button.config(text="Close", command=self.window.destroy)
+            return
+        self.window.after(PROGRESS_REFRESH_MS, self.refresh)
+
+
+class VirtualFileList:
+    """Treeview showing a window onto a PreviewModel; Tk thread only
+    
+    The tree only ever holds as many rows as fit on screen. Scrolling moves
+    the window over the model and rewrites those rows in place. With a
+    ThumbnailLoader, the rows on screen get their thumbnails in the tree column.
+    """
+    
+    COLUMNS = (("name", "File Name", 300), ("size", "Size", 90), ("date", "Modified Date", 150))
+    
+    def __init__(self, parent, model, thumbnail_loader=None):
+        self.model = model
+        self.thumbnail_loader = thumbnail_loader
+        self.offset = 0
+        self.visible = 20
+        self.items = []
+        self.item_keys = {}
+        self.images = {}
+        
+        self.frame = ttk.Frame(parent)
+        if thumbnail_loader:
+            style = "Thumbnail.Treeview"
+            ttk.Style().configure(style, rowheight=thumbnail_loader.size + 4)
+            self.tree = ttk.Treeview(self.frame, columns=[key for key, _, _ in self.COLUMNS], show="tree headings",
+                                     selectmode="browse", style=style)
+            self.tree.column("#0", width=thumbnail_loader.size + 24, stretch=False)
+        else:
+            style = "Treeview"
+            self.tree = ttk.Treeview(self.frame, columns=[key for key, _, _ in self.COLUMNS], show="headings",
+                                     selectmode="browse")
+        for key, title, width in self.COLUMNS:
+            self.tree.heading(key, text=title, command=lambda key=key: self.sort_by(key))
+            self.tree.column(key, width=width)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.row_height = int(ttk.Style().lookup(style, "rowheight") or 20)
+        self.tree.bind("<Configure>", self.on_resize)
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll(-1 if event.delta > 0 else 1, "units"))
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-1, "units"))
+        self.tree.bind("<Button-5>", lambda event: self.scroll(1, "units"))
+        self.tree.bind("<Prior>", lambda event: self.scroll(-1, "pages"))
+        self.tree.bind("<Next>", lambda event: self.scroll(1, "pages"))
+        self.tree.bind("<Home>", lambda event: self.scroll_to(0))
+        self.tree.bind("<End>", lambda event: self.scroll_to(len(self.model)))
+    
+    def on_resize(self, event):
+        # Leave room for the heading row
+        visible = max(1, event.height // self.row_height - 1)
+        if visible != self.visible:
+            self.visible = visible
+            self.redraw()
+    
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * len(self.model)))
+        else:
+            self.scroll(int(amount), unit)
+    
+    def scroll(self, amount, unit):
+        step = 3 if unit == "units" else self.visible
+        self.scroll_to(self.offset + amount * step)
+        return "break"
+    
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, len(self.model) - self.visible))
+        if offset != self.offset:
+            self.offset = offset
+            self.redraw()
+        return "break"
+    
+    def redraw(self):
+        """Rewrite the on-screen rows from the model"""
+        self.offset = max(0, min(self.offset, len(self.model) - self.visible))
+        rows = self.model.page(self.offset, self.visible)
+        for i, values in enumerate(rows):
+            if i < len(self.items):
+                self.tree.item(self.items[i], values=values)
+            else:
+                self.items.append(self.tree.insert("", tk.END, values=values))
+        if len(self.items) > len(rows):
+            self.tree.delete(*self.items[len(rows):])
+            del self.items[len(rows):]
+        if self.thumbnail_loader:
+            self.show_thumbnails()
+        
+        total = len(self.model)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + len(rows)) / total))
+        else:
+            self.scrollbar.set(0, 1)
+    
+    def show_thumbnails(self):
+        """Put thumbnails on the rows on screen; the loader fetches the missing ones"""
+        entries = [self.model.entry(self.offset + i) for i in range(len(self.items))]
+        found = self.thumbnail_loader.show(entries)
+        self.item_keys = {}
+        for item, entry in zip(self.items, entries):
+            key = ThumbnailCache.key(entry.path, entry.size, entry.mtime)
+            self.item_keys[item] = key
+            if key in found and key not in self.images:
+                self.add_image(key, found[key])
+            self.tree.item(item, image=self.images.get(key) or "")
+    
+    def set_thumbnail(self, key, data):
+        """A thumbnail finished loading; shows it if its row is still on screen"""
+        self.add_image(key, data)
+        for item, item_key in self.item_keys.items():
+            if item_key == key:
+                self.tree.item(item, image=self.images.get(key) or "")
+    
+    def add_image(self, key, data):
+        image = None
+        if data:
+            try:
+                image = tk.PhotoImage(data=base64.b64encode(data).decode("ascii"))
+            except tk.TclError:
+                pass
+        self.images[key] = image
+        # Forget the oldest images, keeping the ones on screen
+        if len(self.images) > PREVIEW_IMAGE_LIMIT:
+            visible = set(self.item_keys.values())
+            for old_key in list(self.images):
+                if len(self.images) <= PREVIEW_IMAGE_LIMIT // 2:
+                    break
+                if old_key not in visible:
+                    del self.images[old_key]
+    
+    def sort_by(self, key):
+        reverse = self.model.sort_key == key and not self.model.reverse
+        self.model.set_sort(key, reverse)
+        for column, title, _ in self.COLUMNS:
+            arrow = (" ▼" if reverse else " ▲") if column == key else ""
+            self.tree.heading(column, text=title + arrow)
+        self.offset = 0
+        self.redraw()
+
+
+class PreviewWindow:
+    """Lists the files a media backup would include while the device scan streams in"""
+    
+    def __init__(self, app, engine, media_type):
+        self.app = app
+        self.engine = engine
+        self.media_type = media_type
+        self.model = PreviewModel()
+        self.searching = ""
+        self.error = None
+        self.done = threading.Event()
+        self.closed = threading.Event()
+        
+        self.window = tk.Toplevel(app.root)
+        self.window.title(f"Preview {media_type} Files")
+        self.window.geometry("600x400")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        
+        # Filter bar
+        filter_frame = ttk.Frame(self.window)
+        filter_frame.pack(fill=tk.X, padx=5, pady=5)
+        self.name_filter = tk.StringVar()
+        self.min_size_filter = tk.StringVar()
+        self.after_filter = tk.StringVar()
+        ttk.Label(filter_frame, text="Name:").pack(side=tk.LEFT)
+        name_entry = ttk.Entry(filter_frame, textvariable=self.name_filter, width=16)
+        name_entry.pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Label(filter_frame, text="Min MB:").pack(side=tk.LEFT)
+        size_entry = ttk.Entry(filter_frame, textvariable=self.min_size_filter, width=6)
+        size_entry.pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Label(filter_frame, text="After (MM/DD/YYYY):").pack(side=tk.LEFT)
+        date_entry = ttk.Entry(filter_frame, textvariable=self.after_filter, width=10)
+        date_entry.pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(filter_frame, text="Filter", command=self.apply_filter).pack(side=tk.LEFT)
+        for entry in (name_entry, size_entry, date_entry):
+            entry.bind("<Return>", lambda event: self.apply_filter())
+        
+        # Status label
+        self.status_label = ttk.Label(self.window, text="Loading file list...")
+        self.status_label.pack(side=tk.BOTTOM, fill=tk.X)
+        
+        # Thumbnails need Pillow to render; without it the list shows names only
+        self.thumbnail_loader = None
+        if thumbnails_available():
+            self.thumbnail_loader = ThumbnailLoader(
+                engine.adb, engine.serial, app.thumbnail_cache,
+                on_ready=lambda key, data: app.ui(self.on_thumbnail, key, data))
+        
+        self.file_list = VirtualFileList(self.window, self.model, self.thumbnail_loader)
+        self.file_list.frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Load files in background; the Tk thread takes them in by polling
+        threading.Thread(target=self.load, daemon=True).start()
+        self.window.after(PREVIEW_POLL_MS, self.poll)
+    
+    def load(self):
+        """Worker thread: stream the scan into the model in batches, no widget calls"""
+        try:
+            batch = []
+            for entry in self.engine.scan_preview(self.media_type, on_path=self.set_searching):
+                if self.closed.is_set():
+                    break
+                batch.append(entry)
+                if len(batch) >= PREVIEW_BATCH:
+                    self.model.append(batch)
+                    batch = []
+            self.model.append(batch)
+        except Exception as e:
+            self.error = str(e)
+        self.done.set()
+    
+    def set_searching(self, path):
+        self.searching = path
+    
+    def poll(self):
+        if self.closed.is_set():
+            return
+        done = self.done.is_set()
+        if self.model.refresh(force=done):
+            self.file_list.redraw()
+        self.update_status(done)
+        if not done:
+            self.window.after(PREVIEW_POLL_MS, self.poll)
+    
+    def update_status(self, done):
+        model = self.model
+        if self.error:
+            self.status_label.config(text=f"Error: {self.error}", foreground='red')
+            return
+        shown = f"{len(model)} of {model.loaded}" if model.filtering() else f"{model.loaded}"
+        if done:
+            self.status_label.config(text=f"Found {shown} matching files ({format_size(model.total_size)})")
+        else:
+            self.status_label.config(text=f"Searching {self.searching}... found {shown} files")
+    
+    def apply_filter(self):
+        try:
+            min_size = float(self.min_size_filter.get()) * 1024 * 1024 if self.min_size_filter.get().strip() else None
+            after = self.after_filter.get().strip()
+            date_from = datetime.strptime(after, "%m/%d/%Y") if after else None
+        except ValueError:
+            self.status_label.config(text="Filter: enter a number of MB and a MM/DD/YYYY date", foreground='red')
+            return
+        self.status_label.config(foreground='')
+        self.model.set_filter(self.name_filter.get().strip(), min_size=min_size, date_from=date_from)
+        self.file_list.offset = 0
+        self.file_list.redraw()
+        self.update_status(self.done.is_set())
+    
+    def on_thumbnail(self, key, data):
+        if not self.closed.is_set():
+            self.file_list.set_thumbnail(key, data)
+    
+    def close(self):
+        # Stops the scan at its next file
+        self.closed.set()
+        if self.thumbnail_loader:
+            self.thumbnail_loader.close()
+        self.window.destroy()
+
+
+class BackupContentsWindow:
+    """Lists the files in one backup; selected files can be copied out of it"""
+    
+    def __init__(self, app, location):
+        self.app = app
+        self.location = location
+        self.reader = None
+        self.members = {}
+        self.pending = []
+        
+        self.window = tk.Toplevel(app.root)
+        self.window.title(f"Contents of {os.path.basename(location)}")
+        self.window.geometry("600x400")
+        
+        # Status and buttons
+        button_frame = ttk.Frame(self.window)
+        button_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=5)
+        self.status_label = ttk.Label(button_frame, text="Reading backup...")
+        self.status_label.pack(side=tk.LEFT)
+        ttk.Button(button_frame, text="Extract Selected...", command=self.extract_selected).pack(side=tk.RIGHT)
+        
+        columns = ("size", "modified")
+        self.tree = ttk.Treeview(self.window, columns=columns, selectmode="extended")
+        self.tree.heading("#0", text="File")
+        self.tree.heading("size", text="Size")
+        self.tree.heading("modified", text="Modified")
+        self.tree.column("#0", width=360)
+        self.tree.column("size", width=80)
+        self.tree.column("modified", width=120)
+        scrollbar = ttk.Scrollbar(self.window, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscroll=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        # Indexed archives list at once; ZIP archives and folders take a moment
+        threading.Thread(target=self.load, daemon=True).start()
+    
+    def load(self):
+        """Worker thread: read the member list, then hand it to the Tk thread"""
+        try:
+            self.reader = BackupReader(self.location)
+            members = self.reader.members()
+        except Exception as e:
+            self.app.ui(self.status_label.config, text=f"Error: {str(e)}", foreground='red')
+            return
+        self.app.ui(self.show, members)
+    
+    def show(self, members):
+        self.members = members
+        self.pending = list(members.items())
+        self.insert_page()
+    
+    def insert_page(self):
+        """Insert the next batch of rows, a batch per Tk event"""
+        if not self.window.winfo_exists():
+            return
+        batch, self.pending = self.pending[:PREVIEW_BATCH], self.pending[PREVIEW_BATCH:]
+        for member, (size, mtime) in batch:
+            self.tree.insert("", tk.END, iid=member, text=member, values=(
+                format_size(size), datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M")))
+        if self.pending:
+            self.window.after(1, self.insert_page)
+        else:
+            total = sum(size for size, _ in self.members.values())
+            self.status_label.config(text=f"{len(self.members)} files ({format_size(total)})")
+    
+    def extract_selected(self):
+        selected = self.tree.selection()
+        if not selected:
+            return
+        dest = filedialog.askdirectory(title="Extract files to", parent=self.window)
+        if not dest:
+            return
+        self.status_label.config(text=f"Extracting {len(selected)} files...")
+        
+        def extract():
+            try:
+                for member in selected:
+                    self.reader.extract(member, dest, self.members[member][1])
+            except Exception as e:
+                self.app.ui(messagebox.showerror, "Error", f"Failed to extract files: {str(e)}")
+                return
+            self.app.ui(self.status_label.config, text=f"Extracted {len(selected)} files to {dest}")
+        
+        threading.Thread(target=extract, daemon=True).start()
+
+
 class PixelBackupToolkit:
     def __init__(self, root):
         self.root = root
         self.root.title("Google Pixel Backup Toolkit")
         self.root.geometry("900x650")
+        # Backup history lives in the catalog; the tab holds the rows loaded so far
+        self.catalog = BackupCatalog()
+        self.history_loaded_id = 0
         self.setup_ui()
-        self.backup_history = []
         self.setup_styles()
         self.backup_process = None
-        self.backup_canceled = False
-        self.adb_path = self.find_adb()
+        self.engine = None
+        self.adb_path = find_adb()
+        self.adb = AdbClient(self.adb_path)
+        self.thumbnail_cache = ThumbnailCache()
+        threading.Thread(target=self.thumbnail_cache.load, daemon=True).start()
         
-        # Device connection status
+        # Widget updates requested by worker threads
+        self.ui_queue = UpdateQueue()
+        self.root.after(UI_QUEUE_INTERVAL_MS, self.process_ui_queue)
+        
+        # Device connection status, kept current by a background watcher
         self.connected_device = None
+        self.device_serial = None
+        self.device_watcher = DeviceWatcher(self.adb, on_change=lambda devices: self.ui(self.on_devices_changed))
+        self.device_watcher.start()
         self.check_device_connection()
+        self.update_history_view()
+    
+    def process_ui_queue(self):
+        """Apply widget updates posted by worker threads, at a bounded rate"""
+        self.ui_queue.drain()
+        self.root.after(UI_QUEUE_INTERVAL_MS, self.process_ui_queue)
     
-    def find_adb(self):
-        """Locate ADB executable in common locations"""
-        paths = [
-            os.path.join(os.environ.get("ANDROID_HOME", ""), "platform-tools", "adb"),
-            "/usr/bin/adb",
-            "/usr/local/bin/adb",
-            "adb"  # Try system path
-        ]
-        for path in paths:
-            if os.path.exists(path):
-                return path
-        return "adb"  # Fallback to hoping it's in PATH
+    def ui(self, func, *args, **kwargs):
+        """Run func on the Tk thread; safe to call from any thread"""
+        return self.ui_queue.post(func, *args, **kwargs)
     
     def setup_styles(self):
         style = ttk.Style()
@@ -114,7 +665,7 @@ class PixelBackupToolkit:
         self.call_logs_var = tk.BooleanVar(value=True)
         
         ttk.Checkbutton(options_frame, text="System Data", variable=self.system_data_var).pack(anchor=tk.W)
-        ttk.Checkbutton(options_frame, text="Apps", variable=self.apps_var).pack(anchor=tk.W)
+        ttk.Checkbutton(options_frame, text="Apps (APKs)", variable=self.apps_var).pack(anchor=tk.W)
         ttk.Checkbutton(options_frame, text="Contacts", variable=self.contacts_var).pack(anchor=tk.W)
         ttk.Checkbutton(options_frame, text="Messages", variable=self.messages_var).pack(anchor=tk.W)
         ttk.Checkbutton(options_frame, text="Call Logs", variable=self.call_logs_var).pack(anchor=tk.W)
@@ -154,7 +705,8 @@ class PixelBackupToolkit:
         ttk.Button(location_frame, text="Browse", command=self.browse_backup_location).pack(side=tk.RIGHT)
         
         # Start Button
-        ttk.Button(tab, text="Start Full Backup", command=self.start_full_backup).pack(pady=10)
+        ttk.Button(tab, text="Start Full Backup", command=self.start_full_backup).pack(pady=(10, 0))
+        ttk.Button(tab, text="Back Up All Connected Pixels", command=self.start_multi_device_backup).pack(pady=5)
     
     def setup_media_backup_tab(self):
         tab = ttk.Frame(self.notebook)
@@ -183,12 +735,12 @@ class PixelBackupToolkit:
         ttk.Label(date_frame, text="From:").pack(side=tk.LEFT, padx=5)
         self.date_from = ttk.Entry(date_frame, width=10)
         self.date_from.pack(side=tk.LEFT)
-        self.date_from.insert(0, "01/01/2023")
         
         ttk.Label(date_frame, text="To:").pack(side=tk.LEFT, padx=5)
         self.date_to = ttk.Entry(date_frame, width=10)
         self.date_to.pack(side=tk.LEFT)
-        self.date_to.insert(0, datetime.now().strftime("%m/%d/%Y"))
+        # Both empty: no date filter unless one is entered
+        ttk.Label(date_frame, text="MM/DD/YYYY, empty for any date").pack(side=tk.LEFT, padx=5)
         
         # Advanced Filters
         filter_frame = ttk.LabelFrame(tab, text="Advanced Filters")
@@ -200,7 +752,7 @@ class PixelBackupToolkit:
         self.uhd_videos_var = tk.BooleanVar()
         
         ttk.Checkbutton(filter_frame, text="Over 5MB files only", variable=self.large_files_var).pack(anchor=tk.W)
-        ttk.Checkbutton(filter_frame, text="Screenshots only", variable=self.screenshots_var).pack(anchor=tk.W)
+        ttk.Checkbutton(filter_frame, text="Skip screenshots", variable=self.screenshots_var).pack(anchor=tk.W)
         ttk.Checkbutton(filter_frame, text="RAW images only", variable=self.raw_images_var).pack(anchor=tk.W)
         ttk.Checkbutton(filter_frame, text="4K videos only", variable=self.uhd_videos_var).pack(anchor=tk.W)
         
@@ -218,6 +770,7 @@ class PixelBackupToolkit:
         
         ttk.Button(button_frame, text="Preview Selected Files", command=self.preview_files).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Start Media Backup", command=self.start_media_backup).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="Resume Interrupted", command=self.resume_media_backup).pack(side=tk.RIGHT, padx=5)
     
     def setup_settings_tab(self):
         tab = ttk.Frame(self.notebook)
@@ -230,11 +783,18 @@ class PixelBackupToolkit:
         self.verify_backup_var = tk.BooleanVar(value=True)
         self.compress_backup_var = tk.BooleanVar(value=True)
         self.compression_level = tk.StringVar(value="balanced")
+        self.archive_format = tk.StringVar(value="zip")
+        self.incremental_var = tk.BooleanVar(value=False)
+        self.dedup_backup_var = tk.BooleanVar(value=False)
         
         ttk.Checkbutton(general_frame, text="Verify backup integrity when complete", 
                        variable=self.verify_backup_var).pack(anchor=tk.W)
-        ttk.Checkbutton(general_frame, text="Compress backups (ZIP)", 
+        ttk.Checkbutton(general_frame, text="Compress backups", 
                        variable=self.compress_backup_var).pack(anchor=tk.W)
+        ttk.Checkbutton(general_frame, text="Incremental media backups (only new or changed files)", 
+                       variable=self.incremental_var).pack(anchor=tk.W)
+        ttk.Checkbutton(general_frame, text="Store full backups in a deduplicating repository", 
+                       variable=self.dedup_backup_var).pack(anchor=tk.W)
         
         level_frame = ttk.Frame(general_frame)
         level_frame.pack(fill=tk.X, pady=(0, 5))
@@ -242,6 +802,13 @@ class PixelBackupToolkit:
         ttk.Combobox(level_frame, textvariable=self.compression_level, 
                     values=["fast", "balanced", "maximum"], state="readonly").pack(side=tk.LEFT)
         
+        # Indexed archives list and extract single files instantly, and take appends
+        format_frame = ttk.Frame(general_frame)
+        format_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(format_frame, text="Archive Format:").pack(side=tk.LEFT)
+        ttk.Combobox(format_frame, textvariable=self.archive_format, 
+                    values=["zip", "indexed"], state="readonly").pack(side=tk.LEFT)
+        
         # Notification Settings
         notify_frame = ttk.LabelFrame(tab, text="Notifications")
         notify_frame.pack(fill=tk.X, padx=5, pady=5)
@@ -259,15 +826,76 @@ class PixelBackupToolkit:
         connection_frame.pack(fill=tk.X, padx=5, pady=5)
         
         self.default_connection = tk.StringVar(value="usb")
+        self.wifi_address = tk.StringVar(value="")
+        self.transfer_workers = tk.IntVar(value=4)
+        self.transfer_mode = tk.StringVar(value="pull")
+        self.host_transfer_limit = tk.IntVar(value=8)
+        self.adaptive_transfers_var = tk.BooleanVar(value=True)
+        self.bandwidth_limit = tk.DoubleVar(value=0)
         
         ttk.Label(connection_frame, text="Default connection:").pack(anchor=tk.W)
         ttk.Combobox(connection_frame, textvariable=self.default_connection, 
                      values=["usb", "wifi"], state="readonly").pack(fill=tk.X, pady=(0, 5))
         
+        wifi_frame = ttk.Frame(connection_frame)
+        wifi_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(wifi_frame, text="Wi-Fi address (host:port):").pack(side=tk.LEFT)
+        ttk.Entry(wifi_frame, textvariable=self.wifi_address, width=22).pack(side=tk.LEFT, padx=5)
+        ttk.Button(wifi_frame, text="Pair...", command=self.pair_phone).pack(side=tk.LEFT)
+        
         self.auto_detect_var = tk.BooleanVar(value=True)
         ttk.Checkbutton(connection_frame, text="Auto-detect Pixel devices", 
                        variable=self.auto_detect_var).pack(anchor=tk.W)
         
+        workers_frame = ttk.Frame(connection_frame)
+        workers_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(workers_frame, text="Parallel transfers:").pack(side=tk.LEFT)
+        ttk.Spinbox(workers_frame, from_=1, to=16, width=5, 
+                    textvariable=self.transfer_workers).pack(side=tk.LEFT)
+        ttk.Label(workers_frame, text="  Max for all devices:").pack(side=tk.LEFT)
+        ttk.Spinbox(workers_frame, from_=1, to=64, width=5, 
+                    textvariable=self.host_transfer_limit).pack(side=tk.LEFT)
+        ttk.Checkbutton(connection_frame, text="Adjust parallel transfers to the connection speed", 
+                       variable=self.adaptive_transfers_var).pack(anchor=tk.W)
+        
+        bandwidth_frame = ttk.Frame(connection_frame)
+        bandwidth_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(bandwidth_frame, text="Bandwidth cap (MB/s, 0 for none):").pack(side=tk.LEFT)
+        ttk.Spinbox(bandwidth_frame, from_=0, to=1000, increment=5, width=7, 
+                    textvariable=self.bandwidth_limit).pack(side=tk.LEFT)
+        
+        mode_frame = ttk.Frame(connection_frame)
+        mode_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(mode_frame, text="Transfer mode:").pack(side=tk.LEFT)
+        ttk.Radiobutton(mode_frame, text="Parallel adb pull", variable=self.transfer_mode, 
+                        value="pull").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(mode_frame, text="Tar stream (many small files)", variable=self.transfer_mode, 
+                        value="tar").pack(side=tk.LEFT, padx=5)
+        
+        # Storage Settings
+        storage_frame = ttk.LabelFrame(tab, text="Storage")
+        storage_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        self.storage = tk.StringVar(value="local")
+        self.s3_endpoint = tk.StringVar(value="")
+        self.s3_bucket = tk.StringVar(value="")
+        self.s3_prefix = tk.StringVar(value="pixel-backups")
+        self.s3_region = tk.StringVar(value="us-east-1")
+        
+        ttk.Radiobutton(storage_frame, text="Local folders", variable=self.storage, 
+                        value="local").pack(anchor=tk.W)
+        ttk.Radiobutton(storage_frame, text="S3-compatible bucket (uploaded while the backup runs)", 
+                        variable=self.storage, value="s3").pack(anchor=tk.W)
+        
+        for label, variable in (("Endpoint URL:", self.s3_endpoint), ("Bucket:", self.s3_bucket), 
+                                ("Key prefix:", self.s3_prefix), ("Region:", self.s3_region)):
+            row = ttk.Frame(storage_frame)
+            row.pack(fill=tk.X, pady=(0, 2))
+            ttk.Label(row, text=label, width=14).pack(side=tk.LEFT)
+            ttk.Entry(row, textvariable=variable).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Label(storage_frame, text="Credentials are read from AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY", 
+                  foreground="gray").pack(anchor=tk.W, pady=(0, 5))
+        
         # Save Buttons
         button_frame = ttk.Frame(tab)
         button_frame.pack(fill=tk.X, pady=10)
@@ -280,7 +908,7 @@ class PixelBackupToolkit:
         self.notebook.add(tab, text="Backup History")
         
         # Treeview for backup history
-        columns = ("date", "type", "size", "location")
+        columns = ("date", "type", "size", "location", "details", "device")
         self.history_tree = ttk.Treeview(tab, columns=columns, show="headings")
         
         # Define headings
@@ -288,12 +916,16 @@ class PixelBackupToolkit:
         self.history_tree.heading("type", text="Type")
         self.history_tree.heading("size", text="Size")
         self.history_tree.heading("location", text="Location")
+        self.history_tree.heading("details", text="Details")
+        self.history_tree.heading("device", text="Device")
         
         # Set column widths
         self.history_tree.column("date", width=120)
         self.history_tree.column("type", width=100)
         self.history_tree.column("size", width=80)
         self.history_tree.column("location", width=250)
+        self.history_tree.column("details", width=250)
+        self.history_tree.column("device", width=100)
         
         # Add scrollbar
         scrollbar = ttk.Scrollbar(tab, orient=tk.VERTICAL, command=self.history_tree.yview)
@@ -303,26 +935,68 @@ class PixelBackupToolkit:
         self.history_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
+        # File search across every catalogued backup
+        search_frame = ttk.Frame(tab)
+        search_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(search_frame, text="Find file:").pack(side=tk.LEFT, padx=5)
+        self.history_search = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.history_search, width=30)
+        search_entry.pack(side=tk.LEFT)
+        search_entry.bind("<Return>", lambda event: self.find_in_history())
+        ttk.Button(search_frame, text="Find", command=self.find_in_history).pack(side=tk.LEFT, padx=5)
+        self.history_status = ttk.Label(search_frame, text="")
+        self.history_status.pack(side=tk.LEFT, padx=5)
+        
         # Action buttons
         button_frame = ttk.Frame(tab)
         button_frame.pack(fill=tk.X, pady=5)
         
         ttk.Button(button_frame, text="Refresh", command=self.update_history_view).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Delete Selected", command=self.delete_selected_backup).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Browse Contents", command=self.browse_selected_backup).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Restore to Folder", command=self.restore_to_folder).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Restore to Device", command=self.restore_to_device).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Verify", command=self.verify_selected_backup).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Open Location", command=self.open_backup_location).pack(side=tk.RIGHT, padx=5)
     
     def update_history_view(self):
-        """Update the history treeview with current backup history"""
-        for item in self.history_tree.get_children():
-            self.history_tree.delete(item)
-        
-        for backup in self.backup_history:
-            self.history_tree.insert("", tk.END, values=(
-                backup.get("date", ""),
-                backup.get("type", ""),
-                backup.get("size", ""),
-                backup.get("location", "")
+        """Add the backups catalogued since the last update, a page per Tk event"""
+        if self.load_history_page():
+            self.root.after(1, self.update_history_view)
+    
+    def load_history_page(self):
+        """Insert the next page of catalogued backups; returns True if there may be more"""
+        backups = self.catalog.backups(after_id=self.history_loaded_id, limit=HISTORY_PAGE)
+        for backup in backups:
+            # The catalog id is the row id, so later updates only ever append
+            self.history_tree.insert("", tk.END, iid=str(backup["id"]), values=(
+                backup["date"],
+                backup["type"],
+                backup["size"],
+                backup["location"],
+                backup["details"],
+                backup["device"]
             ))
+            self.history_loaded_id = backup["id"]
+        return len(backups) == HISTORY_PAGE
+    
+    def find_in_history(self):
+        """Select the backups that contain a file with the name entered"""
+        name = self.history_search.get().strip()
+        if not name:
+            self.history_tree.selection_set(())
+            self.history_status.config(text="")
+            return
+        ids = []
+        for match in self.catalog.find(name):
+            iid = str(match["id"])
+            if iid not in ids and self.history_tree.exists(iid):
+                ids.append(iid)
+        self.history_tree.selection_set(ids)
+        if ids:
+            self.history_tree.see(ids[0])
+        self.history_status.config(text=f"{name} is in {len(ids)} backups")
     
     def delete_selected_backup(self):
         selected = self.history_tree.selection()
@@ -332,21 +1006,151 @@ class PixelBackupToolkit:
         item = self.history_tree.item(selected[0])
         location = item['values'][3]
         
+        if is_remote_location(location):
+            # Objects are removed with the store's own tools
+            if messagebox.askyesno("Confirm Delete", f"Remove {location} from the history? "
+                                                     "The objects stay in the bucket."):
+                self.catalog.remove_backup(int(selected[0]))
+                self.history_tree.delete(selected[0])
+            return
+        
         if messagebox.askyesno("Confirm Delete", f"Delete backup at {location}?"):
             try:
-                if os.path.isdir(location):
-                    import shutil
-                    shutil.rmtree(location)
-                elif os.path.isfile(location):
-                    os.remove(location)
+                store = ContentStore.for_snapshot(location)
+                if store:
+                    # Only chunks no other snapshot uses are freed
+                    store.delete_snapshot(location)
+                    backup_root = os.path.dirname(store.root)
+                else:
+                    backup_root = os.path.dirname(location.rstrip(os.sep))
+                    if is_indexed_archive(location):
+                        remove_archive(location)
+                    elif os.path.isdir(location):
+                        shutil.rmtree(location)
+                    elif os.path.isfile(location):
+                        os.remove(location)
+                if os.path.isfile(verification_path(location)):
+                    os.remove(verification_path(location))
+                # Files whose only copy was in this backup are pulled again next time
+                forget_backup(backup_root, location)
                 
                 # Remove from history
-                self.backup_history = [b for b in self.backup_history if b.get("location") != location]
-                self.update_history_view()
+                self.catalog.remove_backup(int(selected[0]))
+                self.history_tree.delete(selected[0])
                 messagebox.showinfo("Success", "Backup deleted successfully")
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to delete backup: {str(e)}")
     
+    def restore_to_folder(self):
+        """Copy the files of the selected backup into a folder on this computer"""
+        selected = self.history_tree.selection()
+        if not selected:
+            return
+        
+        item = self.history_tree.item(selected[0])
+        location = item['values'][3]
+        if is_remote_location(location):
+            messagebox.showerror("Error", f"{location} is in object storage; download it to restore from it")
+            return
+        dest = filedialog.askdirectory(title="Restore backup to")
+        if not dest:
+            return
+        
+        def restore():
+            try:
+                store = ContentStore.for_snapshot(location)
+                if store:
+                    store.restore(location, dest)
+                elif is_indexed_archive(location):
+                    with IndexedArchive(location) as archive:
+                        archive.extract_all(dest)
+                elif zipfile.is_zipfile(location):
+                    with zipfile.ZipFile(location) as zipf:
+                        zipf.extractall(dest)
+                else:
+                    shutil.copytree(location, os.path.join(dest, os.path.basename(location)), dirs_exist_ok=True)
+                self.ui(messagebox.showinfo, "Restore Complete", f"Backup restored to {dest}")
+            except Exception as e:
+                self.ui(messagebox.showerror, "Error", f"Failed to restore backup: {str(e)}")
+        
+        threading.Thread(target=restore, daemon=True).start()
+    
+    def browse_selected_backup(self):
+        """List the files in the selected backup"""
+        selected = self.history_tree.selection()
+        if not selected:
+            return
+        
+        item = self.history_tree.item(selected[0])
+        location = item['values'][3]
+        if is_remote_location(location):
+            messagebox.showerror("Error", f"{location} is in object storage; download it to browse it")
+            return
+        BackupContentsWindow(self, location)
+    
+    def restore_to_device(self):
+        """Push the selected backup back to the phone; files it already has are left alone"""
+        selected = self.history_tree.selection()
+        if not selected:
+            return
+        
+        item = self.history_tree.item(selected[0])
+        location = item['values'][3]
+        if not self.check_device_connection():
+            messagebox.showerror("Error", "No Pixel device connected")
+            return
+        if not messagebox.askyesno("Restore to Device", f"Restore {location} to {self.connected_device}?"):
+            return
+        
+        progress = ProgressWindow(self, "Restoring backup...")
+        self.engine = BackupEngine(BackupConfig(transfer_workers=self.transfer_workers.get()), self.adb,
+                                   self.device_serial, GuiListener(self, progress), catalog=self.catalog)
+        threading.Thread(target=self.run_restore, args=(self.engine, progress, location), daemon=True).start()
+    
+    def run_restore(self, engine, progress, location):
+        try:
+            stats = engine.restore_backup(location)
+        except Exception as e:
+            self.ui(progress.stop_tracking)
+            self.ui(progress.set_details, f"Error: {str(e)}", 'red')
+            self.ui(progress.close_later)
+            return
+        
+        if not engine.canceled:
+            self.ui(progress.finish, "Restore completed!", format_restore_stats(stats))
+    
+    def verify_selected_backup(self):
+        """Check the selected backup against the device it came from, or against earlier checks"""
+        selected = self.history_tree.selection()
+        if not selected:
+            return
+        
+        item = self.history_tree.item(selected[0])
+        location = item['values'][3]
+        serial, device_files, known_hashes = catalog_references(self.catalog, location)
+        # Without the original device, files are compared with their hashes from earlier checks
+        adb = self.adb if serial and serial == self.device_serial else None
+        self.history_status.config(text="Verifying backup...")
+        
+        def verify():
+            try:
+                results = BackupVerifier(location, adb, serial).verify(device_files if adb else None, known_hashes)
+            except Exception as e:
+                self.ui(self.history_status.config, text="")
+                self.ui(messagebox.showerror, "Error", f"Failed to verify backup: {str(e)}")
+                return
+            summary = summarize(results)
+            problems = [f"{result.status}: {result.member}" for result in results
+                        if result.status in (MISMATCH, UNREADABLE)]
+            message = "\n".join([summary] + problems[:10] + (["..."] if len(problems) > 10 else []))
+            self.ui(self.history_status.config, text=summary)
+            if problems:
+                self.ui(messagebox.showwarning, "Verification", message)
+            else:
+                self.ui(messagebox.showinfo, "Verification", message)
+        
+        threading.Thread(target=verify, daemon=True).start()
+    
     def open_backup_location(self):
         selected = self.history_tree.selection()
         if not selected:
@@ -355,7 +1159,12 @@ class PixelBackupToolkit:
         item = self.history_tree.item(selected[0])
         location = item['values'][3]
         
-        if os.path.exists(location):
+        if is_remote_location(location):
+            messagebox.showinfo("Backup Location", f"This backup is stored in object storage at\n{location}")
+        elif os.path.exists(location):
+            if is_indexed_archive(location):
+                # No program opens .pba files; show the folder holding it
+                location = os.path.dirname(location)
             if platform.system() == "Windows":
                 os.startfile(location)
             elif platform.system() == "Darwin":
@@ -376,575 +1185,233 @@ class PixelBackupToolkit:
             self.media_backup_location.set(folder)
     
     def connect_phone(self):
+        address = self.wifi_address.get().strip()
+        if self.default_connection.get() == "wifi" and address:
+            # adb connect can take a while; the device watcher reports the phone once it is attached
+            self.device_status.config(text=f"Connecting to {address}...", foreground='orange')
+            threading.Thread(target=self.connect_over_wifi, args=(address,), daemon=True).start()
+            return
         self.check_device_connection()
         if self.connected_device:
             messagebox.showinfo("Connected", f"Device connected: {self.connected_device}")
         else:
             messagebox.showerror("Error", "No Pixel device detected. Please connect your phone via USB and enable USB debugging.")
     
-    def check_device_connection(self):
+    def connect_over_wifi(self, address):
+        """Attach the phone over wireless debugging; runs on a worker thread"""
         try:
-            result = subprocess.run([self.adb_path, 'devices'], capture_output=True, text=True, timeout=5)
-            devices = [line.split('\t')[0] for line in result.stdout.split('\n')[1:] if line.strip()]
-            
-            if devices:
-                # Get device model
-                model_result = subprocess.run([self.adb_path, 'shell', 'getprop', 'ro.product.model'], 
-                                            capture_output=True, text=True, timeout=5)
-                model = model_result.stdout.strip()
-                
-                if "Pixel" in model:
-                    self.connected_device = model
-                    self.device_status.config(text=f"Connected: {model}", foreground='green')
-                    return True
-                else:
-                    self.connected_device = None
-                    self.device_status.config(text="Non-Pixel device connected", foreground='orange')
+            serial = connect_wireless(self.adb, address)
+        except (AdbError, OSError, subprocess.SubprocessError) as e:
+            self.ui(self.check_device_connection)
+            self.ui(messagebox.showerror, "Error", f"Could not connect to {address}: {e}\n\n"
+                    "Turn on Wireless debugging on the phone and pair this computer first.")
+            return
+        self.ui(messagebox.showinfo, "Connected", f"Connected over Wi-Fi to {serial}")
+    
+    def pair_phone(self):
+        """Pair with a phone's wireless debugging, using the code it shows under 'Pair device with pairing code'"""
+        address = simpledialog.askstring("Pair Device", "Pairing address (host:port) shown on the phone:",
+                                         parent=self.root)
+        if not address:
+            return
+        code = simpledialog.askstring("Pair Device", "Pairing code:", parent=self.root)
+        if not code:
+            return
+        
+        def pair():
+            try:
+                message = pair_wireless(self.adb, address, code)
+            except (AdbError, OSError, subprocess.SubprocessError) as e:
+                self.ui(messagebox.showerror, "Error", f"Pairing failed: {e}")
+                return
+            self.ui(messagebox.showinfo, "Paired", message)
+        
+        threading.Thread(target=pair, daemon=True).start()
+    
+    def check_device_connection(self):
+        """Update the connection status from the device watcher's table (no adb calls)"""
+        devices = [device for device in self.device_watcher.devices() if device.state == 'device']
+        
+        if devices:
+            # Prefer a Pixel if several devices are attached
+            pixels = [device for device in devices if "Pixel" in device.model]
+            # A phone attached both ways is used over the default connection
+            wifi = self.default_connection.get() == "wifi"
+            pixels.sort(key=lambda device: is_wireless_serial(device.serial) != wifi)
+            if pixels:
+                self.connected_device = pixels[0].model
+                self.device_serial = pixels[0].serial
+                self.device_status.config(text=f"Connected: {pixels[0].model}", foreground='green')
+                return True
             else:
                 self.connected_device = None
-                self.device_status.config(text="No device connected", foreground='red')
-        except subprocess.TimeoutExpired:
-            self.connected_device = None
-            self.device_status.config(text="ADB timeout", foreground='red')
-        except FileNotFoundError:
+                self.device_status.config(text="Non-Pixel device connected", foreground='orange')
+        elif self.device_watcher.error:
             self.connected_device = None
-            self.device_status.config(text="ADB not found", foreground='red')
-        except Exception as e:
+            self.device_status.config(text=self.device_watcher.error if self.device_watcher.error == "ADB not found" 
+                                      else f"Error: {self.device_watcher.error}", foreground='red')
+        else:
             self.connected_device = None
-            self.device_status.config(text=f"Error: {str(e)}", foreground='red')
+            self.device_status.config(text="No device connected", foreground='red')
         
         return False
     
-    def start_full_backup(self):
+    def on_devices_changed(self):
+        """Called on the Tk thread whenever a device connects, disconnects or changes state"""
+        serial = self.device_serial
+        connected = self.check_device_connection()
+        if serial and (not connected or self.device_serial != serial):
+            print(f"Device {serial} disconnected")
+    
+    def current_config(self):
+        """Snapshot the settings as a BackupConfig; call on the Tk thread"""
+        date_from = self.date_from.get().strip()
+        date_to = self.date_to.get().strip()
+        return BackupConfig(
+            system_data=self.system_data_var.get(),
+            apps=self.apps_var.get(),
+            contacts=self.contacts_var.get(),
+            messages=self.messages_var.get(),
+            call_logs=self.call_logs_var.get(),
+            photos=self.photos_var.get(),
+            videos=self.videos_var.get(),
+            documents=self.documents_var.get(),
+            music=self.music_var.get(),
+            downloads=self.downloads_var.get(),
+            other_media=self.other_media_var.get(),
+            date_from=datetime.strptime(date_from, "%m/%d/%Y") if date_from else None,
+            date_to=datetime.strptime(date_to, "%m/%d/%Y") if date_to else None,
+            large_files=self.large_files_var.get(),
+            screenshots=self.screenshots_var.get(),
+            raw_images=self.raw_images_var.get(),
+            uhd_videos=self.uhd_videos_var.get(),
+            backup_location=self.backup_location.get(),
+            media_backup_location=self.media_backup_location.get(),
+            verify=self.verify_backup_var.get(),
+            compress=self.compress_backup_var.get(),
+            compression_level=self.compression_level.get(),
+            archive_format=self.archive_format.get(),
+            incremental=self.incremental_var.get(),
+            dedup=self.dedup_backup_var.get(),
+            transfer_workers=self.transfer_workers.get(),
+            transfer_mode=self.transfer_mode.get(),
+            adaptive_transfers=self.adaptive_transfers_var.get(),
+            bandwidth_limit=self.bandwidth_limit.get(),
+            connection=self.default_connection.get(),
+            wifi_address=self.wifi_address.get().strip(),
+            storage=self.storage.get(),
+            s3_endpoint=self.s3_endpoint.get().strip(),
+            s3_bucket=self.s3_bucket.get().strip(),
+            s3_prefix=self.s3_prefix.get().strip(),
+            s3_region=self.s3_region.get().strip(),
+        )
+    
+    def start_backup(self, status, run):
+        """Open the progress window and run run(engine) on a worker thread"""
         if not self.check_device_connection():
             messagebox.showerror("Error", "No Pixel device connected")
             return
+        try:
+            config = self.current_config()
+        except ValueError:
+            messagebox.showerror("Error", "Dates must be entered as MM/DD/YYYY")
+            return
         
-        backup_folder = os.path.join(self.backup_location.get(), datetime.now().strftime("%Y%m%d_%H%M%S"))
-        os.makedirs(backup_folder, exist_ok=True)
+        # Widgets are created here on the Tk thread; the worker only posts updates
+        progress = ProgressWindow(self, status)
+        self.engine = BackupEngine(config, self.adb, self.device_serial, GuiListener(self, progress),
+                                   catalog=self.catalog)
         
         # Start backup in a separate thread
-        threading.Thread(target=self.perform_full_backup, args=(backup_folder,), daemon=True).start()
+        threading.Thread(target=self.run_backup, args=(self.engine, progress, run), daemon=True).start()
     
-    def perform_full_backup(self, backup_folder):
-        self.backup_canceled = False
-        
-        # Create progress window
-        progress_window = tk.Toplevel(self.root)
-        progress_window.title("Backup in Progress")
-        progress_window.geometry("400x200")
-        progress_window.protocol("WM_DELETE_WINDOW", lambda: None)  # Disable close button
-        
-        progress_label = ttk.Label(progress_window, text="Starting backup...")
-        progress_label.pack(pady=10)
-        
-        progress_var = tk.DoubleVar()
-        progress_bar = ttk.Progressbar(progress_window, variable=progress_var, maximum=100)
-        progress_bar.pack(fill=tk.X, padx=20, pady=5)
-        
-        time_label = ttk.Label(progress_window, text="Estimated time remaining: calculating...")
-        time_label.pack(pady=5)
-        
-        details_label = ttk.Label(progress_window, text="")
-        details_label.pack(pady=5)
+    def run_backup(self, engine, progress, run):
+        try:
+            record = run(engine)
+        except Exception as e:
+            self.ui(progress.stop_tracking)
+            self.ui(progress.set_details, f"Error: {str(e)}", 'red')
+            self.ui(progress.close_later)
+            return
         
-        button_frame = ttk.Frame(progress_window)
-        button_frame.pack(pady=10)
+        if record is None:
+            if not engine.canceled:
+                self.ui(progress.close_later)
+            return
         
-        cancel_button = ttk.Button(button_frame, text="Cancel", command=lambda: self.cancel_backup(progress_window))
-        cancel_button.pack(side=tk.RIGHT, padx=10)
-        
-        # Initialize backup steps
-        backup_steps = []
-        if self.system_data_var.get():
-            backup_steps.append(("System Data", self.backup_system_data))
-        if self.apps_var.get():
-            backup_steps.append(("Apps", self.backup_apps))
-        if self.contacts_var.get():
-            backup_steps.append(("Contacts", self.backup_contacts))
-        if self.messages_var.get():
-            backup_steps.append(("Messages", self.backup_messages))
-        if self.call_logs_var.get():
-            backup_steps.append(("Call Logs", self.backup_call_logs))
-        
-        # Media backups
-        media_backups = []
-        if self.photos_var.get():
-            media_backups.append(("DCIM/Camera", "Photos"))
-        if self.videos_var.get():
-            media_backups.append(("Movies", "Videos"))
-        if self.documents_var.get():
-            media_backups.append(("Documents", "Documents"))
-        if self.music_var.get():
-            media_backups.append(("Music", "Music"))
-        if self.downloads_var.get():
-            media_backups.append(("Download", "Downloads"))
-        if self.other_media_var.get():
-            media_backups.append(("Pictures", "Other Pictures"))
-            media_backups.append(("Podcasts", "Podcasts"))
-        
-        if media_backups:
-            backup_steps.append(("Media", lambda: self.backup_media(media_backups, backup_folder)))
-        
-        total_steps = len(backup_steps)
-        current_step = 0
-        
-        # Execute each backup step
-        for step_name, step_func in backup_steps:
-            if self.backup_canceled:
-                break
-                
-            current_step += 1
-            progress_label.config(text=f"Backing up {step_name} ({current_step}/{total_steps})")
-            progress_var.set((current_step - 1) * 100 / total_steps)
-            progress_window.update()
-            
-            try:
-                start_time = time.time()
-                details_label.config(text=f"Starting {step_name} backup...")
-                
-                # Execute the backup step
-                result = step_func(backup_folder)
-                
-                if not result:
-                    details_label.config(text=f"Failed to backup {step_name}", foreground='red')
-                    if messagebox.askyesno("Error", f"Failed to backup {step_name}. Continue?"):
-                        continue
-                    else:
-                        break
-                
-                elapsed = time.time() - start_time
-                details_label.config(text=f"{step_name} backup completed in {elapsed:.1f} seconds", foreground='green')
-                progress_var.set(current_step * 100 / total_steps)
-                
-            except Exception as e:
-                details_label.config(text=f"Error during {step_name} backup: {str(e)}", foreground='red')
-                if not messagebox.askyesno("Error", f"Error during {step_name} backup. Continue?"):
-                    break
+        # The engine recorded it in the catalog; show it in the history
+        self.ui(self.update_history_view)
+        self.ui(progress.finish, "Backup completed successfully!", f"Final backup size: {record['size']}")
         
-        # Finalize backup
-        if not self.backup_canceled:
-            if self.compress_backup_var.get():
-                progress_label.config(text="Compressing backup...")
-                details_label.config(text="Creating ZIP archive...")
-                progress_window.update()
-                
-                zip_path = f"{backup_folder}.zip"
-                try:
-                    with zipfile.ZipFile(zip_path, 'w', 
-                                       zipfile.ZIP_DEFLATED if self.compression_level.get() != "fast" else zipfile.ZIP_STORED) as zipf:
-                        for root, _, files in os.walk(backup_folder):
-                            for file in files:
-                                zipf.write(os.path.join(root, file), 
-                                          os.path.relpath(os.path.join(root, file), backup_folder))
-                    
-                    # Remove original folder if ZIP succeeded
-                    import shutil
-                    shutil.rmtree(backup_folder)
-                    backup_folder = zip_path
-                except Exception as e:
-                    details_label.config(text=f"Compression failed: {str(e)}", foreground='orange')
-            
-            # Calculate backup size
-            backup_size = self.get_folder_size(backup_folder)
-            size_str = self.format_size(backup_size)
-            
-            # Add to history
-            self.backup_history.append({
-                'date': datetime.now().strftime("%Y-%m-%d %H:%M"),
-                'type': 'Full',
-                'size': size_str,
-                'location': backup_folder
-            })
-            self.update_history_view()
-            
-            progress_label.config(text="Backup completed successfully!")
-            details_label.config(text=f"Final backup size: {size_str}")
-            cancel_button.config(text="Close")
-            
-            if self.notification_var.get():
-                self.root.after(100, lambda: messagebox.showinfo("Backup Complete", "Full backup completed successfully!"))
-        
-        progress_window.protocol("WM_DELETE_WINDOW", progress_window.destroy)  # Re-enable close button
+        if self.notification_var.get():
+            self.ui(messagebox.showinfo, "Backup Complete", f"{record['type']} backup completed successfully!")
     
-    def backup_system_data(self, backup_folder):
-        """Backup system data using ADB"""
-        try:
-            backup_file = os.path.join(backup_folder, "system_data.ab")
-            result = subprocess.run([self.adb_path, 'backup', '-f', backup_file, '-system'], 
-                                  capture_output=True, text=True, timeout=300)
-            return result.returncode == 0
-        except Exception as e:
-            print(f"System data backup error: {str(e)}")
-            return False
-    
-    def backup_apps(self, backup_folder):
-        """Backup all user apps using ADB"""
-        try:
-            # Get list of user apps
-            result = subprocess.run([self.adb_path, 'shell', 'pm', 'list', 'packages', '-3'], 
-                                  capture_output=True, text=True, timeout=60)
-            packages = [line.split(':')[1].strip() for line in result.stdout.splitlines() if line.startswith('package:')]
-            
-            if not packages:
-                return True  # No user apps to backup
-                
-            backup_file = os.path.join(backup_folder, "user_apps.ab")
-            result = subprocess.run([self.adb_path, 'backup', '-f', backup_file, '-apk', '-obb', '-shared', '-all'], 
-                                  input='\n'.join(packages), text=True, timeout=600)
-            return result.returncode == 0
-        except Exception as e:
-            print(f"Apps backup error: {str(e)}")
-            return False
+    def start_full_backup(self):
+        backup_folder = os.path.join(self.backup_location.get(), datetime.now().strftime("%Y%m%d_%H%M%S"))
+        self.start_backup("Starting backup...", lambda engine: engine.run_full_backup(backup_folder))
     
-    def backup_contacts(self, backup_folder):
-        """Backup contacts using ADB"""
-        try:
-            backup_file = os.path.join(backup_folder, "contacts.ab")
-            result = subprocess.run([self.adb_path, 'backup', '-f', backup_file, '-nosystem', 'com.android.providers.contacts'], 
-                                  capture_output=True, text=True, timeout=120)
-            return result.returncode == 0
-        except Exception as e:
-            print(f"Contacts backup error: {str(e)}")
-            return False
+    def start_media_backup(self):
+        media_type = self.media_type.get()
+        backup_folder = os.path.join(self.media_backup_location.get(), 
+                                    f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{media_type}")
+        self.start_backup(f"Starting {media_type} backup...",
+                          lambda engine: engine.run_media_backup(backup_folder, media_type))
     
-    def backup_messages(self, backup_folder):
-        """Backup SMS/MMS messages using ADB"""
-        try:
-            backup_file = os.path.join(backup_folder, "messages.ab")
-            result = subprocess.run([self.adb_path, 'backup', '-f', backup_file, '-nosystem', 'com.android.providers.telephony'], 
-                                  capture_output=True, text=True, timeout=120)
-            return result.returncode == 0
-        except Exception as e:
-            print(f"Messages backup error: {str(e)}")
-            return False
+    def resume_media_backup(self):
+        """Finish the latest interrupted media backup, skipping what already arrived"""
+        interrupted = find_interrupted(self.media_backup_location.get())
+        if not interrupted:
+            messagebox.showinfo("Resume Backup", "There is no interrupted media backup to resume")
+            return
+        backup_folder = interrupted[0]
+        if not messagebox.askyesno("Resume Backup", f"Resume the interrupted backup in {backup_folder}?"):
+            return
+        self.start_backup("Resuming media backup...", lambda engine: engine.resume_media_backup(backup_folder))
     
-    def backup_call_logs(self, backup_folder):
-        """Backup call logs using ADB"""
+    def start_multi_device_backup(self):
+        """Run a full backup on every connected Pixel at the same time"""
+        devices = [(device.serial, device.model) for device in self.device_watcher.devices()
+                   if device.state == 'device' and "Pixel" in device.model]
+        if not devices:
+            messagebox.showerror("Error", "No Pixel device connected")
+            return
         try:
-            backup_file = os.path.join(backup_folder, "call_logs.ab")
-            result = subprocess.run([self.adb_path, 'backup', '-f', backup_file, '-nosystem', 'com.android.providers.contacts'], 
-                                  capture_output=True, text=True, timeout=120)
-            return result.returncode == 0
-        except Exception as e:
-            print(f"Call logs backup error: {str(e)}")
-            return False
+            config = self.current_config()
+        except ValueError:
+            messagebox.showerror("Error", "Dates must be entered as MM/DD/YYYY")
+            return
+        
+        limits = HostLimits(transfers=self.host_transfer_limit.get(), bandwidth=config.bandwidth_limit)
+        scheduler = BackupScheduler(self.adb, config, limits,
+                                    on_update=lambda job: self.ui(self.on_job_update, job), catalog=self.catalog)
+        DeviceJobsWindow(self, scheduler)
+        scheduler.submit_all(devices)
     
-    def backup_media(self, media_paths, backup_folder):
-        """Backup media files from device"""
-        try:
-            media_folder = os.path.join(backup_folder, "Media")
-            os.makedirs(media_folder, exist_ok=True)
-            
-            for path, name in media_paths:
-                dest_folder = os.path.join(media_folder, name)
-                os.makedirs(dest_folder, exist_ok=True)
-                
-                # Use ADB pull to copy files
-                result = subprocess.run([self.adb_path, 'pull', f'/sdcard/{path}', dest_folder], 
-                                      capture_output=True, text=True, timeout=600)
-                if result.returncode != 0:
-                    print(f"Failed to backup {path}: {result.stderr}")
-            
-            return True
-        except Exception as e:
-            print(f"Media backup error: {str(e)}")
-            return False
+    def on_job_update(self, job):
+        """Add each device's finished backup to the history as its own entry"""
+        if not job.active and job.record:
+            self.update_history_view()
     
     def cancel_backup(self, window):
-        self.backup_canceled = True
+        if self.engine:
+            self.engine.cancel()
         window.destroy()
         messagebox.showinfo("Backup Canceled", "The backup process was canceled")
     
-    def get_folder_size(self, path):
-        """Calculate total size of a folder"""
-        total = 0
-        for entry in os.scandir(path):
-            if entry.is_file():
-                total += entry.stat().st_size
-            elif entry.is_dir():
-                total += self.get_folder_size(entry.path)
-        return total
-    
-    def format_size(self, size):
-        """Format size in bytes to human-readable format"""
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size < 1024.0:
-                return f"{size:.1f} {unit}"
-            size /= 1024.0
-        return f"{size:.1f} TB"
-    
-    def start_media_backup(self):
-        if not self.check_device_connection():
-            messagebox.showerror("Error", "No Pixel device connected")
-            return
-        
-        media_type = self.media_type.get()
-        backup_folder = os.path.join(self.media_backup_location.get(), 
-                                    f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{media_type}")
-        os.makedirs(backup_folder, exist_ok=True)
-        
-        # Start backup in a separate thread
-        threading.Thread(target=self.perform_media_backup_task, args=(backup_folder, media_type), daemon=True).start()
-    
-    def perform_media_backup_task(self, backup_folder, media_type):
-        self.backup_canceled = False
-        
-        # Create progress window
-        progress_window = tk.Toplevel(self.root)
-        progress_window.title("Backup in Progress")
-        progress_window.geometry("400x200")
-        progress_window.protocol("WM_DELETE_WINDOW", lambda: None)  # Disable close button
-        
-        progress_label = ttk.Label(progress_window, text=f"Starting {media_type} backup...")
-        progress_label.pack(pady=10)
-        
-        progress_var = tk.DoubleVar()
-        progress_bar = ttk.Progressbar(progress_window, variable=progress_var, maximum=100)
-        progress_bar.pack(fill=tk.X, padx=20, pady=5)
-        
-        time_label = ttk.Label(progress_window, text="Estimated time remaining: calculating...")
-        time_label.pack(pady=5)
-        
-        details_label = ttk.Label(progress_window, text="")
-        details_label.pack(pady=5)
-        
-        button_frame = ttk.Frame(progress_window)
-        button_frame.pack(pady=10)
-        
-        cancel_button = ttk.Button(button_frame, text="Cancel", command=lambda: self.cancel_backup(progress_window))
-        cancel_button.pack(side=tk.RIGHT, padx=10)
-        
-        # Determine media paths to backup
-        media_paths = []
-        if media_type == "photos":
-            media_paths.append(("DCIM/Camera", "Photos"))
-            if not self.screenshots_var.get():
-                media_paths.append(("Pictures/Screenshots", "Screenshots"))
-        elif media_type == "videos":
-            media_paths.append(("Movies", "Videos"))
-            media_paths.append(("DCIM/Camera", "Video Clips"))
-        elif media_type == "documents":
-            media_paths.append(("Documents", "Documents"))
-            media_paths.append(("Download", "Downloads"))
-        else:  # Custom
-            if self.photos_var.get():
-                media_paths.append(("DCIM/Camera", "Photos"))
-            if self.videos_var.get():
-                media_paths.append(("Movies", "Videos"))
-            if self.documents_var.get():
-                media_paths.append(("Documents", "Documents"))
-            if self.music_var.get():
-                media_paths.append(("Music", "Music"))
-            if self.downloads_var.get():
-                media_paths.append(("Download", "Downloads"))
-            if self.other_media_var.get():
-                media_paths.append(("Pictures", "Other Pictures"))
-        
-        try:
-            total_files = 0
-            copied_files = 0
-            
-            # First count all files to get total
-            details_label.config(text="Counting files...")
-            progress_window.update()
-            
-            for path, name in media_paths:
-                result = subprocess.run([self.adb_path, 'shell', 'find', f'/sdcard/{path}', '-type', 'f'], 
-                                      capture_output=True, text=True, timeout=60)
-                if result.returncode == 0:
-                    total_files += len(result.stdout.splitlines())
-            
-            if total_files == 0:
-                details_label.config(text="No files found to backup!", foreground='orange')
-                progress_window.after(2000, progress_window.destroy)
-                return
-                
-            # Now perform the actual backup
-            for path, name in media_paths:
-                if self.backup_canceled:
-                    break
-                    
-                dest_folder = os.path.join(backup_folder, name)
-                os.makedirs(dest_folder, exist_ok=True)
-                
-                details_label.config(text=f"Backing up {name}...")
-                progress_window.update()
-                
-                # Use ADB pull to copy files
-                process = subprocess.Popen([self.adb_path, 'pull', f'/sdcard/{path}', dest_folder], 
-                                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-                
-                # Monitor progress
-                while True:
-                    if self.backup_canceled:
-                        process.terminate()
-                        break
-                        
-                    # Count files in destination to estimate progress
-                    try:
-                        copied = sum([len(files) for _, _, files in os.walk(dest_folder)])
-                        progress = (copied / total_files) * 100 if total_files > 0 else 0
-                        progress_var.set(progress)
-                        details_label.config(text=f"Copied {copied} of {total_files} files")
-                        progress_window.update()
-                    except:
-                        pass
-                        
-                    # Check if process completed
-                    if process.poll() is not None:
-                        break
-                        
-                    time.sleep(1)
-                
-                if process.returncode != 0 and not self.backup_canceled:
-                    details_label.config(text=f"Error backing up {name}", foreground='red')
-                    if not messagebox.askyesno("Error", f"Error during {name} backup. Continue?"):
-                        break
-            
-            if not self.backup_canceled:
-                # Calculate backup size
-                backup_size = self.get_folder_size(backup_folder)
-                size_str = self.format_size(backup_size)
-                
-                # Add to history
-                self.backup_history.append({
-                    'date': datetime.now().strftime("%Y-%m-%d %H:%M"),
-                    'type': media_type.capitalize(),
-                    'size': size_str,
-                    'location': backup_folder
-                })
-                self.update_history_view()
-                
-                progress_label.config(text="Backup completed successfully!")
-                details_label.config(text=f"Final backup size: {size_str}")
-                cancel_button.config(text="Close")
-                
-                if self.notification_var.get():
-                    self.root.after(100, lambda: messagebox.showinfo("Backup Complete", 
-                        f"{media_type.capitalize()} backup completed successfully!"))
-            
-        except Exception as e:
-            details_label.config(text=f"Error: {str(e)}", foreground='red')
-            progress_window.after(2000, progress_window.destroy)
-        
-        progress_window.protocol("WM_DELETE_WINDOW", progress_window.destroy)  # Re-enable close button
-    
     def preview_files(self):
         media_type = self.media_type.get()
         
         if not self.check_device_connection():
             messagebox.showerror("Error", "No Pixel device connected")
             return
-        
-        # Create preview window
-        preview_window = tk.Toplevel(self.root)
-        preview_window.title(f"Preview {media_type} Files")
-        preview_window.geometry("600x400")
-        
-        # Treeview for file list
-        columns = ("name", "size", "date")
-        file_tree = ttk.Treeview(preview_window, columns=columns, show="headings")
-        
-        # Define headings
-        file_tree.heading("name", text="File Name")
-        file_tree.heading("size", text="Size")
-        file_tree.heading("date", text="Modified Date")
-        
-        # Add scrollbar
-        scrollbar = ttk.Scrollbar(preview_window, orient=tk.VERTICAL, command=file_tree.yview)
-        file_tree.configure(yscroll=scrollbar.set)
-        
-        # Pack widgets
-        file_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        # Status label
-        status_label = ttk.Label(preview_window, text="Loading file list...")
-        status_label.pack(fill=tk.X)
-        
-        # Load files in background
-        threading.Thread(target=self.load_file_preview, 
-                        args=(preview_window, file_tree, status_label, media_type), 
-                        daemon=True).start()
-    
-    def load_file_preview(self, window, tree, status_label, media_type):
         try:
-            # Determine paths to search based on media type
-            search_paths = []
-            if media_type == "photos":
-                search_paths.append("/sdcard/DCIM/Camera")
-                if not self.screenshots_var.get():
-                    search_paths.append("/sdcard/Pictures/Screenshots")
-            elif media_type == "videos":
-                search_paths.append("/sdcard/Movies")
-                search_paths.append("/sdcard/DCIM/Camera")
-            elif media_type == "documents":
-                search_paths.append("/sdcard/Documents")
-                search_paths.append("/sdcard/Download")
-            else:  # Custom
-                if self.photos_var.get():
-                    search_paths.append("/sdcard/DCIM/Camera")
-                if self.videos_var.get():
-                    search_paths.append("/sdcard/Movies")
-                if self.documents_var.get():
-                    search_paths.append("/sdcard/Documents")
-                if self.music_var.get():
-                    search_paths.append("/sdcard/Music")
-                if self.downloads_var.get():
-                    search_paths.append("/sdcard/Download")
-                if self.other_media_var.get():
-                    search_paths.append("/sdcard/Pictures")
-            
-            # Get file list from device
-            file_count = 0
-            for path in search_paths:
-                status_label.config(text=f"Searching {path}...")
-                window.update()
-                
-                # Use ADB to find files
-                find_cmd = ['find', path, '-type', 'f']
-                if self.large_files_var.get():
-                    find_cmd.extend(['-size', '+5M'])
-                if self.raw_images_var.get() and "DCIM" in path:
-                    find_cmd.extend(['-name', '*.dng'])
-                if self.uhd_videos_var.get() and ("Movies" in path or "DCIM" in path):
-                    find_cmd.extend(['-name', '*4k*'])
-                
-                result = subprocess.run([self.adb_path, 'shell'] + find_cmd, 
-                                      capture_output=True, text=True, timeout=60)
-                
-                if result.returncode == 0:
-                    files = result.stdout.splitlines()
-                    for file in files:
-                        # Get file details
-                        stat_cmd = ['stat', '-c', '%s %y', file]
-                        stat_result = subprocess.run([self.adb_path, 'shell'] + stat_cmd, 
-                                                  capture_output=True, text=True, timeout=10)
-                        
-                        if stat_result.returncode == 0:
-                            size, date = stat_result.stdout.strip().split(' ', 1)
-                            name = os.path.basename(file)
-                            
-                            # Check date range filter
-                            try:
-                                file_date = datetime.strptime(date.split('.')[0], "%Y-%m-%d %H:%M:%S")
-                                from_date = datetime.strptime(self.date_from.get(), "%m/%d/%Y")
-                                to_date = datetime.strptime(self.date_to.get(), "%m/%d/%Y")
-                                
-                                if from_date <= file_date <= to_date:
-                                    tree.insert("", tk.END, values=(name, self.format_size(int(size)), date))
-                                    file_count += 1
-                                    if file_count % 10 == 0:
-                                        status_label.config(text=f"Found {file_count} files...")
-                                        window.update()
-                            except:
-                                pass
-            
-            status_label.config(text=f"Found {file_count} matching files")
-            
-        except Exception as e:
-            status_label.config(text=f"Error: {str(e)}", foreground='red')
+            engine = BackupEngine(self.current_config(), self.adb, self.device_serial)
+        except ValueError:
+            messagebox.showerror("Error", "Dates must be entered as MM/DD/YYYY")
+            return
+        
+        # Rows are loaded in the background and shown a page at a time
+        PreviewWindow(self, engine, media_type)
     
     def save_settings(self):
         # In a real app, you would save these to a config file
@@ -954,9 +1421,23 @@ class PixelBackupToolkit:
         self.verify_backup_var.set(True)
         self.compress_backup_var.set(True)
         self.compression_level.set("balanced")
+        self.archive_format.set("zip")
+        self.incremental_var.set(False)
+        self.dedup_backup_var.set(False)
         self.sound_var.set(True)
         self.notification_var.set(True)
         self.default_connection.set("usb")
+        self.wifi_address.set("")
+        self.transfer_workers.set(4)
+        self.transfer_mode.set("pull")
+        self.host_transfer_limit.set(8)
+        self.adaptive_transfers_var.set(True)
+        self.bandwidth_limit.set(0)
+        self.storage.set("local")
+        self.s3_endpoint.set("")
+        self.s3_bucket.set("")
+        self.s3_prefix.set("pixel-backups")
+        self.s3_region.set("us-east-1")
         self.auto_detect_var.set(True)
         messagebox.showinfo("Defaults Restored", "All settings have been restored to defaults")
     